@@ -0,0 +1,174 @@
+import json
+import logging
+import httpx
+from typing import Dict, Optional
+from .cache import SingleFlight, build_cache_backend
+from .config import (
+    AMAP_API_KEY, AMAP_BASE_URL, AMAP_MAX_CONNECTIONS, AMAP_TIMEOUT, AMAP_ADCODE_TABLE_PATH,
+    AMAP_WEATHER_TTL_SECONDS, AMAP_WEATHER_CACHE_MAX_ENTRIES, AMAP_ADCODE_CACHE_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Shared AMap HTTP Client ---
+
+_http_client: httpx.AsyncClient | None = None
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=AMAP_BASE_URL,
+        limits=httpx.Limits(
+            max_connections=AMAP_MAX_CONNECTIONS,
+            max_keepalive_connections=AMAP_MAX_CONNECTIONS,
+        ),
+        timeout=AMAP_TIMEOUT,
+    )
+
+async def init_amap_client() -> None:
+    """Creates the pooled AMap client and preloads the adcode table. Called on startup."""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+    load_adcode_table(AMAP_ADCODE_TABLE_PATH)
+
+async def close_amap_client() -> None:
+    """Closes the pooled AMap client and the caches. Called on shutdown."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    _adcode_cache.close()
+    _weather_cache.close()
+
+def get_amap_client() -> httpx.AsyncClient:
+    """Returns the shared AMap client, creating it lazily outside the app lifespan."""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+    return _http_client
+
+# --- Caches ---
+# City adcodes never change: the bundled table is kept in memory and geocoded
+# ones are cached without expiry. Live weather is refreshed by AMap roughly
+# hourly; a short TTL is enough. Both caches go through the configured
+# CacheBackend, so workers can share them.
+
+_adcode_table: Dict[str, str] = {}
+_adcode_cache = build_cache_backend("amap_adcode", AMAP_ADCODE_CACHE_MAX_ENTRIES)
+_weather_cache = build_cache_backend("amap_weather", AMAP_WEATHER_CACHE_MAX_ENTRIES, AMAP_WEATHER_TTL_SECONDS)
+_adcode_flight = SingleFlight()
+_weather_flight = SingleFlight()
+
+def _normalize_city(city_name: str) -> str:
+    city_name = city_name.strip()
+    return city_name[:-1] if len(city_name) > 2 and city_name.endswith("市") else city_name
+
+def load_adcode_table(path: str) -> int:
+    """Preloads a {city name: adcode} JSON table, consulted before the adcode cache."""
+    if not path:
+        return 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"Adcode table not found at {path}; adcodes will be geocoded on demand.")
+        return 0
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load adcode table from {path}: {e}")
+        return 0
+    for city_name, adcode in table.items():
+        _adcode_table[_normalize_city(city_name)] = str(adcode)
+    logger.info(f"Preloaded {len(table)} city adcodes from {path}")
+    return len(table)
+
+def amap_cache_stats() -> Dict:
+    return {
+        "adcode_table": len(_adcode_table),
+        "adcodes": _adcode_cache.stats(),
+        "weather": _weather_cache.stats(),
+        "adcode_requests": _adcode_flight.stats(),
+        "weather_requests": _weather_flight.stats(),
+    }
+
+# --- AMap Lookups ---
+
+async def _fetch_adcode(city_name: str) -> Optional[str]:
+    try:
+        response = await get_amap_client().get(
+            "/v3/geocode/geo", params={"address": city_name, "key": AMAP_API_KEY}
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        if data and data["status"] == "1" and data["geocodes"]:
+            # For cities, adcode is usually in the first geocode result
+            adcode = data["geocodes"][0]["adcode"]
+            await _adcode_cache.set(city_name, adcode)
+            return adcode
+        else:
+            logger.warning(f"Could not get adcode for {city_name}: {data.get('info', 'Unknown error')}")
+            return None
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching adcode for {city_name}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while fetching adcode: {e}")
+        return None
+
+async def _get_adcode_from_city(city_name: str) -> str | None:
+    """Gets the adcode for a city, geocoding it through AMap only on the first lookup."""
+    city_key = _normalize_city(city_name)
+    adcode = _adcode_table.get(city_key) or await _adcode_cache.get(city_key)
+    if adcode:
+        return adcode
+    if not AMAP_API_KEY:
+        logger.warning("AMAP_API_KEY is not set. Cannot get adcode.")
+        return None
+    return await _adcode_flight.do(city_key, lambda: _fetch_adcode(city_key))
+
+async def _fetch_live_weather(adcode: str, city: str) -> dict:
+    try:
+        response = await get_amap_client().get(
+            "/v3/weather/weatherInfo",
+            params={"city": adcode, "key": AMAP_API_KEY, "extensions": "base"},
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        if data and data["status"] == "1" and data["lives"]:
+            live_weather = data["lives"][0]
+            weather = {
+                "description": live_weather["weather"],
+                "temp": float(live_weather["temperature"]),
+                "feels_like": float(live_weather["temperature"]), # AMap base weather doesn't have feels_like, use temp
+                "humidity": float(live_weather["humidity"]),
+                "wind_speed": live_weather["windpower"], # AMap returns windpower as string like "≤3"
+                "city_name": live_weather["city"]
+            }
+            await _weather_cache.set(adcode, weather)
+            return weather
+        else:
+            logger.warning(f"Could not get weather data for {city} (adcode: {adcode}): {data.get('info', 'Unknown error')}")
+            return {}
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching weather data for {city}: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while fetching weather data: {e}")
+        return {}
+
+async def get_weather_data(city: str) -> dict:
+    """Fetches current weather data for a city, served from a short-lived per-adcode cache."""
+    if not AMAP_API_KEY:
+        logger.warning("AMAP_API_KEY is not set. Skipping weather data fetching.")
+        return {}
+
+    adcode = await _get_adcode_from_city(city)
+    if not adcode:
+        return {}
+
+    weather = await _weather_cache.get(adcode)
+    if weather is None:
+        weather = await _weather_flight.do(adcode, lambda: _fetch_live_weather(adcode, city))
+    # Callers get their own copy so the cached entry cannot be mutated.
+    return dict(weather)
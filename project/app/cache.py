@@ -0,0 +1,328 @@
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .config import CACHE_BACKEND, CACHE_SHARED_PATH
+
+logger = logging.getLogger(__name__)
+
+# --- In-Memory Tier ---
+
+class TTLCache:
+    """In-memory LRU cache with a per-entry time-to-live."""
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple[Optional[float], Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.time() + ttl if ttl else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# --- Disk Tier ---
+
+class SQLiteCache:
+    """
+    Disk-backed JSON cache that survives restarts. Entries carry an expiry time and
+    the least recently used rows are evicted once `max_entries` is exceeded.
+
+    Several processes may open the same file (each with its own `table`); WAL
+    mode lets them read while one of them writes.
+
+    Methods are blocking; async callers should run them with asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: Optional[float] = None, table: str = "cache"):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table!r}")
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed ON {table}(accessed_at)")
+        self._conn.commit()
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """Returns (value, expires_at) for a live entry, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def get(self, key: str) -> Any:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        now = time.time()
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = now + ttl if ttl else None
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f" SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# --- Cache Backends ---
+# The LLM- and AMap-result caches talk to a CacheBackend instead of a concrete
+# cache, so that with several uvicorn workers they can share one store and each
+# worker profits from what the others already computed.
+
+class CacheBackend(ABC):
+    """Async key/value cache with per-entry TTL. A `ttl_seconds` of None uses the backend default."""
+    name = "base"
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        ...
+
+    def close(self) -> None:
+        pass
+
+class MemoryBackend(CacheBackend):
+    """Per-process TTLCache; every worker keeps its own copy."""
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.memory = TTLCache(max_entries, ttl_seconds)
+
+    async def get(self, key: str) -> Any:
+        return self.memory.get(key)
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        self.memory.delete(key)
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, **self.memory.stats()}
+
+class SharedSQLiteBackend(CacheBackend):
+    """
+    SQLite table shared by all worker processes on the host, fronted by a
+    per-process TTLCache so repeated hits stay in memory. Entries copied into
+    the front keep the expiry of the shared row. Values are stored as JSON;
+    `encode`/`decode` convert objects that are not JSON-serializable themselves
+    (the front keeps the decoded object). The shared tier is best effort: its
+    errors are logged and treated as misses.
+    """
+    name = "sqlite"
+
+    def __init__(
+        self, path: str, table: str, max_entries: int, ttl_seconds: Optional[float] = None,
+        local_max_entries: Optional[int] = None,
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda data: data,
+    ):
+        self.local = TTLCache(local_max_entries or max_entries, ttl_seconds)
+        self.shared = SQLiteCache(path, max_entries, ttl_seconds, table=table)
+        self.encode = encode
+        self.decode = decode
+
+    async def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            entry = await asyncio.to_thread(self.shared.get_entry, key)
+        except Exception as e:
+            logger.error(f"Shared cache read failed ({self.shared.table}): {e}")
+            return None
+        if entry is None:
+            return None
+        data, expires_at = entry
+        value = self.decode(data)
+        if expires_at is None:
+            self.local.set(key, value, 0)  # A zero TTL never expires.
+        elif expires_at > time.time():
+            self.local.set(key, value, expires_at - time.time())
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        self.local.set(key, value, ttl_seconds)
+        try:
+            await asyncio.to_thread(self.shared.set, key, self.encode(value), ttl_seconds)
+        except Exception as e:
+            logger.error(f"Shared cache write failed ({self.shared.table}): {e}")
+
+    async def delete(self, key: str) -> None:
+        self.local.delete(key)
+        await asyncio.to_thread(self.shared.delete, key)
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "local": self.local.stats(), "shared": self.shared.stats()}
+
+    def close(self) -> None:
+        self.shared.close()
+
+def build_cache_backend(
+    namespace: str, max_entries: int, ttl_seconds: Optional[float] = None,
+    shared_path: Optional[str] = None, shared_max_entries: Optional[int] = None,
+    encode: Callable[[Any], Any] = lambda value: value,
+    decode: Callable[[Any], Any] = lambda data: data,
+) -> CacheBackend:
+    """
+    Builds the backend for one cache from CACHE_BACKEND. `shared_path` forces a
+    shared SQLite tier at that path (e.g. PLAN_CACHE_DISK_PATH) whatever the
+    global setting; `max_entries` bounds the in-process tier.
+    """
+    if shared_path or CACHE_BACKEND == "sqlite":
+        return SharedSQLiteBackend(
+            shared_path or CACHE_SHARED_PATH, f"cache_{namespace}", shared_max_entries or max_entries,
+            ttl_seconds, local_max_entries=max_entries, encode=encode, decode=decode,
+        )
+    if CACHE_BACKEND != "memory":
+        logger.warning(f"Unknown CACHE_BACKEND '{CACHE_BACKEND}', using memory.")
+    return MemoryBackend(max_entries, ttl_seconds)
+
+
+# --- Request Coalescing ---
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one in-flight task. Callers
+    that arrive while the task is running await the same result; the task is
+    shielded so a cancelled caller does not cancel it for everyone else.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every waiter went away.
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
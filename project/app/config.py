@@ -0,0 +1,223 @@
+import os
+from dotenv import load_dotenv
+
+# --- Environment Loading ---
+load_dotenv()
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# --- API Keys and Endpoints ---
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
+MODEL = os.environ.get("MODEL")
+AMAP_API_KEY = os.environ.get("AMAP_API_KEY")
+
+# --- LLM Client Connection Pool ---
+# A single AsyncOpenAI client is shared by all requests in a worker; these bound
+# its underlying HTTP connection pool.
+LLM_MAX_CONNECTIONS = _env_int("LLM_MAX_CONNECTIONS", 200)
+LLM_MAX_KEEPALIVE_CONNECTIONS = _env_int("LLM_MAX_KEEPALIVE_CONNECTIONS", 50)
+LLM_KEEPALIVE_EXPIRY = _env_float("LLM_KEEPALIVE_EXPIRY", 30.0)
+LLM_CONNECT_TIMEOUT = _env_float("LLM_CONNECT_TIMEOUT", 10.0)
+LLM_REQUEST_TIMEOUT = _env_float("LLM_REQUEST_TIMEOUT", 180.0)
+# Retries are handled by the LLM scheduler (rate-limit aware), so the SDK's own
+# retries are off by default to avoid multiplying attempts.
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 0)
+
+# --- Multiple LLM Endpoints ---
+# JSON list of OpenAI-compatible endpoints, e.g.
+# [{"name": "a", "base_url": "https://...", "api_key": "...", "model": "..."}];
+# api_key and model default to OPENAI_API_KEY and MODEL. Empty: OPENAI_BASE_URL only.
+LLM_ENDPOINTS = os.environ.get("LLM_ENDPOINTS", "")
+# Endpoints are probed (GET /models) this often; after LLM_ENDPOINT_MAX_FAILURES
+# consecutive failed calls an endpoint is skipped until a probe succeeds.
+LLM_HEALTH_CHECK_INTERVAL = _env_float("LLM_HEALTH_CHECK_INTERVAL", 30.0)
+LLM_ENDPOINT_MAX_FAILURES = _env_int("LLM_ENDPOINT_MAX_FAILURES", 3)
+# With several healthy endpoints, a completion without a first token after the
+# LLM_HEDGE_PERCENTILE of recent times-to-first-token (for its model route) is
+# hedged on another endpoint; the first well-formed answer wins.
+LLM_HEDGE_ENABLED = _env_bool("LLM_HEDGE_ENABLED", True)
+LLM_HEDGE_PERCENTILE = _env_float("LLM_HEDGE_PERCENTILE", 95)
+LLM_HEDGE_MIN_DELAY = _env_float("LLM_HEDGE_MIN_DELAY", 0.5)
+# Delay used until an operation has LLM_HEDGE_MIN_SAMPLES observations.
+LLM_HEDGE_INITIAL_DELAY = _env_float("LLM_HEDGE_INITIAL_DELAY", 5.0)
+LLM_HEDGE_MIN_SAMPLES = _env_int("LLM_HEDGE_MIN_SAMPLES", 20)
+
+# --- Model Routes ---
+# JSON object mapping LLM operations (plan, plan_skeleton, plan_day, regenerate,
+# batch_regenerate, prefetch, weather, recalculate; "default" for all) to
+# {"model", "temperature", "max_tokens"}, with optional "overrides" by plan size,
+# e.g. {"plan": {"max_tokens": 8000, "overrides": [{"min_days": 5, "model": "gpt-4o"}]}}.
+# Unset settings fall back to the endpoint's model and temperature 0.8. See app/model_routes.py.
+LLM_MODEL_ROUTES = os.environ.get("LLM_MODEL_ROUTES", "")
+
+# --- Cache Backend ---
+# Backend of the LLM- and AMap-result caches. "memory": per worker process.
+# "sqlite": one SQLite file shared by all uvicorn workers on the host, fronted by
+# a small in-process cache, so workers do not each warm up separately.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_SHARED_PATH = os.environ.get("CACHE_SHARED_PATH", "./travel_cache.db")
+
+# --- Plan Result Cache ---
+PLAN_CACHE_ENABLED = _env_bool("PLAN_CACHE_ENABLED", True)
+PLAN_CACHE_MAX_ENTRIES = _env_int("PLAN_CACHE_MAX_ENTRIES", 512)
+PLAN_CACHE_TTL_SECONDS = _env_float("PLAN_CACHE_TTL_SECONDS", 6 * 3600)
+# Path of a SQLite tier for plans only; overrides CACHE_SHARED_PATH for the plan
+# cache and enables it even with CACHE_BACKEND=memory.
+PLAN_CACHE_DISK_PATH = os.environ.get("PLAN_CACHE_DISK_PATH", "")
+PLAN_CACHE_DISK_MAX_ENTRIES = _env_int("PLAN_CACHE_DISK_MAX_ENTRIES", 20000)
+
+# --- AMap (Gaode) Web Service ---
+AMAP_BASE_URL = os.environ.get("AMAP_BASE_URL", "https://restapi.amap.com")
+AMAP_MAX_CONNECTIONS = _env_int("AMAP_MAX_CONNECTIONS", 20)
+AMAP_TIMEOUT = _env_float("AMAP_TIMEOUT", 5.0)
+# JSON file mapping city names to adcodes, loaded at startup; defaults to the bundled table.
+AMAP_ADCODE_TABLE_PATH = os.environ.get(
+    "AMAP_ADCODE_TABLE_PATH", os.path.join(os.path.dirname(__file__), "data", "city_adcodes.json")
+)
+AMAP_WEATHER_TTL_SECONDS = _env_float("AMAP_WEATHER_TTL_SECONDS", 600)
+AMAP_WEATHER_CACHE_MAX_ENTRIES = _env_int("AMAP_WEATHER_CACHE_MAX_ENTRIES", 1024)
+# Geocoded adcodes of cities missing from the table; they never expire.
+AMAP_ADCODE_CACHE_MAX_ENTRIES = _env_int("AMAP_ADCODE_CACHE_MAX_ENTRIES", 4096)
+
+# --- Local Travel-Time Engine ---
+# Straight-line distances are scaled by a detour factor to approximate the road
+# network; legs up to TRAVEL_WALK_MAX_KM are walked, longer ones use the
+# TRAVEL_MOTORIZED_MODE profile ("taxi" or "transit").
+TRAVEL_DETOUR_FACTOR = _env_float("TRAVEL_DETOUR_FACTOR", 1.3)
+TRAVEL_WALK_MAX_KM = _env_float("TRAVEL_WALK_MAX_KM", 1.2)
+TRAVEL_MOTORIZED_MODE = os.environ.get("TRAVEL_MOTORIZED_MODE", "taxi")
+TRAVEL_WALK_SPEED_KMH = _env_float("TRAVEL_WALK_SPEED_KMH", 4.5)
+TRAVEL_TRANSIT_SPEED_KMH = _env_float("TRAVEL_TRANSIT_SPEED_KMH", 18.0)
+TRAVEL_TRANSIT_OVERHEAD_MIN = _env_float("TRAVEL_TRANSIT_OVERHEAD_MIN", 8.0)
+TRAVEL_TAXI_SPEED_KMH = _env_float("TRAVEL_TAXI_SPEED_KMH", 22.0)
+TRAVEL_TAXI_OVERHEAD_MIN = _env_float("TRAVEL_TAXI_OVERHEAD_MIN", 3.0)
+# Use the LLM instead of the local engine for /api/update-itinerary by default.
+TRAVEL_USE_LLM = _env_bool("TRAVEL_USE_LLM", False)
+
+# --- Route Optimization ---
+# Reorder each day's activities locally (nearest neighbour + 2-opt within opening
+# hours) after every generated plan; /api/optimize-route is available either way.
+ROUTE_OPTIMIZE_AFTER_PLAN = _env_bool("ROUTE_OPTIMIZE_AFTER_PLAN", False)
+# Activities of these categories keep their time slot (comma-separated).
+ROUTE_MEAL_CATEGORIES = {
+    c.strip() for c in os.environ.get("ROUTE_MEAL_CATEGORIES", "美食").split(",") if c.strip()
+}
+
+# --- POI Gazetteer ---
+# POIs from generated itineraries (and optional bulk imports) are kept in a
+# per-city grid index, used by /api/pois/nearby and to fill missing coordinates.
+GAZETTEER_ENABLED = _env_bool("GAZETTEER_ENABLED", True)
+# SQLite file that keeps the gazetteer across restarts; empty keeps it in memory.
+GAZETTEER_DB_PATH = os.environ.get("GAZETTEER_DB_PATH", "")
+# JSON array or JSON-lines file of POIs ({"city", "name", "lat", "lon", ...}) imported at startup.
+GAZETTEER_IMPORT_PATH = os.environ.get("GAZETTEER_IMPORT_PATH", "")
+GAZETTEER_CELL_KM = _env_float("GAZETTEER_CELL_KM", 1.0)
+# Same-name POIs closer than this are one POI; further apart they are separate (e.g. chain branches).
+GAZETTEER_DEDUPE_KM = _env_float("GAZETTEER_DEDUPE_KM", 0.5)
+# LLM coordinates further than this from an imported POI of the same name are replaced.
+GAZETTEER_MAX_DRIFT_KM = _env_float("GAZETTEER_MAX_DRIFT_KM", 3.0)
+
+# --- Itinerary Versions ---
+# Snapshots of returned itineraries, used to diff edits in /api/update-itinerary.
+ITINERARY_VERSION_MAX_ENTRIES = _env_int("ITINERARY_VERSION_MAX_ENTRIES", 5000)
+ITINERARY_VERSION_TTL_SECONDS = _env_float("ITINERARY_VERSION_TTL_SECONDS", 24 * 3600)
+
+# --- Plan Generation Mode ---
+# "single": one completion for the whole trip. "parallel": a short skeleton call
+# assigns areas and POIs to days, then every day is generated concurrently.
+PLAN_GENERATION_MODE = os.environ.get("PLAN_GENERATION_MODE", "single")
+PLAN_PARALLEL_CONCURRENCY = _env_int("PLAN_PARALLEL_CONCURRENCY", 4)
+PLAN_DAY_MAX_ATTEMPTS = _env_int("PLAN_DAY_MAX_ATTEMPTS", 3)
+# In single mode, keep the complete days of a truncated or interrupted completion
+# and generate only the missing days instead of failing the whole plan.
+PLAN_SALVAGE_ENABLED = _env_bool("PLAN_SALVAGE_ENABLED", True)
+
+# --- Plan Output Format ---
+# "xml": the original verbose <item> markup. "json": compact short-key JSON for
+# whole plans and per-day plans, about half the completion tokens. Streaming
+# (/api/plan/stream) always uses XML because it is parsed incrementally.
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "xml")
+# In JSON format, also request the provider's JSON mode (response_format=json_object).
+LLM_JSON_RESPONSE_FORMAT = _env_bool("LLM_JSON_RESPONSE_FORMAT", True)
+
+# --- Batch Activity Regeneration ---
+# Batches up to this size are answered by a single prompt; larger batches are
+# split into chunks that run concurrently.
+REGENERATE_BATCH_MAX_ITEMS = _env_int("REGENERATE_BATCH_MAX_ITEMS", 6)
+REGENERATE_BATCH_CONCURRENCY = _env_int("REGENERATE_BATCH_CONCURRENCY", 3)
+
+# --- Replacement Prefetch ---
+# After a plan is returned, pre-generate replacements for a few activities per
+# day at background scheduler priority, so /api/regenerate-activity can answer
+# from the pool without an LLM round trip.
+PREFETCH_ENABLED = _env_bool("PREFETCH_ENABLED", False)
+PREFETCH_ITEMS_PER_DAY = _env_int("PREFETCH_ITEMS_PER_DAY", 2)
+# Budget: prefetched activities per hour per worker, and plans prefetched at once.
+PREFETCH_MAX_ITEMS_PER_HOUR = _env_int("PREFETCH_MAX_ITEMS_PER_HOUR", 600)
+PREFETCH_MAX_INFLIGHT = _env_int("PREFETCH_MAX_INFLIGHT", 4)
+PREFETCH_TTL_SECONDS = _env_float("PREFETCH_TTL_SECONDS", 1800)
+PREFETCH_MAX_ENTRIES = _env_int("PREFETCH_MAX_ENTRIES", 5000)
+
+# --- Whole-Itinerary Weather Contingency ---
+# Outdoor activities per prompt; larger itineraries are split into chunks that
+# run with REGENERATE_BATCH_CONCURRENCY.
+WEATHER_CONTINGENCY_MAX_ITEMS = _env_int("WEATHER_CONTINGENCY_MAX_ITEMS", 20)
+
+# --- Plan Jobs ---
+# /api/plan/jobs runs plans in a background worker pool and returns a job id at
+# once, so no connection is held open through the LLM generation.
+PLAN_JOB_WORKERS = _env_int("PLAN_JOB_WORKERS", 4)
+# Submissions beyond this many queued jobs are rejected with 503.
+PLAN_JOB_QUEUE_MAX_DEPTH = _env_int("PLAN_JOB_QUEUE_MAX_DEPTH", 100)
+# Finished jobs (and their itineraries) are kept this long after finishing.
+PLAN_JOB_TTL_SECONDS = _env_float("PLAN_JOB_TTL_SECONDS", 3600)
+
+# --- Itinerary Storage ---
+# "sqlite" (default): one indexed SQLite database in WAL mode.
+# "file": one compact JSON file per itinerary, sharded into subdirectories.
+ITINERARY_STORE_BACKEND = os.environ.get("ITINERARY_STORE_BACKEND", "sqlite")
+ITINERARY_DB_PATH = os.environ.get("ITINERARY_DB_PATH", "./saved_itineraries.db")
+ITINERARY_STORAGE_PATH = os.environ.get("ITINERARY_STORAGE_PATH", "./saved_itineraries")
+
+# --- LLM Request Coalescing ---
+# Identical concurrent completions (same rendered prompt and model parameters)
+# share one upstream call.
+LLM_COALESCE_ENABLED = _env_bool("LLM_COALESCE_ENABLED", True)
+
+# --- LLM Call Scheduler ---
+# Global cap on concurrent upstream LLM calls per worker.
+LLM_MAX_CONCURRENCY = _env_int("LLM_MAX_CONCURRENCY", 64)
+# JSON object overriding per-operation limits, e.g. {"plan": 8, "regenerate": 32}.
+LLM_OPERATION_LIMITS = os.environ.get("LLM_OPERATION_LIMITS", "")
+# Calls waiting for a slot beyond this depth are rejected with 503.
+LLM_QUEUE_MAX_DEPTH = _env_int("LLM_QUEUE_MAX_DEPTH", 200)
+# Token bucket against the provider quota; 0 disables rate limiting.
+LLM_RATE_LIMIT_RPM = _env_float("LLM_RATE_LIMIT_RPM", 0)
+LLM_RATE_LIMIT_BURST = _env_int("LLM_RATE_LIMIT_BURST", 10)
+LLM_RETRY_MAX_ATTEMPTS = _env_int("LLM_RETRY_MAX_ATTEMPTS", 4)
+LLM_RETRY_BASE_DELAY = _env_float("LLM_RETRY_BASE_DELAY", 0.5)
+LLM_RETRY_MAX_DELAY = _env_float("LLM_RETRY_MAX_DELAY", 30.0)
+
+# --- Metrics ---
+# Stream every completion internally (with usage reporting) so time-to-first-token
+# can be measured. Disable for providers that reject `stream_options`.
+LLM_INTERNAL_STREAMING = _env_bool("LLM_INTERNAL_STREAMING", True)
+# Ask for usage on the client-facing plan stream (/api/plan/stream), so its tokens
+# and cost are metered. Disable for providers that reject `stream_options`.
+LLM_STREAM_USAGE = _env_bool("LLM_STREAM_USAGE", True)
+# JSON object of USD prices per 1M tokens, e.g.
+# {"gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10}}; cached_input is optional.
+LLM_PRICE_TABLE = os.environ.get("LLM_PRICE_TABLE", "")
@@ -0,0 +1,369 @@
+import json
+import math
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from .schemas import ItineraryResponse, ItineraryItem, DayPlan
+from .travel import haversine_km_batch, has_coordinates
+from .amap import _normalize_city
+from .metrics import POI_COORDINATES
+from .timing import stage
+from .config import (
+    GAZETTEER_ENABLED, GAZETTEER_DB_PATH, GAZETTEER_IMPORT_PATH, GAZETTEER_CELL_KM,
+    GAZETTEER_DEDUPE_KM, GAZETTEER_MAX_DRIFT_KM
+)
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = 111.195  # Length of one degree of latitude (and of longitude at the equator).
+
+# Placeholder the parsers use for fields the LLM left out.
+_MISSING = "N/A"
+# Records indexed per event-loop turn by ingest_imports.
+_IMPORT_CHUNK = 500
+
+# --- POI Records ---
+
+@dataclass
+class PoiRecord:
+    """A known POI. `source` is "llm" for POIs seen in generated itineraries, "import" for bulk imports."""
+    city: str
+    name: str
+    category: str
+    lat: float
+    lon: float
+    opening_hours: str = _MISSING
+    price: str = _MISSING
+    booking_info: str = _MISSING
+    source: str = "llm"
+    seen: int = 1
+    updated_at: float = 0.0
+
+def _normalize_name(name: str) -> str:
+    return "".join(name.split()).lower()
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    return haversine_km_batch([lat1], [lon1], [lat2], [lon2])[0]
+
+# --- Spatial Index ---
+
+class GridIndex:
+    """
+    Uniform lat/lon grid over the POIs of one city. Cells are `cell_km` tall;
+    radius queries scan only the cells overlapping the query's bounding box.
+    """
+
+    def __init__(self, cell_km: float):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self._cells: Dict[Tuple[int, int], List[PoiRecord]] = {}
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def add(self, record: PoiRecord) -> None:
+        self._cells.setdefault(self._cell(record.lat, record.lon), []).append(record)
+
+    def remove(self, record: PoiRecord) -> None:
+        cell = self._cells.get(self._cell(record.lat, record.lon), [])
+        if record in cell:
+            cell.remove(record)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[PoiRecord, float]]:
+        """Records within `radius_km` of (lat, lon) with their distance, nearest first."""
+        lat_cells = int(math.ceil(radius_km / KM_PER_DEGREE / self.cell_deg))
+        lon_km_per_degree = KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        lon_cells = int(math.ceil(radius_km / lon_km_per_degree / self.cell_deg))
+        row, col = self._cell(lat, lon)
+        candidates = [
+            record
+            for r in range(row - lat_cells, row + lat_cells + 1)
+            for c in range(col - lon_cells, col + lon_cells + 1)
+            for record in self._cells.get((r, c), ())
+        ]
+        if not candidates:
+            return []
+        distances = haversine_km_batch(
+            [lat] * len(candidates), [lon] * len(candidates),
+            [r.lat for r in candidates], [r.lon for r in candidates],
+        )
+        found = [(record, d) for record, d in zip(candidates, distances) if d <= radius_km]
+        found.sort(key=lambda pair: pair[1])
+        return found
+
+# --- Gazetteer ---
+
+class PoiGazetteer:
+    """
+    Local store of POIs collected from generated itineraries and bulk imports,
+    with a grid index per city. POIs with the same name within `dedupe_km` of
+    each other are merged; the same name further away (e.g. a chain's branches)
+    is kept as separate records. An optional SQLite file makes it survive restarts.
+
+    Lookups and ingestion work in memory on the event loop; only the SQLite
+    writes are blocking and are run in a worker thread by the async `ingest_*`
+    methods, on rows snapshotted before the hand-off.
+    """
+
+    def __init__(
+        self, cell_km: float, dedupe_km: float, max_drift_km: float, db_path: str = "", enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.cell_km = cell_km
+        self.dedupe_km = dedupe_km
+        self.max_drift_km = max_drift_km
+        self._grids: Dict[str, GridIndex] = {}
+        self._by_name: Dict[Tuple[str, str], List[PoiRecord]] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    # --- Persistence ---
+
+    def _open_db(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pois ("
+            " city TEXT NOT NULL, name TEXT NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL,"
+            " record TEXT NOT NULL, PRIMARY KEY (city, name, lat, lon))"
+        )
+        self._conn.commit()
+        rows = self._conn.execute("SELECT record FROM pois").fetchall()
+        for (payload,) in rows:
+            self._insert(PoiRecord(**json.loads(payload)))
+        logger.info(f"Loaded {len(rows)} POIs from {path}")
+
+    @staticmethod
+    def _rows(records: List[Tuple[Tuple[float, float], PoiRecord]]) -> List[tuple]:
+        """
+        Snapshots changed records as database rows. Called on the event loop, where
+        records are mutated, so a write in a worker thread never sees a half-merged record.
+        """
+        return [
+            (record.city, record.name, old_lat, old_lon, record.lat, record.lon,
+             json.dumps(asdict(record), ensure_ascii=False))
+            for (old_lat, old_lon), record in records
+        ]
+
+    def _write(self, rows: List[tuple]) -> None:
+        """Upserts rows from _rows, each replacing the row stored under the record's previous coordinates."""
+        if self._conn is None or not rows:
+            return
+        with self._lock:
+            for city, name, old_lat, old_lon, lat, lon, payload in rows:
+                self._conn.execute(
+                    "DELETE FROM pois WHERE city = ? AND name = ? AND lat = ? AND lon = ?",
+                    (city, name, old_lat, old_lon),
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pois (city, name, lat, lon, record) VALUES (?, ?, ?, ?, ?)",
+                    (city, name, lat, lon, payload),
+                )
+            self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+    # --- Ingestion ---
+
+    def _insert(self, record: PoiRecord) -> None:
+        self._grids.setdefault(record.city, GridIndex(self.cell_km)).add(record)
+        self._by_name.setdefault((record.city, _normalize_name(record.name)), []).append(record)
+
+    def _nearest_same_name(self, city: str, name: str, lat: float, lon: float) -> Optional[PoiRecord]:
+        records = self._by_name.get((city, _normalize_name(name)), [])
+        if not records:
+            return None
+        distances = [_distance_km(lat, lon, r.lat, r.lon) for r in records]
+        best = min(range(len(records)), key=distances.__getitem__)
+        return records[best] if distances[best] <= self.dedupe_km else None
+
+    def add(self, record: PoiRecord) -> Tuple[Tuple[float, float], PoiRecord]:
+        """
+        Adds or merges one record and returns the stored record with its previous
+        coordinates. Imported coordinates win over LLM ones; known fields are
+        never overwritten with "N/A".
+        """
+        record.city = _normalize_city(record.city)
+        record.updated_at = record.updated_at or time.time()
+        existing = self._nearest_same_name(record.city, record.name, record.lat, record.lon)
+        if existing is None:
+            self._insert(record)
+            return (record.lat, record.lon), record
+        previous = (existing.lat, existing.lon)
+        existing.seen += record.seen
+        existing.updated_at = record.updated_at
+        for field in ("category", "opening_hours", "price", "booking_info"):
+            value = getattr(record, field)
+            if value and value != _MISSING:
+                setattr(existing, field, value)
+        if record.source == "import" and existing.source != "import":
+            grid = self._grids[existing.city]
+            grid.remove(existing)
+            existing.lat, existing.lon, existing.source = record.lat, record.lon, "import"
+            grid.add(existing)
+        return previous, existing
+
+    def add_items(self, city: str, items: Iterable[ItineraryItem]) -> List[Tuple[Tuple[float, float], PoiRecord]]:
+        """Adds the POIs of itinerary items; items without coordinates are skipped."""
+        return [
+            self.add(PoiRecord(
+                city=city, name=item.poi_name, category=item.category, lat=item.lat, lon=item.lon,
+                opening_hours=item.opening_hours, price=item.price, booking_info=item.booking_info,
+            ))
+            for item in items if has_coordinates(item) and item.poi_name and item.poi_name != _MISSING
+        ]
+
+    async def ingest_items(self, city: str, items: Iterable[ItineraryItem]) -> None:
+        if not self.enabled:
+            return
+        changed = self.add_items(city, items)
+        if self._conn is not None and changed:
+            try:
+                await asyncio.to_thread(self._write, self._rows(changed))
+            except Exception as e:
+                # Persistence is best effort; a failed write must not fail the request.
+                logger.error(f"Failed to write POIs to gazetteer database: {e}")
+
+    async def ingest_itinerary(self, itinerary: ItineraryResponse) -> None:
+        await self.ingest_items(itinerary.city, (a for d in itinerary.itinerary for a in d.activities))
+
+    def _add_imports(self, records: Iterable[dict]) -> List[Tuple[Tuple[float, float], PoiRecord]]:
+        changed = []
+        for data in records:
+            data = {k: v for k, v in data.items() if k in PoiRecord.__dataclass_fields__}
+            data.setdefault("category", "景点")
+            data["source"] = "import"
+            changed.append(self.add(PoiRecord(**data)))
+        return changed
+
+    def import_records(self, records: Iterable[dict]) -> int:
+        """Bulk-imports POI dicts (city, name, lat, lon and optional fields). Blocking when persisted."""
+        changed = self._add_imports(records)
+        self._write(self._rows(changed))
+        return len(changed)
+
+    async def ingest_imports(self, records: Iterable[dict]) -> int:
+        """
+        Async variant of import_records for request handlers. Imports nothing when
+        disabled. Large imports are indexed in chunks, yielding to the event loop
+        between them, and each chunk is written in a worker thread.
+        """
+        if not self.enabled:
+            return 0
+        records, count = list(records), 0
+        for start in range(0, len(records), _IMPORT_CHUNK):
+            changed = self._add_imports(records[start:start + _IMPORT_CHUNK])
+            await asyncio.to_thread(self._write, self._rows(changed))
+            count += len(changed)
+        return count
+
+    def import_file(self, path: str) -> int:
+        """Imports a JSON array or JSON-lines file of POI dicts."""
+        with open(path, encoding="utf-8") as f:
+            text = f.read().strip()
+        if text.startswith("["):
+            records = json.loads(text)
+        else:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        count = self.import_records(records)
+        logger.info(f"Imported {count} POIs from {path}")
+        return count
+
+    # --- Queries ---
+
+    def nearby(
+        self, city: str, lat: float, lon: float, radius_km: float,
+        category: Optional[str] = None, limit: int = 20,
+    ) -> List[Tuple[PoiRecord, float]]:
+        """POIs of `city` within `radius_km` of (lat, lon), nearest first, optionally of one category."""
+        grid = self._grids.get(_normalize_city(city))
+        if grid is None:
+            return []
+        found = grid.within(lat, lon, radius_km)
+        if category:
+            found = [(record, d) for record, d in found if record.category == category]
+        return found[:limit]
+
+    def lookup(self, city: str, name: str) -> Optional[PoiRecord]:
+        """The best-known record for a POI name: imported first, then the most often seen."""
+        records = self._by_name.get((_normalize_city(city), _normalize_name(name)))
+        if not records:
+            return None
+        return max(records, key=lambda r: (r.source == "import", r.seen))
+
+    def check_item(self, city: str, item: ItineraryItem) -> ItineraryItem:
+        """
+        Fills (0.0, 0.0) coordinates of an item from a known POI of the same name,
+        and replaces coordinates more than `max_drift_km` away from an imported
+        POI of that name. Returns the item unchanged when nothing is known.
+        """
+        record = self.lookup(city, item.poi_name) if self.enabled else None
+        if record is None:
+            return item
+        if not has_coordinates(item):
+            POI_COORDINATES.inc(outcome="filled")
+        elif record.source == "import" and _distance_km(item.lat, item.lon, record.lat, record.lon) > self.max_drift_km:
+            POI_COORDINATES.inc(outcome="corrected")
+        else:
+            return item
+        return item.model_copy(update={"lat": record.lat, "lon": record.lon})
+
+    def check_day(self, city: str, day_plan: DayPlan) -> DayPlan:
+        activities = [self.check_item(city, item) for item in day_plan.activities]
+        if all(new is old for new, old in zip(activities, day_plan.activities)):
+            return day_plan
+        return day_plan.model_copy(update={"activities": activities})
+
+    def check_itinerary(self, itinerary: ItineraryResponse) -> ItineraryResponse:
+        days = [self.check_day(itinerary.city, day_plan) for day_plan in itinerary.itinerary]
+        if all(new is old for new, old in zip(days, itinerary.itinerary)):
+            return itinerary
+        return itinerary.model_copy(update={"itinerary": days})
+
+    # --- Request Hooks ---
+
+    async def observe_itinerary(self, itinerary: ItineraryResponse) -> ItineraryResponse:
+        """Checks the coordinates of a generated itinerary, then adds its POIs to the store."""
+        with stage("gazetteer"):
+            itinerary = self.check_itinerary(itinerary)
+            await self.ingest_itinerary(itinerary)
+        return itinerary
+
+    async def observe_item(self, city: str, item: ItineraryItem) -> ItineraryItem:
+        """Checks the coordinates of a generated activity, then adds its POI to the store."""
+        with stage("gazetteer"):
+            item = self.check_item(city, item)
+            await self.ingest_items(city, [item])
+        return item
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "cities": len(self._grids),
+            "pois": sum(len(records) for records in self._by_name.values()),
+            "imported": sum(r.source == "import" for records in self._by_name.values() for r in records),
+        }
+
+
+def _build_gazetteer() -> PoiGazetteer:
+    gazetteer = PoiGazetteer(
+        GAZETTEER_CELL_KM, GAZETTEER_DEDUPE_KM, GAZETTEER_MAX_DRIFT_KM,
+        GAZETTEER_DB_PATH if GAZETTEER_ENABLED else "", GAZETTEER_ENABLED,
+    )
+    if GAZETTEER_ENABLED and GAZETTEER_IMPORT_PATH:
+        try:
+            gazetteer.import_file(GAZETTEER_IMPORT_PATH)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Failed to import POIs from {GAZETTEER_IMPORT_PATH}: {e}")
+    return gazetteer
+
+poi_gazetteer = _build_gazetteer()
@@ -0,0 +1,245 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from .schemas import PlanRequest, ItineraryResponse, PlanJobStatus
+from .plan_cache import plan_cache_key
+from .scheduler import SchedulerOverloaded
+from .timing import start_request_timing
+from .metrics import PLAN_JOBS
+from .config import PLAN_GENERATION_MODE, PLAN_JOB_WORKERS, PLAN_JOB_QUEUE_MAX_DEPTH, PLAN_JOB_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# LLM metrics of job runs are labelled with this endpoint.
+JOB_ENDPOINT = "/api/plan/jobs"
+# Seconds between heartbeat events on a job subscription, to keep idle proxies from closing it.
+HEARTBEAT_SECONDS = 15.0
+
+class JobQueueFull(Exception):
+    """Raised when too many plan jobs are already queued; the endpoint answers 503."""
+
+PlanRunner = Callable[[PlanRequest, Optional[str]], Awaitable[ItineraryResponse]]
+# Turns a finished job's itinerary into a deduplicated submitter's own copy (fresh ids and version).
+PlanCopier = Callable[[PlanRequest, ItineraryResponse], ItineraryResponse]
+
+# --- Plan Jobs ---
+
+@dataclass
+class PlanJob:
+    id: str
+    key: str
+    seq: int
+    request: PlanRequest
+    mode: str
+    created_at: float = field(default_factory=time.time)
+    status: str = "queued"
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[ItineraryResponse] = None
+    # Replaced on every status change; subscribers wait on the current one.
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+    # A deduplicated submission follows the job that does the work (its leader)
+    # and gets its own copy of the leader's result.
+    leader: Optional["PlanJob"] = None
+    followers: List["PlanJob"] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+class PlanJobQueue:
+    """
+    Runs plan generation in a bounded pool of background workers. Submissions
+    return at once; identical requests (same plan cache key and mode) share the
+    work of the job already queued, running or finished, but each submitter gets
+    its own job id and its own copy of the result, so item ids and version ids
+    are never shared between clients. Finished jobs are forgotten `ttl_seconds`
+    after they finish. Failed jobs are not reused, so a resubmission retries.
+    """
+
+    def __init__(self, workers: int, max_depth: int, ttl_seconds: float):
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, PlanJob] = {}
+        self._by_key: Dict[str, str] = {}
+        self._seq = itertools.count(1)
+        self._last_started = 0  # seq of the job most recently taken by a worker (the queue is FIFO)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[PlanRunner] = None
+        self._copier: Optional[PlanCopier] = None
+        self.running = 0
+
+    def start(self, runner: PlanRunner, copier: PlanCopier) -> None:
+        """Starts the worker tasks. Called on startup."""
+        if self._tasks:
+            return
+        self._runner, self._copier = runner, copier
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancels the worker tasks. Called on shutdown; unfinished jobs are lost."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, request: PlanRequest, mode: Optional[str] = None) -> PlanJob:
+        """Returns the job for a request, queueing a new one unless an identical job exists."""
+        if self._queue is None:
+            raise RuntimeError("Plan job workers are not running.")
+        mode = mode or PLAN_GENERATION_MODE
+        key = f"{plan_cache_key(request)}:{mode}"
+        existing = self.get(self._by_key.get(key, ""))
+        if existing is not None and existing.status != "failed":
+            PLAN_JOBS.inc(outcome="deduplicated")
+            return self._follow(existing, request)
+        if self.queue_depth >= self.max_depth:
+            PLAN_JOBS.inc(outcome="rejected")
+            raise JobQueueFull(f"Plan job queue is full ({self.queue_depth} jobs waiting)")
+        self._expire()
+        job = PlanJob(id=uuid.uuid4().hex, key=key, seq=next(self._seq), request=request, mode=mode)
+        self._jobs[job.id] = job
+        self._by_key[key] = job.id
+        self._queue.put_nowait(job)
+        PLAN_JOBS.inc(outcome="submitted")
+        return job
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        """Returns a job, or None if unknown or expired."""
+        job = self._jobs.get(job_id)
+        if job is not None and self._expired(job, time.time()):
+            self._forget(job)
+            return None
+        return job
+
+    def status(self, job: PlanJob) -> PlanJobStatus:
+        return PlanJobStatus(
+            job_id=job.id, status=job.status, created_at=job.created_at, started_at=job.started_at,
+            finished_at=job.finished_at,
+            queue_position=job.seq - self._last_started - 1 if job.status == "queued" else None,
+            error=job.error, itinerary=job.result,
+        )
+
+    async def wait(self, job: PlanJob, timeout: float) -> None:
+        """Waits until the job changes status or `timeout` seconds pass."""
+        if job.finished or timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(job.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def events(self, job: PlanJob) -> AsyncIterator[str]:
+        """NDJSON events for a job: its status on every change (and as a heartbeat), ending once it finishes."""
+        while True:
+            status = self.status(job)
+            yield json.dumps(
+                {"event": "status", "data": status.model_dump(mode="json")}, ensure_ascii=False
+            ) + "\n"
+            if job.finished:
+                return
+            await self.wait(job, HEARTBEAT_SECONDS)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._tasks),
+            "queue_depth": self.queue_depth,
+            "running": self.running,
+            "jobs": len(self._jobs),
+        }
+
+    # --- Internals ---
+
+    def _follow(self, leader: PlanJob, request: PlanRequest) -> PlanJob:
+        """A submitter's own job for work that `leader` already does (or did)."""
+        job = PlanJob(
+            id=uuid.uuid4().hex, key=leader.key, seq=leader.seq, request=request, mode=leader.mode,
+            status=leader.status, started_at=leader.started_at, leader=leader,
+        )
+        self._jobs[job.id] = job
+        if leader.finished:
+            self._finish_follower(job)
+        else:
+            leader.followers.append(job)
+        return job
+
+    def _finish_follower(self, job: PlanJob) -> None:
+        leader = job.leader
+        job.status, job.error = leader.status, leader.error
+        if leader.status == "succeeded":
+            try:
+                job.result = self._copier(job.request, leader.result)
+            except Exception as e:
+                logger.error(f"Could not copy the result of plan job {leader.id} for job {job.id}: {e}", exc_info=True)
+                job.status, job.error = "failed", f"An unexpected error occurred: {e}"
+        job.finished_at = time.time()
+        job.leader = None  # Lets the leader be collected once it expires.
+        job.notify()
+
+    def _expired(self, job: PlanJob, now: float) -> bool:
+        return job.finished_at is not None and job.finished_at + self.ttl_seconds <= now
+
+    def _forget(self, job: PlanJob) -> None:
+        self._jobs.pop(job.id, None)
+        if self._by_key.get(job.key) == job.id:
+            del self._by_key[job.key]
+
+    def _expire(self) -> None:
+        now = time.time()
+        for job in [job for job in self._jobs.values() if self._expired(job, now)]:
+            self._forget(job)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self._last_started = job.seq
+            job.status, job.started_at = "running", time.time()
+            job.notify()
+            for follower in job.followers:
+                follower.status, follower.started_at = job.status, job.started_at
+                follower.notify()
+            self.running += 1
+            start_request_timing(JOB_ENDPOINT)
+            try:
+                job.result = await self._runner(job.request, job.mode)
+                job.status = "succeeded"
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "Job cancelled on shutdown"
+                raise
+            except SchedulerOverloaded as e:
+                logger.warning(f"Plan job {job.id} shed by the LLM scheduler: {e}")
+                job.status, job.error = "failed", str(e)
+            except ValueError as e:
+                logger.error(f"ValueError during plan job {job.id}: {e}")
+                job.status, job.error = "failed", f"LLM response parsing error: {e}"
+            except Exception as e:
+                logger.error(f"Unexpected error during plan job {job.id}: {e}", exc_info=True)
+                job.status, job.error = "failed", f"An unexpected error occurred: {e}"
+            finally:
+                self.running -= 1
+                job.finished_at = time.time()
+                PLAN_JOBS.inc(outcome=job.status)
+                job.notify()
+                for follower in job.followers:
+                    self._finish_follower(follower)
+                job.followers = []
+                self._queue.task_done()
+
+plan_jobs = PlanJobQueue(PLAN_JOB_WORKERS, PLAN_JOB_QUEUE_MAX_DEPTH, PLAN_JOB_TTL_SECONDS)
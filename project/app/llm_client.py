@@ -0,0 +1,238 @@
+import json
+import asyncio
+import logging
+import httpx
+from collections import defaultdict, deque
+from typing import Deque, Dict, Iterable, List, Optional
+from openai import AsyncOpenAI, OpenAIError
+from .config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, MODEL, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY, LLM_CONNECT_TIMEOUT, LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES,
+    LLM_ENDPOINTS, LLM_HEALTH_CHECK_INTERVAL, LLM_ENDPOINT_MAX_FAILURES, LLM_HEDGE_ENABLED,
+    LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_INITIAL_DELAY, LLM_HEDGE_MIN_SAMPLES
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Shared Async LLM Clients ---
+# One long-lived client per endpoint and worker process, so connections (and
+# their TLS sessions) are reused across requests instead of being rebuilt on
+# every call.
+
+def _build_client(base_url: Optional[str] = OPENAI_BASE_URL, api_key: Optional[str] = OPENAI_API_KEY) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        max_retries=LLM_MAX_RETRIES,
+    )
+
+# --- Endpoints ---
+
+# Weight of the newest observation in an endpoint's time-to-first-token average.
+_EWMA_ALPHA = 0.2
+# Recent times-to-first-token kept per model route for the hedge delay.
+_TTFT_WINDOW = 200
+
+class LLMEndpoint:
+    """One OpenAI-compatible endpoint with its client, health and latency estimate."""
+
+    def __init__(self, name: str, base_url: Optional[str], api_key: Optional[str], model: Optional[str]):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.client: Optional[AsyncOpenAI] = None
+        self.healthy = True
+        self.failures = 0  # Consecutive failed calls.
+        self.inflight = 0
+        self.ttft_ewma: Optional[float] = None
+        self.calls = 0
+        self.errors = 0
+
+    def get_client(self) -> AsyncOpenAI:
+        if self.client is None:
+            self.client = _build_client(self.base_url, self.api_key)
+        return self.client
+
+    def score(self) -> float:
+        """Expected wait for a first token; endpoints without samples yet score 0 so they get tried."""
+        return (self.ttft_ewma or 0.0) * (1 + self.inflight)
+
+    def _update_ewma(self, seconds: float) -> None:
+        self.ttft_ewma = seconds if self.ttft_ewma is None else (
+            _EWMA_ALPHA * seconds + (1 - _EWMA_ALPHA) * self.ttft_ewma
+        )
+
+    def observe_ttft(self, seconds: float) -> None:
+        self.calls += 1
+        self.failures = 0
+        self._update_ewma(seconds)
+
+    def observe_stall(self, seconds: float) -> None:
+        """A call cancelled before its first token: its time-to-first-token was at least `seconds`."""
+        if self.ttft_ewma is None or seconds > self.ttft_ewma:
+            self._update_ewma(seconds)
+
+    def observe_failure(self) -> None:
+        self.errors += 1
+        self.failures += 1
+        if self.healthy and self.failures >= LLM_ENDPOINT_MAX_FAILURES:
+            self.healthy = False
+            logger.warning(f"LLM endpoint '{self.name}' marked unhealthy after {self.failures} failed calls")
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "ttft_ewma_seconds": round(self.ttft_ewma, 4) if self.ttft_ewma is not None else None,
+            "calls": self.calls,
+            "errors": self.errors,
+        }
+
+def _percentile(values: Iterable[float], pct: float) -> float:
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+class LLMEndpointPool:
+    """
+    Chooses the endpoint for each completion: the healthy one with the lowest
+    expected time-to-first-token (weighted by calls in flight). Also tracks the
+    per-route time-to-first-token distribution that sets the hedge delay,
+    and probes endpoints in the background so unhealthy ones can come back.
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint]):
+        self.endpoints = endpoints
+        self._ttft: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_TTFT_WINDOW))
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def primary(self) -> LLMEndpoint:
+        return self.endpoints[0]
+
+    def choose(self, exclude: Iterable[LLMEndpoint] = ()) -> Optional[LLMEndpoint]:
+        """
+        Best endpoint not in `exclude`. If none is healthy, the first choice still
+        falls back to the best unhealthy endpoint; a hedge (with `exclude`) does not.
+        """
+        excluded = set(exclude)
+        candidates = [e for e in self.endpoints if e not in excluded]
+        healthy = [e for e in candidates if e.healthy]
+        pick_from = healthy or (candidates if not excluded else [])
+        return min(pick_from, key=LLMEndpoint.score) if pick_from else None
+
+    def can_hedge(self) -> bool:
+        return LLM_HEDGE_ENABLED and sum(e.healthy for e in self.endpoints) >= 2
+
+    def observe_ttft(self, endpoint: LLMEndpoint, route: str, seconds: float) -> None:
+        endpoint.observe_ttft(seconds)
+        self._ttft[route].append(seconds)
+
+    def hedge_delay(self, route: str) -> float:
+        """
+        Seconds to wait for a first token before hedging: a percentile of recent
+        ones for the model route (see app/model_routes.py).
+        """
+        samples = self._ttft.get(route)
+        if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_INITIAL_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, _percentile(samples, LLM_HEDGE_PERCENTILE))
+
+    # --- Health Checks ---
+
+    async def _probe(self, endpoint: LLMEndpoint) -> None:
+        try:
+            await asyncio.wait_for(endpoint.get_client().models.list(), LLM_CONNECT_TIMEOUT)
+        except Exception as e:
+            if endpoint.healthy:
+                logger.warning(f"LLM endpoint '{endpoint.name}' failed its health check: {e}")
+            endpoint.healthy = False
+            return
+        if not endpoint.healthy:
+            logger.info(f"LLM endpoint '{endpoint.name}' is healthy again")
+        endpoint.healthy, endpoint.failures = True, 0
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._probe(endpoint) for endpoint in self.endpoints))
+            await asyncio.sleep(LLM_HEALTH_CHECK_INTERVAL)
+
+    def start_health_checks(self) -> None:
+        # With a single endpoint there is nothing to choose between.
+        if len(self.endpoints) > 1 and LLM_HEALTH_CHECK_INTERVAL > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for endpoint in self.endpoints:
+            if endpoint.client is not None:
+                await endpoint.client.close()
+                endpoint.client = None
+
+    def stats(self) -> Dict:
+        return {
+            "hedging": self.can_hedge(),
+            "hedge_delay_seconds": {route: round(self.hedge_delay(route), 4) for route in self._ttft},
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+def _load_endpoints() -> List[LLMEndpoint]:
+    default = [LLMEndpoint("default", OPENAI_BASE_URL, OPENAI_API_KEY, MODEL)]
+    if not LLM_ENDPOINTS:
+        return default
+    try:
+        endpoints = [
+            LLMEndpoint(
+                str(entry.get("name") or f"endpoint-{i}"), entry["base_url"],
+                entry.get("api_key") or OPENAI_API_KEY, entry.get("model") or MODEL,
+            )
+            for i, entry in enumerate(json.loads(LLM_ENDPOINTS))
+        ]
+    except (ValueError, AttributeError, TypeError, KeyError) as e:
+        logger.error(f"Ignoring invalid LLM_ENDPOINTS: {e}")
+        return default
+    return endpoints or default
+
+llm_endpoints = LLMEndpointPool(_load_endpoints())
+
+async def init_llm_client() -> AsyncOpenAI | None:
+    """Creates the shared clients and starts health checks. Called once from the FastAPI lifespan on startup."""
+    for endpoint in llm_endpoints.endpoints:
+        try:
+            endpoint.get_client()
+        except OpenAIError as e:
+            # Keep the app bootable without credentials; calls will fail individually.
+            logger.warning(f"Could not initialize LLM client '{endpoint.name}' at startup: {e}")
+    llm_endpoints.start_health_checks()
+    logger.info(
+        f"Initialized {len(llm_endpoints.endpoints)} shared LLM client(s) (max_connections={LLM_MAX_CONNECTIONS}, "
+        f"max_keepalive={LLM_MAX_KEEPALIVE_CONNECTIONS})"
+    )
+    return llm_endpoints.primary.client
+
+async def close_llm_client() -> None:
+    """Closes the shared clients and their connection pools. Called on shutdown."""
+    await llm_endpoints.close()
+    logger.info("Closed shared LLM clients.")
+
+def get_llm_client() -> AsyncOpenAI:
+    """
+    Returns the client of the first configured endpoint, creating it lazily when
+    the app lifespan has not run (e.g. when service functions are used from scripts).
+    """
+    return llm_endpoints.primary.get_client()
@@ -1,52 +1,173 @@
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Body, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
+from starlette.routing import Match
 from .schemas import (
     PlanRequest, 
     ItineraryResponse, 
     RegenerateRequest, 
     ItineraryItem, 
     SaveResponse,
-    WeatherContingencyRequest
+    WeatherContingencyRequest,
+    BatchRegenerateRequest,
+    BatchRegenerateResponse,
+    SavedItinerarySummary,
+    PoiImport,
+    NearbyPoi,
+    ItineraryWeatherContingencyRequest,
+    WeatherContingencyBatchResponse,
+    PlanJobStatus
 )
 from .services import (
-    generate_plan_from_llm, 
-    parse_xml_to_json, 
+    plan_itinerary,
     regenerate_activity_from_llm,
+    regenerate_activities_batch_from_llm,
     parse_single_activity_xml,
-    save_itinerary_to_file,
-    recalculate_itinerary_travel_times,
+    save_itinerary_to_store,
+    recalculate_travel_times_with_llm,
     generate_weather_contingency_plan,
-    get_weather_data
+    generate_itinerary_weather_contingency,
+    get_weather_data,
+    llm_coalescing_stats
 )
+from .streaming import stream_plan_events
+from .llm_client import init_llm_client, close_llm_client, llm_endpoints
+from .model_routes import model_router
+from .plan_cache import plan_cache, with_fresh_ids
+from .amap import init_amap_client, close_amap_client, amap_cache_stats
+from .travel import recalculate_travel_times_locally
+from .route_optimizer import optimize_itinerary_routes
+from .versions import remember_version, get_version, diff_itinerary
+from .storage import get_itinerary_store, close_itinerary_store
+from .gazetteer import poi_gazetteer
+from .jobs import plan_jobs, PlanJob, JobQueueFull
+from .prefetch import replacement_prefetcher
+from .scheduler import llm_scheduler, SchedulerOverloaded
+from .timing import stage, start_request_timing, server_timing_header
+from .metrics import (
+    render_metrics, REQUEST_SECONDS, LLM_SCHEDULER_ACTIVE, LLM_SCHEDULER_QUEUE_DEPTH,
+    PLAN_JOB_QUEUE_DEPTH, PLAN_JOB_RUNNING
+)
+from .config import TRAVEL_USE_LLM, ROUTE_OPTIMIZE_AFTER_PLAN
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+import time
 import logging
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- Application Lifespan ---
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Creates shared clients on startup and releases their connections on shutdown."""
+    await init_llm_client()
+    await init_amap_client()
+    plan_jobs.start(_generate_plan, _copy_plan)
+    try:
+        yield
+    finally:
+        await plan_jobs.stop()
+        await replacement_prefetcher.stop()
+        await close_llm_client()
+        await close_amap_client()
+        await close_itinerary_store()
+        plan_cache.close()
+        poi_gazetteer.close()
+
 # --- FastAPI App Initialization ---
 app = FastAPI(
+    lifespan=lifespan,
     title="行程AIGC API",
     version="1.2",
     description="使用 LLM 生成、修改和保存旅行行程的 API。"
 )
 
+# --- Middleware ---
+
+def _route_path(request: Request) -> str:
+    """Route template of a request (e.g. /api/itineraries/{itinerary_id}), to keep metric labels bounded."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """Reports per-stage durations of each request in a Server-Timing header and in /metrics."""
+    endpoint = _route_path(request)
+    timings = start_request_timing(endpoint)
+    started = time.perf_counter()
+    response = await call_next(request)
+    timings["total"] = time.perf_counter() - started
+    REQUEST_SECONDS.observe(
+        timings["total"], endpoint=endpoint, method=request.method, status=response.status_code
+    )
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
 # --- API Endpoints ---
 
+def _overloaded(e: SchedulerOverloaded) -> HTTPException:
+    """Fast 503 for calls shed by the LLM scheduler."""
+    logger.warning(f"Shedding request: {e}")
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def _itinerary_response(itinerary: ItineraryResponse) -> Response:
+    """
+    Serializes an itinerary directly. The parsers already produced a checked
+    model, so this skips FastAPI's second validation against response_model
+    (which stays on the routes for the OpenAPI schema).
+    """
+    return Response(content=itinerary.model_dump_json(), media_type="application/json")
+
+async def _generate_plan(request: PlanRequest, mode: Optional[str] = None) -> ItineraryResponse:
+    """
+    Plan cache lookup, generation and post-processing shared by /api/plan and
+    plan jobs. Replacement prefetch for the returned itinerary starts here.
+    """
+    cached = await plan_cache.get(request)
+    if cached is not None:
+        logger.info(f"Serving itinerary for {request.city} from plan cache.")
+        versioned = remember_version(cached)
+        replacement_prefetcher.schedule(request, versioned)
+        return versioned
+
+    json_response = await poi_gazetteer.observe_itinerary(await plan_itinerary(request, mode))
+    logger.info("Successfully generated itinerary.")
+    if ROUTE_OPTIMIZE_AFTER_PLAN:
+        with stage("route"):
+            json_response, saved = optimize_itinerary_routes(json_response)
+        logger.info(f"Route optimization saved {sum(saved.values()):.2f} km")
+
+    await plan_cache.set(request, json_response)
+    versioned = remember_version(json_response)
+    replacement_prefetcher.schedule(request, versioned)
+    return versioned
+
+def _copy_plan(request: PlanRequest, itinerary: ItineraryResponse) -> ItineraryResponse:
+    """
+    A deduplicated plan job's own copy of a shared result, like a plan cache hit:
+    fresh ids, a new version, and replacements prefetched under its own ids.
+    """
+    versioned = remember_version(with_fresh_ids(itinerary))
+    replacement_prefetcher.schedule(request, versioned)
+    return versioned
+
 @app.post("/api/plan", response_model=ItineraryResponse)
-async def create_plan(request: PlanRequest):
-    """Receives travel preferences and returns a fully generated itinerary."""
+async def create_plan(request: PlanRequest, mode: Optional[Literal["single", "parallel"]] = None):
+    """
+    Receives travel preferences and returns a fully generated itinerary.
+    `mode` overrides PLAN_GENERATION_MODE: "single" writes the whole trip in one
+    completion, "parallel" writes a skeleton and then all days concurrently.
+    """
     logger.info(f"Received itinerary planning request for {request.city}")
     try:
-        logger.info("Generating itinerary plan from LLM...")
-        xml_response = await generate_plan_from_llm(request)
-        logger.info(f"Received LLM XML response snippet: {xml_response[:150]}...")
-
-        logger.info("Parsing XML to JSON...")
-        json_response = parse_xml_to_json(xml_response)
-        logger.info("Successfully parsed XML to JSON.")
-
-        return json_response
+        return _itinerary_response(await _generate_plan(request, mode))
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
     except ValueError as e:
         logger.error(f"ValueError during plan generation: {e}")
         raise HTTPException(status_code=500, detail=f"LLM response parsing error: {e}")
@@ -54,20 +175,117 @@ async def create_plan(request: PlanRequest):
         logger.error(f"Unexpected error during plan generation: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
+def _job_response(job: PlanJob, status_code: int = 200) -> Response:
+    return Response(
+        content=plan_jobs.status(job).model_dump_json(), media_type="application/json", status_code=status_code
+    )
+
+def _get_job(job_id: str) -> PlanJob:
+    job = plan_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Plan job not found or expired.")
+    return job
+
+@app.post("/api/plan/jobs", response_model=PlanJobStatus, status_code=202)
+async def submit_plan_job(request: PlanRequest, mode: Optional[Literal["single", "parallel"]] = None):
+    """
+    Queues plan generation in the background and returns its job id at once.
+    An identical request (same preferences and mode) returns the existing job.
+    Poll GET /api/plan/jobs/{job_id} or subscribe to .../events for the result.
+    """
+    logger.info(f"Received plan job for {request.city}")
+    try:
+        job = plan_jobs.submit(request, mode)
+    except JobQueueFull as e:
+        logger.warning(f"Rejecting plan job: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return _job_response(job, status_code=202)
+
+@app.get("/api/plan/jobs/{job_id}", response_model=PlanJobStatus)
+async def get_plan_job(job_id: str, wait: float = Query(0, ge=0, le=60, description="Seconds to wait for a status change")):
+    """Status of a plan job, with the itinerary once it has succeeded. `wait` turns this into a long poll."""
+    job = _get_job(job_id)
+    await plan_jobs.wait(job, wait)
+    return _job_response(job)
+
+@app.get("/api/plan/jobs/{job_id}/events")
+async def stream_plan_job(job_id: str):
+    """NDJSON "status" events on every status change of a job (with periodic heartbeats) until it finishes."""
+    return StreamingResponse(plan_jobs.events(_get_job(job_id)), media_type="application/x-ndjson")
+
+@app.post("/api/plan/stream")
+async def create_plan_stream(request: PlanRequest, mode: Optional[Literal["single", "parallel"]] = None):
+    """
+    Streams the itinerary as NDJSON: a "day" event (a DayPlan) as soon as each day
+    has been generated, followed by a final "summary" event. In parallel mode days
+    arrive in completion order rather than day order.
+    """
+    logger.info(f"Received streaming itinerary planning request for {request.city}")
+    return StreamingResponse(stream_plan_events(request, mode), media_type="application/x-ndjson")
+
+@app.get("/api/scheduler/stats")
+async def get_scheduler_stats():
+    """
+    Returns active calls, queue depth, shed and retry counters of the LLM scheduler,
+    the plan job queue, the health and latency of each LLM endpoint, and the
+    configured model routes.
+    """
+    return {
+        **llm_scheduler.stats(), "plan_jobs": plan_jobs.stats(), "llm_endpoints": llm_endpoints.stats(),
+        "model_routes": model_router.describe(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus-style metrics: stage latencies, LLM time-to-first-token, tokens and cost."""
+    stats = llm_scheduler.stats()
+    LLM_SCHEDULER_ACTIVE.set(stats["active"])
+    LLM_SCHEDULER_QUEUE_DEPTH.set(stats["queue_depth"])
+    PLAN_JOB_QUEUE_DEPTH.set(plan_jobs.queue_depth)
+    PLAN_JOB_RUNNING.set(plan_jobs.running)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """
+    Returns counters for the plan result cache, the AMap caches, LLM call
+    coalescing, the POI gazetteer and the replacement prefetch pool (hit rate,
+    spend and the part of it not served).
+    """
+    return {
+        "plan": plan_cache.stats(),
+        "amap": amap_cache_stats(),
+        "llm_coalescing": llm_coalescing_stats(),
+        "poi_gazetteer": poi_gazetteer.stats(),
+        "prefetch": replacement_prefetcher.stats(),
+    }
+
 @app.post("/api/regenerate-activity", response_model=ItineraryItem)
 async def regenerate_activity(request: RegenerateRequest):
-    """Receives context and an activity to replace, returns a new activity."""
+    """
+    Receives context and an activity to replace, returns a new activity. A
+    replacement prefetched after the plan was generated is served when it
+    still fits; otherwise the LLM is asked.
+    """
     logger.info(f"Received activity regeneration request for '{request.activity_to_replace.poi_name}'")
     try:
-        logger.info("Getting new activity suggestion from LLM...")
-        xml_response = await regenerate_activity_from_llm(request)
-        logger.info(f"Received LLM XML response: {xml_response}")
+        with stage("prefetch"):
+            new_activity = await replacement_prefetcher.take(request)
+        if new_activity is not None:
+            logger.info(f"Serving prefetched replacement: {new_activity.poi_name}")
+        else:
+            logger.info("Getting new activity suggestion from LLM...")
+            xml_response = await regenerate_activity_from_llm(request)
+            logger.debug(f"Received LLM XML response snippet: {xml_response[:150]}...")
 
-        logger.info("Parsing single activity XML...")
-        new_activity = parse_single_activity_xml(xml_response)
-        logger.info(f"Successfully parsed new activity: {new_activity.poi_name}")
+            logger.info("Parsing single activity XML...")
+            new_activity = parse_single_activity_xml(xml_response)
+            logger.info(f"Successfully parsed new activity: {new_activity.poi_name}")
+        new_activity = await poi_gazetteer.observe_item(request.city, new_activity)
 
         return new_activity
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
     except ValueError as e:
         logger.error(f"ValueError during activity regeneration: {e}")
         raise HTTPException(status_code=500, detail=f"LLM response parsing error: {e}")
@@ -75,12 +293,36 @@ async def regenerate_activity(request: RegenerateRequest):
         logger.error(f"Unexpected error during activity regeneration: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
+@app.post("/api/regenerate-activities", response_model=BatchRegenerateResponse)
+async def regenerate_activities(request: BatchRegenerateRequest):
+    """
+    Replaces several activities, across one or more days, in as few LLM calls as
+    possible. Returns the new activities keyed by the id of the activity they replace.
+    """
+    logger.info(f"Received batch regeneration request for {len(request.activity_ids)} activities")
+    try:
+        replacements = await regenerate_activities_batch_from_llm(request)
+        for activity_id, activity in replacements.items():
+            replacements[activity_id] = await poi_gazetteer.observe_item(request.city, activity)
+        logger.info(f"Successfully generated {len(replacements)} replacement activities.")
+        return BatchRegenerateResponse(replacements=replacements)
+    except LookupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        logger.error(f"ValueError during batch activity regeneration: {e}")
+        raise HTTPException(status_code=500, detail=f"LLM response parsing error: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error during batch activity regeneration: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
 @app.post("/api/save-itinerary", response_model=SaveResponse)
 async def save_itinerary(itinerary: ItineraryResponse = Body(...)):
-    """Receives a complete itinerary and saves it to a file."""
+    """Receives a complete itinerary and saves it to the itinerary store."""
     logger.info(f"Received request to save itinerary for {itinerary.city}")
     try:
-        save_result = save_itinerary_to_file(itinerary)
+        save_result = await save_itinerary_to_store(itinerary)
         if save_result.success:
             logger.info(f"Successfully saved itinerary with ID: {save_result.itinerary_id}")
             return save_result
@@ -91,29 +333,61 @@ async def save_itinerary(itinerary: ItineraryResponse = Body(...)):
         logger.error(f"Unexpected error during itinerary save: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected server error occurred: {e}")
 
+@app.get("/api/itineraries", response_model=List[SavedItinerarySummary])
+async def list_itineraries(
+    city: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    before: Optional[float] = Query(None, description="Only itineraries saved before this Unix timestamp"),
+):
+    """Lists saved itineraries, newest first, optionally filtered by city."""
+    try:
+        return await get_itinerary_store().list(city=city, limit=limit, before=before)
+    except Exception as e:
+        logger.error(f"Unexpected error while listing itineraries: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected server error occurred: {e}")
+
+@app.get("/api/itineraries/{itinerary_id}", response_model=ItineraryResponse)
+async def load_itinerary(itinerary_id: str):
+    """Loads a saved itinerary by id."""
+    try:
+        itinerary = await get_itinerary_store().load(itinerary_id)
+    except Exception as e:
+        logger.error(f"Unexpected error while loading itinerary {itinerary_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected server error occurred: {e}")
+    if itinerary is None:
+        raise HTTPException(status_code=404, detail=f"Itinerary {itinerary_id} not found")
+    return _itinerary_response(remember_version(itinerary))
+
 @app.post("/api/update-itinerary", response_model=ItineraryResponse)
-async def update_itinerary(request_plan: ItineraryResponse = Body(...)):
+async def update_itinerary(request_plan: ItineraryResponse = Body(...), use_llm: bool = TRAVEL_USE_LLM):
     """
-    Receives a potentially modified itinerary, recalculates travel times using LLM,
-    and returns the updated itinerary.
+    Receives a potentially modified itinerary, recalculates travel times and
+    returns the updated itinerary. If the itinerary carries a known version_id,
+    only legs whose endpoints changed since that version are recalculated.
+    Travel times are computed locally from item coordinates; pass use_llm=true
+    to have the LLM re-estimate them instead.
     """
     logger.info(f"Received itinerary update request for {request_plan.city}")
+    previous = get_version(request_plan.version_id)
+    changed = diff_itinerary(previous, request_plan) if previous is not None else None
+    if changed is not None:
+        logger.info(f"Legs changed since version {request_plan.version_id}: {changed}")
+    if not use_llm:
+        logger.info("Recalculating travel times locally...")
+        with stage("travel"):
+            return _itinerary_response(remember_version(recalculate_travel_times_locally(request_plan, changed)))
     try:
-        logger.info("Recalculating travel times for the itinerary using LLM...")
-        # The service function returns an XML string
-        updated_xml_response = await recalculate_itinerary_travel_times(request_plan)
-        logger.info(f"Received updated LLM XML response snippet: {updated_xml_response[:150]}...")
-
-        logger.info("Parsing updated XML to JSON...")
-        # Use the existing XML parsing function
-        json_response = parse_xml_to_json(updated_xml_response)
-        logger.info("Successfully parsed updated XML to JSON.")
+        logger.info("Recalculating travel times for the changed days using LLM...")
+        updated_plan = await recalculate_travel_times_with_llm(request_plan, changed)
+        logger.info("Successfully merged LLM travel times into itinerary.")
 
         # Optionally, one might want to save this updated itinerary here as well.
         # For now, just returning the updated version.
-        # save_itinerary_to_file(json_response) 
+        # await save_itinerary_to_store(updated_plan)
 
-        return json_response
+        return _itinerary_response(remember_version(updated_plan))
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
     except ValueError as e:
         logger.error(f"ValueError during itinerary update: {e}")
         raise HTTPException(status_code=500, detail=f"LLM response parsing error during update: {e}")
@@ -127,18 +401,96 @@ async def get_weather_contingency(request: WeatherContingencyRequest):
     logger.info(f"Received weather contingency request for '{request.activity_to_replace.poi_name}'")
     try:
         logger.info("Getting weather contingency suggestion from LLM...")
-        weather_data = await get_weather_data(request.city)
+        with stage("weather"):
+            weather_data = await get_weather_data(request.city)
         xml_response = await generate_weather_contingency_plan(request, weather_data)
-        logger.info(f"Received LLM XML response: {xml_response}")
+        logger.debug(f"Received LLM XML response snippet: {xml_response[:150]}...")
 
         logger.info("Parsing single activity XML for contingency plan...")
-        new_activity = parse_single_activity_xml(xml_response)
+        new_activity = await poi_gazetteer.observe_item(request.city, parse_single_activity_xml(xml_response))
         logger.info(f"Successfully parsed new contingency activity: {new_activity.poi_name}")
 
         return new_activity
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
     except ValueError as e:
         logger.error(f"ValueError during weather contingency generation: {e}")
         raise HTTPException(status_code=500, detail=f"LLM response parsing error: {e}")
     except Exception as e:
         logger.error(f"Unexpected error during weather contingency generation: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
+@app.post("/api/weather-contingency/itinerary", response_model=WeatherContingencyBatchResponse)
+async def get_itinerary_weather_contingency(request: ItineraryWeatherContingencyRequest):
+    """
+    Receives a full itinerary and returns indoor alternatives for all of its
+    outdoor activities, keyed by activity id. The weather is fetched once and
+    every alternative comes from one batched prompt.
+    """
+    logger.info(f"Received itinerary weather contingency request for {request.itinerary.city}")
+    try:
+        with stage("weather"):
+            weather_data = await get_weather_data(request.itinerary.city)
+        alternatives = await generate_itinerary_weather_contingency(request, weather_data)
+        for activity_id, activity in alternatives.items():
+            alternatives[activity_id] = await poi_gazetteer.observe_item(request.itinerary.city, activity)
+        logger.info(f"Successfully generated {len(alternatives)} indoor alternatives.")
+        return WeatherContingencyBatchResponse(
+            weather=weather_data.get("description") if weather_data else None, alternatives=alternatives
+        )
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        logger.error(f"ValueError during itinerary weather contingency generation: {e}")
+        raise HTTPException(status_code=500, detail=f"LLM response parsing error: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error during itinerary weather contingency generation: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
+@app.post("/api/optimize-route", response_model=ItineraryResponse)
+async def optimize_route(request_plan: ItineraryResponse = Body(...), days: Optional[List[int]] = Query(None)):
+    """
+    Reorders the activities of each day (or only `days`) to shorten the route,
+    locally and without an LLM call. Meals keep their time slots and activities
+    only move into slots within their opening hours; travel times are recomputed.
+    """
+    logger.info(f"Received route optimization request for {request_plan.city}")
+    try:
+        with stage("route"):
+            optimized, saved = optimize_itinerary_routes(request_plan, days)
+    except Exception as e:
+        logger.error(f"Unexpected error during route optimization: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+    logger.info(f"Route optimization saved km per day: {saved}")
+    return _itinerary_response(remember_version(optimized))
+
+@app.get("/api/pois/nearby", response_model=List[NearbyPoi])
+async def get_nearby_pois(
+    city: str,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(1.0, gt=0, le=50),
+    category: Optional[str] = Query(None, description="e.g. 美食 for restaurants"),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """Known POIs of a city within radius_km of a point (e.g. an itinerary item), nearest first."""
+    return [
+        NearbyPoi(
+            name=record.name, category=record.category, lat=record.lat, lon=record.lon,
+            distance_km=round(distance, 3), opening_hours=record.opening_hours, price=record.price,
+            booking_info=record.booking_info, source=record.source,
+        )
+        for record, distance in poi_gazetteer.nearby(city, lat, lon, radius_km, category, limit)
+    ]
+
+@app.post("/api/pois/import")
+async def import_pois(pois: List[PoiImport] = Body(...)):
+    """Bulk-imports known POIs; their coordinates take precedence over LLM ones."""
+    if not poi_gazetteer.enabled:
+        raise HTTPException(status_code=409, detail="The POI gazetteer is disabled (GAZETTEER_ENABLED=false).")
+    try:
+        count = await poi_gazetteer.ingest_imports(poi.model_dump() for poi in pois)
+    except Exception as e:
+        logger.error(f"Unexpected error during POI import: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected server error occurred: {e}")
+    return {"imported": count}
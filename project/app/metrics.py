@@ -0,0 +1,272 @@
+import json
+import math
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .config import LLM_PRICE_TABLE
+
+logger = logging.getLogger(__name__)
+
+# --- Metric Types ---
+# A small in-process registry rendered in the Prometheus text exposition format
+# by GET /metrics. Metrics are per worker process.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def total(self, **labels: Any) -> float:
+        """Sum over all label sets that match the given labels."""
+        wanted = [(self.labelnames.index(name), str(value)) for name, value in labels.items()]
+        with self._lock:
+            return sum(v for k, v in self._values.items() if all(k[i] == value for i, value in wanted))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    """Point-in-time value per label set, set when sampled."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label set."""
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def render_metrics() -> str:
+    """Renders every registered metric in the Prometheus text format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+# --- Application Metrics ---
+
+REQUEST_SECONDS = Histogram(
+    "travel_http_request_duration_seconds", "HTTP request latency until the response starts.",
+    ["endpoint", "method", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "travel_stage_duration_seconds",
+    "Duration of one request stage (prompt, queue, llm, clean, parse, validate, weather, travel, persist).",
+    ["endpoint", "stage"],
+)
+LLM_CALL_SECONDS = Histogram(
+    "travel_llm_call_duration_seconds", "Total time of one upstream LLM completion.",
+    ["endpoint", "operation", "model", "route"],
+)
+LLM_TTFT_SECONDS = Histogram(
+    "travel_llm_time_to_first_token_seconds", "Time from sending a completion to its first content token.",
+    ["endpoint", "operation", "model", "route"],
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "travel_llm_queue_wait_seconds", "Time an LLM call waited for a scheduler slot.", ["operation"],
+)
+LLM_CALLS = Counter(
+    "travel_llm_calls_total", "Upstream LLM completions by outcome.",
+    ["endpoint", "operation", "model", "route", "outcome"],
+)
+LLM_TOKENS = Counter(
+    "travel_llm_tokens_total",
+    "Tokens reported in the completion usage field (kind: prompt, completion, cached_prompt).",
+    ["endpoint", "operation", "model", "route", "kind"],
+)
+LLM_COST_USD = Counter(
+    "travel_llm_cost_usd_total", "Estimated LLM spend from LLM_PRICE_TABLE.",
+    ["endpoint", "operation", "model", "route"],
+)
+PLAN_SALVAGE_DAYS = Counter(
+    "travel_plan_salvage_days_total",
+    "Days of truncated plan completions (kind: salvaged from the partial output, resumed by a per-day call).",
+    ["kind"],
+)
+POI_COORDINATES = Counter(
+    "travel_poi_coordinates_total",
+    "Activity coordinates taken from the POI gazetteer (outcome: filled missing, corrected drift).",
+    ["outcome"],
+)
+ROUTE_DISTANCE_SAVED_KM = Counter(
+    "travel_route_distance_saved_km_total", "Road-adjusted kilometres removed from daily routes by the local optimizer.",
+)
+LLM_UPSTREAM_CALLS = Counter(
+    "travel_llm_upstream_calls_total",
+    "Completions per configured LLM endpoint (outcome: ok, error, cancelled as a hedge loser).",
+    ["upstream", "outcome"],
+)
+LLM_HEDGES = Counter(
+    "travel_llm_hedges_total",
+    "Hedged completions (outcome: fired, skipped for lack of a scheduler slot, hedge_won, primary_won, failed).",
+    ["outcome"],
+)
+PREFETCH_ITEMS = Counter(
+    "travel_prefetch_items_total",
+    "Speculatively generated replacement activities (outcome: generated, hit, miss, stale, skipped for budget).",
+    ["outcome"],
+)
+PLAN_JOBS = Counter(
+    "travel_plan_jobs_total",
+    "Plan job submissions and results (outcome: submitted, deduplicated, rejected, succeeded, failed).",
+    ["outcome"],
+)
+PLAN_JOB_QUEUE_DEPTH = Gauge("travel_plan_job_queue_depth", "Plan jobs waiting for a job worker.")
+PLAN_JOB_RUNNING = Gauge("travel_plan_job_running", "Plan jobs currently being generated.")
+LLM_SCHEDULER_ACTIVE = Gauge("travel_llm_scheduler_active", "LLM calls currently holding a scheduler slot.")
+LLM_SCHEDULER_QUEUE_DEPTH = Gauge("travel_llm_scheduler_queue_depth", "LLM calls waiting for a scheduler slot.")
+
+# --- LLM Usage Accounting ---
+
+def _load_price_table() -> Dict[str, Tuple[float, float, float]]:
+    """
+    Parses LLM_PRICE_TABLE into {model: (input, output, cached_input)} USD per 1M
+    tokens. cached_input defaults to the input price.
+    """
+    if not LLM_PRICE_TABLE:
+        return {}
+    try:
+        return {
+            model: (
+                float(prices["input"]), float(prices["output"]),
+                float(prices.get("cached_input", prices["input"])),
+            )
+            for model, prices in json.loads(LLM_PRICE_TABLE).items()
+        }
+    except (ValueError, AttributeError, TypeError, KeyError) as e:
+        logger.error(f"Ignoring invalid LLM_PRICE_TABLE: {e}")
+        return {}
+
+_PRICES = _load_price_table()
+
+def cached_prompt_tokens(usage: Any) -> int:
+    """Prompt tokens served from the provider's prefix cache, as reported in `usage`."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)  # DeepSeek-style usage
+    return cached or 0
+
+def record_llm_call(
+    endpoint: str, operation: str, model: str, seconds: float,
+    ttft_seconds: Optional[float] = None, usage: Any = None, route: Optional[str] = None,
+) -> None:
+    """
+    Records latency, token usage and estimated cost of a successful completion.
+    `route` is the model route it was sent with (see app/model_routes.py).
+    """
+    model, route = model or "unknown", route or operation
+    LLM_CALLS.inc(endpoint=endpoint, operation=operation, model=model, route=route, outcome="ok")
+    LLM_CALL_SECONDS.observe(seconds, endpoint=endpoint, operation=operation, model=model, route=route)
+    if ttft_seconds is not None:
+        LLM_TTFT_SECONDS.observe(ttft_seconds, endpoint=endpoint, operation=operation, model=model, route=route)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    labels = dict(endpoint=endpoint, operation=operation, model=model, route=route)
+    LLM_TOKENS.inc(prompt_tokens, kind="prompt", **labels)
+    LLM_TOKENS.inc(completion_tokens, kind="completion", **labels)
+    cached_tokens = cached_prompt_tokens(usage)
+    LLM_TOKENS.inc(cached_tokens, kind="cached_prompt", **labels)
+    prices = _PRICES.get(model)
+    if prices is not None:
+        input_price, output_price, cached_price = prices
+        cost = (
+            (prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price
+        ) / 1_000_000
+        LLM_COST_USD.inc(cost, endpoint=endpoint, operation=operation, model=model, route=route)
+
+def record_llm_error(endpoint: str, operation: str, model: str, route: Optional[str] = None) -> None:
+    LLM_CALLS.inc(
+        endpoint=endpoint, operation=operation, model=model or "unknown", route=route or operation, outcome="error"
+    )
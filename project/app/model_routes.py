@@ -0,0 +1,112 @@
+import json
+import logging
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, List, Optional, Tuple
+from .config import LLM_MODEL_ROUTES
+
+logger = logging.getLogger(__name__)
+
+# --- Model Routes ---
+# Each LLM operation (see DEFAULT_POLICIES in app/scheduler.py) is sent with the
+# model, temperature and max_tokens of its route. LLM_MODEL_ROUTES maps
+# operations (and "default", applied to all of them) to route settings, with
+# optional overrides by plan size:
+#
+#   {"regenerate": {"model": "gpt-4o-mini", "max_tokens": 1200},
+#    "plan": {"max_tokens": 8000, "overrides": [{"min_days": 5, "model": "gpt-4o", "max_tokens": 16000}]}}
+#
+# The route name is a label of the LLM metrics, so each route's latency and
+# token use can be compared before an operation is moved to another model.
+
+DEFAULT_TEMPERATURE = 0.8
+_SETTINGS = ("model", "temperature", "max_tokens")
+
+@dataclass(frozen=True)
+class ModelRoute:
+    name: str
+    model: Optional[str] = None  # None: the model of the endpoint the call goes to (MODEL by default).
+    temperature: float = DEFAULT_TEMPERATURE
+    max_tokens: Optional[int] = None  # None: not sent, the provider's limit applies.
+
+    def params(self) -> Dict:
+        """Completion parameters of the route."""
+        params = {"temperature": self.temperature}
+        if self.model:
+            params["model"] = self.model
+        if self.max_tokens:
+            params["max_tokens"] = self.max_tokens
+        return params
+
+@dataclass(frozen=True)
+class _Override:
+    settings: Dict
+    name: Optional[str] = None
+    min_days: Optional[int] = None
+    max_days: Optional[int] = None
+
+    def matches(self, days: Optional[int]) -> bool:
+        if days is None:
+            return False
+        return (self.min_days is None or days >= self.min_days) and (self.max_days is None or days <= self.max_days)
+
+    def route_name(self, operation: str) -> str:
+        if self.name:
+            return self.name
+        bounds = [f"days>={self.min_days}"] if self.min_days is not None else []
+        bounds += [f"days<={self.max_days}"] if self.max_days is not None else []
+        return f"{operation}:{','.join(bounds) or 'override'}"
+
+def _settings(entry: Dict) -> Dict:
+    settings = {key: entry[key] for key in _SETTINGS if key in entry}
+    if "temperature" in settings:
+        settings["temperature"] = float(settings["temperature"])
+    if settings.get("max_tokens") is not None:
+        settings["max_tokens"] = int(settings["max_tokens"])
+    return settings
+
+class ModelRouter:
+    """Resolves the route of an LLM call from its operation and, for plan-sized calls, the number of days."""
+
+    def __init__(self, table: Dict[str, Tuple[Dict, List[_Override]]]):
+        self._default = table.get("default", ({}, []))[0]
+        self._table = table
+
+    def route(self, operation: str, days: Optional[int] = None) -> ModelRoute:
+        settings, overrides = self._table.get(operation, ({}, []))
+        route = ModelRoute(name=operation, **{**self._default, **settings})
+        for override in overrides:
+            if override.matches(days):
+                return replace(route, name=override.route_name(operation), **override.settings)
+        return route
+
+    def describe(self) -> Dict[str, Dict]:
+        """The configured routes, for the stats endpoint."""
+        described = {}
+        for operation, (_, overrides) in self._table.items():
+            described[operation] = asdict(self.route(operation))
+            for override in overrides:
+                route = replace(self.route(operation), name=override.route_name(operation), **override.settings)
+                described[route.name] = asdict(route)
+        return described
+
+def _load_routes() -> Dict[str, Tuple[Dict, List[_Override]]]:
+    if not LLM_MODEL_ROUTES:
+        return {}
+    try:
+        table = {}
+        for operation, entry in json.loads(LLM_MODEL_ROUTES).items():
+            overrides = [
+                _Override(
+                    _settings(override), override.get("name"),
+                    int(override["min_days"]) if override.get("min_days") is not None else None,
+                    int(override["max_days"]) if override.get("max_days") is not None else None,
+                )
+                for override in entry.get("overrides", [])
+            ]
+            table[operation] = (_settings(entry), overrides)
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.error(f"Ignoring invalid LLM_MODEL_ROUTES: {e}")
+        return {}
+    return table
+
+model_router = ModelRouter(_load_routes())
@@ -0,0 +1,47 @@
+from typing import Iterable, List, Optional, Tuple
+from .schemas import DayPlan, ItineraryItem, ItineraryResponse
+
+# --- Outdoor Activity Classification ---
+# Decides locally, from the category and keywords in the POI name and
+# description, which activities are affected by bad weather, so that only those
+# are sent to the LLM for indoor alternatives.
+
+# Checked first: a name with one of these is indoors whatever else it mentions
+# (e.g. 西湖博物馆).
+INDOOR_KEYWORDS = (
+    "博物馆", "博物院", "美术馆", "艺术馆", "纪念馆", "展览馆", "展馆", "科技馆", "图书馆", "书店", "书局",
+    "商场", "购物中心", "百货", "剧院", "剧场", "影院", "电影", "室内", "水族馆", "海洋馆", "茶馆", "咖啡",
+    "餐厅", "酒楼", "饭店", "酒店", "温泉", "体验馆", "工作室", "密室", "画廊",
+)
+OUTDOOR_KEYWORDS = (
+    "公园", "湖", "山", "峰", "岭", "步道", "徒步", "骑行", "古镇", "老街", "步行街", "小吃街", "夜市", "广场",
+    "景区", "湿地", "海滩", "沙滩", "海边", "岛", "森林", "花园", "植物园", "动物园", "游船", "乘船", "码头",
+    "长城", "遗址", "露天", "户外", "峡谷", "瀑布", "江", "河", "堤", "桥", "溪", "村", "草原", "观景",
+)
+# Categories outdoors unless an indoor keyword says otherwise; the rest are
+# indoors unless an outdoor keyword says otherwise (e.g. 美食 at a 夜市).
+OUTDOOR_CATEGORIES = {"景点"}
+
+def _contains_any(text: str, keywords: Iterable[str]) -> bool:
+    return any(keyword in text for keyword in keywords)
+
+def is_outdoor(item: ItineraryItem) -> bool:
+    """Whether an activity is (mostly) outdoors and so affected by rain or extreme heat."""
+    if _contains_any(item.poi_name, INDOOR_KEYWORDS):
+        return False
+    if _contains_any(item.poi_name, OUTDOOR_KEYWORDS):
+        return True
+    if item.category in OUTDOOR_CATEGORIES:
+        return not _contains_any(item.description, INDOOR_KEYWORDS)
+    return _contains_any(item.description, ("露天", "户外", "徒步", "骑行", "游船"))
+
+def outdoor_activities(
+    itinerary: ItineraryResponse, days: Optional[Iterable[int]] = None
+) -> List[Tuple[DayPlan, ItineraryItem]]:
+    """(day, activity) pairs of the outdoor activities, optionally limited to some days."""
+    wanted = set(days) if days is not None else None
+    return [
+        (day_plan, item)
+        for day_plan in itinerary.itinerary if wanted is None or day_plan.day in wanted
+        for item in day_plan.activities if is_outdoor(item)
+    ]
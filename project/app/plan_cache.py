@@ -0,0 +1,129 @@
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional
+from .schemas import PlanRequest, ItineraryResponse, DayPlan, new_item_id
+from .cache import CacheBackend, MemoryBackend, build_cache_backend
+from .llm_client import llm_endpoints
+from .model_routes import model_router
+from .config import (
+    OUTPUT_FORMAT, PLAN_CACHE_ENABLED, PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_TTL_SECONDS,
+    PLAN_CACHE_DISK_PATH, PLAN_CACHE_DISK_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Request Normalization ---
+
+def _normalize_list(values: Optional[List[str]]) -> List[str]:
+    return sorted({v.strip() for v in values or [] if v and v.strip()})
+
+def _normalize_restriction(value: Optional[str]) -> str:
+    value = (value or "").strip()
+    return "" if value in ("无", "N/A", "none", "None") else value
+
+def canonical_plan_request(request: PlanRequest) -> Dict:
+    """Returns an order-insensitive canonical form of a plan request."""
+    return {
+        "city": request.city.strip().lower(),
+        "days": request.days,
+        "interests": _normalize_list(request.interests),
+        "travel_style": request.travel_style.strip(),
+        "must_visit_pois": _normalize_list(request.must_visit_pois),
+        "budget": request.budget.strip(),
+        "food_preferences": {
+            "price_range": request.food_preferences.price_range.strip(),
+            "cuisine_types": _normalize_list(request.food_preferences.cuisine_types),
+            "dietary_restrictions": _normalize_restriction(request.food_preferences.dietary_restrictions),
+        },
+    }
+
+# LLM operations a plan can be generated with (single-prompt and parallel mode).
+_PLAN_OPERATIONS = ("plan", "plan_skeleton", "plan_day")
+
+def _generation_settings(days: int) -> Dict:
+    """
+    Model, temperature and max_tokens of the routes that generate a plan of `days`
+    days. A route without a model runs on the endpoints' models, so those stand in.
+    """
+    endpoint_models = sorted({endpoint.model or "" for endpoint in llm_endpoints.endpoints})
+    settings = {}
+    for operation in _PLAN_OPERATIONS:
+        params = model_router.route(operation, days).params()
+        params.setdefault("model", endpoint_models)
+        settings[operation] = params
+    return settings
+
+def plan_cache_key(request: PlanRequest) -> str:
+    """
+    Builds the cache key for a plan request. The resolved model routes and the
+    output format are part of the key, so changing either stops serving plans
+    generated under the old settings.
+    """
+    canonical = json.dumps(
+        {
+            "routes": _generation_settings(request.days), "output_format": OUTPUT_FORMAT,
+            "request": canonical_plan_request(request),
+        },
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return "plan:v2:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def with_fresh_ids(itinerary: ItineraryResponse) -> ItineraryResponse:
+    """Copies an itinerary, giving every ItineraryItem a new unique id."""
+    return itinerary.model_copy(update={
+        "itinerary": [
+            DayPlan(
+                day=day_plan.day,
+                activities=[a.model_copy(update={"id": new_item_id()}) for a in day_plan.activities],
+            )
+            for day_plan in itinerary.itinerary
+        ]
+    })
+
+
+# --- Plan Cache ---
+
+class PlanCache:
+    """
+    Cache for generated itineraries on a CacheBackend: per-worker memory, or a
+    SQLite tier shared by all workers (and surviving restarts) behind an
+    in-memory LRU. Every hit is returned with fresh item ids so that clients
+    never share ids.
+    """
+
+    def __init__(self, backend: CacheBackend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+
+    async def get(self, request: PlanRequest) -> Optional[ItineraryResponse]:
+        if not self.enabled:
+            return None
+        itinerary = await self.backend.get(plan_cache_key(request))
+        if itinerary is None:
+            return None
+        return with_fresh_ids(itinerary)
+
+    async def set(self, request: PlanRequest, itinerary: ItineraryResponse) -> None:
+        if not self.enabled:
+            return
+        await self.backend.set(plan_cache_key(request), itinerary)
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def stats(self) -> Dict:
+        return {"enabled": self.enabled, **self.backend.stats()}
+
+
+def _build_plan_cache() -> PlanCache:
+    if not PLAN_CACHE_ENABLED:
+        return PlanCache(MemoryBackend(PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_TTL_SECONDS), enabled=False)
+    backend = build_cache_backend(
+        "plan", PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_TTL_SECONDS,
+        shared_path=PLAN_CACHE_DISK_PATH or None, shared_max_entries=PLAN_CACHE_DISK_MAX_ENTRIES,
+        encode=lambda itinerary: itinerary.model_dump(), decode=lambda data: ItineraryResponse(**data),
+    )
+    return PlanCache(backend, PLAN_CACHE_ENABLED)
+
+plan_cache = _build_plan_cache()
@@ -0,0 +1,196 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+from .schemas import (
+    PlanRequest, RegenerateRequest, BatchRegenerateRequest, ItineraryResponse, ItineraryItem, FoodPreferences
+)
+from .services import prefetch_replacements_from_llm, _normalize_poi_name
+from .plan_cache import _normalize_list, _normalize_restriction
+from .cache import CacheBackend, build_cache_backend
+from .scheduler import SchedulerOverloaded
+from .timing import start_request_timing
+from .metrics import PREFETCH_ITEMS, LLM_COST_USD, LLM_TOKENS
+from .config import (
+    PREFETCH_ENABLED, PREFETCH_ITEMS_PER_DAY, PREFETCH_MAX_ITEMS_PER_HOUR, PREFETCH_MAX_INFLIGHT,
+    PREFETCH_TTL_SECONDS, PREFETCH_MAX_ENTRIES, ROUTE_MEAL_CATEGORIES
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Speculative Replacement Prefetch ---
+# Once a plan has been returned, a few of its activities per day get a
+# replacement generated in the background. The pool is keyed by the id of the
+# activity it replaces, so a later /api/regenerate-activity for that activity
+# (with the same preferences) is answered without an LLM call. Activity ids are
+# unique per served itinerary (cache hits and deduplicated plan jobs get fresh
+# ones), so every client's copy has its own pool entries.
+
+def _preference_key(
+    city: str, interests: List[str], travel_style: str, budget: str, food_preferences: FoodPreferences
+) -> str:
+    """Preferences a pooled replacement was generated for; a regenerate request must match them."""
+    return json.dumps([
+        city.strip().lower(), _normalize_list(interests), travel_style.strip(), budget.strip(),
+        food_preferences.price_range.strip(), _normalize_list(food_preferences.cuisine_types),
+        _normalize_restriction(food_preferences.dietary_restrictions),
+    ], ensure_ascii=False)
+
+def _pool_key(activity_id: str) -> str:
+    return f"prefetch:{activity_id}"
+
+class ReplacementPrefetcher:
+    """
+    Pre-generates replacement activities after a plan is returned, within a
+    budget: at most `max_items_per_hour` activities per hour and `max_inflight`
+    plans at a time; plans beyond the budget are skipped, never queued.
+    Entries are served at most once and expire after the backend TTL.
+    """
+
+    def __init__(
+        self, backend: CacheBackend, enabled: bool, items_per_day: int, max_items_per_hour: int, max_inflight: int
+    ):
+        self.backend = backend
+        self.enabled = enabled
+        self.items_per_day = items_per_day
+        self.max_items_per_hour = max_items_per_hour
+        self.max_inflight = max_inflight
+        self._tasks: Set[asyncio.Task] = set()
+        self._window_started = time.monotonic()
+        self._window_used = 0
+        self.generated = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.skipped = 0
+
+    # --- Scheduling ---
+
+    def _targets(self, itinerary: ItineraryResponse) -> List[str]:
+        """Activity ids to prefetch: up to items_per_day per day, non-meal activities first."""
+        ids = []
+        for day_plan in itinerary.itinerary:
+            ranked = sorted(day_plan.activities, key=lambda act: act.category in ROUTE_MEAL_CATEGORIES)
+            ids.extend(act.id for act in ranked[:self.items_per_day])
+        return ids
+
+    def _reserve(self, wanted: int) -> int:
+        """Takes up to `wanted` items from the hourly budget and returns how many were granted."""
+        now = time.monotonic()
+        if now - self._window_started >= 3600:
+            self._window_started, self._window_used = now, 0
+        granted = max(0, min(wanted, self.max_items_per_hour - self._window_used))
+        self._window_used += granted
+        return granted
+
+    def schedule(self, request: PlanRequest, itinerary: ItineraryResponse) -> None:
+        """Starts prefetching replacements for a returned itinerary, if enabled and within budget."""
+        if not self.enabled or self.items_per_day <= 0:
+            return
+        targets = self._targets(itinerary)
+        if len(self._tasks) >= self.max_inflight:
+            granted = 0
+        else:
+            granted = self._reserve(len(targets))
+        if granted < len(targets):
+            self.skipped += len(targets) - granted
+            PREFETCH_ITEMS.inc(len(targets) - granted, outcome="skipped")
+        if not granted:
+            return
+        batch = BatchRegenerateRequest(
+            city=request.city, day_plans=itinerary.itinerary, activity_ids=targets[:granted],
+            interests=request.interests, travel_style=request.travel_style, budget=request.budget,
+            food_preferences=request.food_preferences,
+        )
+        task = asyncio.create_task(self._prefetch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, batch: BatchRegenerateRequest) -> None:
+        # Runs outside the request that scheduled it: its LLM calls are metered as background work.
+        start_request_timing()
+        try:
+            replacements = await prefetch_replacements_from_llm(batch)
+        except SchedulerOverloaded as e:
+            logger.info(f"Prefetch shed by the LLM scheduler: {e}")
+            return
+        except Exception as e:
+            logger.warning(f"Prefetch failed for {batch.city}: {e}")
+            return
+        preferences = _preference_key(
+            batch.city, batch.interests, batch.travel_style, batch.budget, batch.food_preferences
+        )
+        for activity_id, item in replacements.items():
+            await self.backend.set(_pool_key(activity_id), {"preferences": preferences, "item": item})
+        self.generated += len(replacements)
+        PREFETCH_ITEMS.inc(len(replacements), outcome="generated")
+        logger.info(f"Prefetched {len(replacements)} replacement(s) for {batch.city}")
+
+    # --- Serving ---
+
+    async def take(self, request: RegenerateRequest) -> Optional[ItineraryItem]:
+        """Removes and returns the pooled replacement for the activity, if it still fits the request."""
+        if not self.enabled:
+            return None
+        activity = request.activity_to_replace
+        key = _pool_key(activity.id)
+        entry = await self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            PREFETCH_ITEMS.inc(outcome="miss")
+            return None
+        await self.backend.delete(key)
+        item: ItineraryItem = entry["item"]
+        preferences = _preference_key(
+            request.city, request.interests, request.travel_style, request.budget, request.food_preferences
+        )
+        day_names = {_normalize_poi_name(act.poi_name) for act in request.day_plan.activities}
+        if entry["preferences"] != preferences or _normalize_poi_name(item.poi_name) in day_names:
+            self.stale += 1
+            PREFETCH_ITEMS.inc(outcome="stale")
+            return None
+        self.hits += 1
+        PREFETCH_ITEMS.inc(outcome="hit")
+        # The activity may have been moved since; the replacement takes its current slot.
+        return item.model_copy(update={"time": activity.time, "travel_from_previous": activity.travel_from_previous})
+
+    # --- Lifecycle and Stats ---
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.backend.close()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.stale
+        utilization = self.hits / self.generated if self.generated else 0.0
+        cost = LLM_COST_USD.total(operation="prefetch")
+        return {
+            "enabled": self.enabled,
+            "inflight": len(self._tasks),
+            "generated": self.generated,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "skipped_for_budget": self.skipped,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "utilization": round(utilization, 4),
+            "budget_used_this_hour": self._window_used,
+            "prompt_tokens": LLM_TOKENS.total(operation="prefetch", kind="prompt"),
+            "completion_tokens": LLM_TOKENS.total(operation="prefetch", kind="completion"),
+            "cost_usd": round(cost, 6),
+            # Generations not (yet) served; pooled entries still waiting are counted as waste.
+            "wasted_cost_usd": round(cost * (1 - utilization), 6),
+            "pool": self.backend.stats(),
+        }
+
+replacement_prefetcher = ReplacementPrefetcher(
+    build_cache_backend(
+        "prefetch", PREFETCH_MAX_ENTRIES, PREFETCH_TTL_SECONDS,
+        encode=lambda entry: {"preferences": entry["preferences"], "item": entry["item"].model_dump()},
+        decode=lambda data: {"preferences": data["preferences"], "item": ItineraryItem(**data["item"])},
+    ),
+    PREFETCH_ENABLED, PREFETCH_ITEMS_PER_DAY, PREFETCH_MAX_ITEMS_PER_HOUR, PREFETCH_MAX_INFLIGHT,
+)
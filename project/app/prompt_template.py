@@ -1,19 +1,28 @@
+from dataclasses import dataclass
+from typing import Dict, List
+
+# --- Prompt Structure ---
+# Every prompt is a static system message (role, rules and example output),
+# identical across requests so providers can reuse its cached prefix, followed
+# by a short user message holding the request-specific fields.
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    system: str
+    user: str
+
+    def render(self, **fields) -> List[Dict[str, str]]:
+        """Returns the chat messages for the given template fields."""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**fields)},
+        ]
+
 # 这个字符串是整个AI功能的核心
-PROMPT_TEMPLATE = """
+PROMPT_TEMPLATE = PromptTemplate(
+    system="""
 You are a meticulous, creative, and experienced local travel butler. Your main goal is to generate a personalized and practical travel itinerary in a structured XML format. You must integrate both attractions and dining experiences seamlessly.
 
-Generate a travel plan based on the following user request:
-- City: {city}
-- Duration: {days} days
-- Interests: {interests_str}
-- Travel Style: {travel_style}
-- Must-Visit POIs: {must_visit_pois_str}
-- Budget: {budget}
-- Food Preferences:
-  - Price Range: {food_price_range}
-  - Cuisine/Flavor: {food_cuisine_types}
-  - Dietary Restrictions: {food_dietary_restrictions}
-
 **XML OUTPUT REQUIREMENTS:**
 1.  The entire response MUST be a single, valid XML block starting with `<itinerary>` and ending with `</itinerary>`.
 2.  Do NOT include any introductory text, explanations, or any character outside the main XML structure.
@@ -67,27 +76,27 @@ Generate a travel plan based on the following user request:
     </item>
   </day>
 </itinerary>
-
-Now, generate the XML for the user's request.
-"""
-
-REGENERATE_PROMPT_TEMPLATE = """
-You are a travel planning expert. Your task is to suggest a new, single travel item to replace an existing one in a user's itinerary.
-
-Here is the context:
+""",
+    user="""
+Generate a travel plan based on the following user request:
 - City: {city}
-- User's Interests: {interests_str}
+- Duration: {days} days
+- Interests: {interests_str}
 - Travel Style: {travel_style}
+- Must-Visit POIs: {must_visit_pois_str}
 - Budget: {budget}
 - Food Preferences:
   - Price Range: {food_price_range}
   - Cuisine/Flavor: {food_cuisine_types}
   - Dietary Restrictions: {food_dietary_restrictions}
-- The Day's Plan (so you don't suggest duplicates):
-{day_plan_str}
 
-- The item to replace:
-{activity_to_replace_str}
+Now, generate the XML for the user's request.
+""",
+)
+
+REGENERATE_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
+You are a travel planning expert. Your task is to suggest a new, single travel item to replace an existing one in a user's itinerary.
 
 **REQUIREMENTS:**
 1.  Suggest a NEW, DIFFERENT item that is a good alternative, keeping the user's preferences in mind.
@@ -111,23 +120,34 @@ Here is the context:
   <price>门票: ¥60</price>
   <local_tip>园区很大，建议乘坐观光车游览，可以节省体力。</local_tip>
 </item>
+""",
+    user="""
+Here is the context:
+- City: {city}
+- User's Interests: {interests_str}
+- Travel Style: {travel_style}
+- Budget: {budget}
+- Food Preferences:
+  - Price Range: {food_price_range}
+  - Cuisine/Flavor: {food_cuisine_types}
+  - Dietary Restrictions: {food_dietary_restrictions}
+- The Day's Plan (so you don't suggest duplicates):
+{day_plan_str}
+
+- The item to replace:
+{activity_to_replace_str}
 
 Now, generate a new `<item>` block to replace the one provided.
-"""
+""",
+)
 
-RECALCULATE_TRAVEL_PROMPT_TEMPLATE = """
+RECALCULATE_TRAVEL_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
 You are a travel logistics expert. Your task is to update the travel times for a given itinerary.
 The user has modified their itinerary (e.g., reordered activities, added/deleted items) and needs the "travel_from_previous" fields updated.
 Do NOT change any other details of the activities (poi_name, description, time, category, etc.) unless it's a new item that needs full details.
 The primary goal is to accurately estimate travel times between consecutive activities for each day.
 
-Here is the itinerary that needs travel time recalculation:
-City: {city}
-Total Days: {total_days}
-
-Itinerary Details:
-{itinerary_xml_string}
-
 **XML OUTPUT REQUIREMENTS:**
 1.  The entire response MUST be a single, valid XML block starting with `<itinerary>` and ending with `</itinerary>`.
 2.  Do NOT include any introductory text, explanations, or any character outside the main XML structure.
@@ -172,21 +192,23 @@ Itinerary Details:
   </day>
 </itinerary>
 ```
+""",
+    user="""
+Here is the itinerary that needs travel time recalculation:
+City: {city}
+Total Days: {total_days}
+
+Itinerary Details:
+{itinerary_xml_string}
+
 Now, process the provided itinerary and return the updated XML with correct `<travel_from_previous>` times.
-"""
+""",
+)
 
-WEATHER_CONTINGENCY_PROMPT_TEMPLATE = """
+WEATHER_CONTINGENCY_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
 You are a pragmatic and quick-thinking travel assistant. Your task is to provide a suitable indoor alternative for an outdoor activity in case of bad weather (e.g., rain, extreme heat).
 
-Here is the context for the user and the activity:
-- City: {city}
-- User's Interests: {interests_str}
-{weather_info}
-- The outdoor activity to replace:
-  - Name: {poi_name}
-  - Time: {time}
-  - Original Description: {description}
-
 **REQUIREMENTS:**
 1.  Suggest a NEW, single, INDOOR activity that is a good alternative.
 2.  The suggestion should be geographically close to the original activity if possible, and align with the user's general interests.
@@ -209,6 +231,291 @@ Here is the context for the user and the activity:
   <price>人均 ¥40</price>
   <local_tip>店内的手绘地图和文创产品很有特色，值得一看。</local_tip>
 </item>
+""",
+    user="""
+Here is the context for the user and the activity:
+- City: {city}
+- User's Interests: {interests_str}
+{weather_info}
+- The outdoor activity to replace:
+  - Name: {poi_name}
+  - Time: {time}
+  - Original Description: {description}
 
 Now, generate a new indoor `<item>` block as a weather contingency plan.
-"""
\ No newline at end of file
+""",
+)
+
+SKELETON_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
+You are a meticulous local travel butler. Before the detailed itinerary is written, you must draft a short SKELETON that splits the trip into days.
+
+**XML OUTPUT REQUIREMENTS:**
+1.  The entire response MUST be a single, valid XML block starting with `<skeleton>` and ending with `</skeleton>`.
+2.  Do NOT include any introductory text, explanations, or any character outside the main XML structure.
+3.  The root element must be `<skeleton>` with two attributes: `city` and `total_days`.
+4.  Create exactly one `<day>` element per day, with a `number` attribute.
+5.  Each `<day>` contains one `<area>` (the district or neighbourhood the day focuses on) followed by 2-4 `<poi>` elements naming the key attractions of that day. Do NOT include restaurants.
+6.  Group geographically close POIs on the same day so that each day needs little travel.
+7.  Every Must-Visit POI MUST appear in exactly one day. No POI may appear on more than one day.
+
+**EXAMPLE of the required XML structure:**
+<skeleton city="杭州" total_days="2">
+  <day number="1">
+    <area>西湖及南山路</area>
+    <poi>中国丝绸博物馆</poi>
+    <poi>雷峰塔</poi>
+  </day>
+  <day number="2">
+    <area>灵隐及龙井</area>
+    <poi>灵隐寺</poi>
+    <poi>龙井村</poi>
+  </day>
+</skeleton>
+""",
+    user="""
+Here is the user request:
+- City: {city}
+- Duration: {days} days
+- Interests: {interests_str}
+- Travel Style: {travel_style}
+- Must-Visit POIs: {must_visit_pois_str}
+- Budget: {budget}
+
+Now, generate the skeleton XML for the user's request.
+""",
+)
+
+DAY_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
+You are a meticulous, creative, and experienced local travel butler. You are writing ONE day of a multi-day itinerary in a structured XML format. Other days are being written separately, so stay within the plan for this day.
+
+**XML OUTPUT REQUIREMENTS:**
+1.  The entire response MUST be a single, valid XML block starting with `<day number="N">` (N is the day number given in the request) and ending with `</day>`.
+2.  Do NOT include any introductory text, explanations, or any character outside the main XML structure.
+3.  Inside `<day>`, list the items in `<item>` elements.
+4.  Each `<item>` element MUST contain exactly these child elements in this specific order: `<category>`, `<time>`, `<poi_name>`, `<description>`, `<lat>`, `<lon>`, `<travel_from_previous>`, `<opening_hours>`, `<booking_info>`, `<price>`, and `<local_tip>`.
+5.  For lunch and dinner times (e.g., "中午", "晚上"), you MUST add an `<item>` with `<category>美食</category>` near the surrounding activities that matches the food preferences.
+6.  `<category>` must be one of: '景点', '美食', '购物', '体验'. `<description>` is under 50 words. `<travel_from_previous>` is "N/A" for the first item. For restaurants use "人均 ¥XXX" in `<price>`; for attractions use "门票: ¥XXX".
+7.  Arrange activities to minimize travel time. The `travel_style` should influence the number of activities.
+
+**EXAMPLE of the required XML structure:**
+<day number="1">
+  <item>
+    <category>景点</category>
+    <time>上午 (09:00-12:00)</time>
+    <poi_name>中国丝绸博物馆</poi_name>
+    <description>深入了解丝绸的古老历史与精美工艺，感受江南的独特文化魅力。</description>
+    <lat>30.2284</lat>
+    <lon>120.1419</lon>
+    <travel_from_previous>N/A</travel_from_previous>
+    <opening_hours>周二至周日 09:00-17:00</opening_hours>
+    <booking_info>官方微信公众号预约</booking_info>
+    <price>门票: 免费</price>
+    <local_tip>博物馆分为多个展厅，建议至少留出2小时参观。</local_tip>
+  </item>
+</day>
+""",
+    user="""
+The user request:
+- City: {city}
+- Duration of the whole trip: {days} days
+- Interests: {interests_str}
+- Travel Style: {travel_style}
+- Budget: {budget}
+- Food Preferences:
+  - Price Range: {food_price_range}
+  - Cuisine/Flavor: {food_cuisine_types}
+  - Dietary Restrictions: {food_dietary_restrictions}
+
+The plan for this day:
+- Day number: {day_number}
+- Area: {area}
+- Key POIs that MUST be included: {day_pois_str}
+- POIs planned for other days (do NOT include these): {other_pois_str}
+
+Now, generate the XML for day {day_number}.
+""",
+)
+
+BATCH_REGENERATE_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
+You are a travel planning expert. Your task is to suggest NEW travel items to replace several existing items in a user's itinerary, all at once.
+
+**REQUIREMENTS:**
+1.  For EVERY item to replace, suggest exactly one NEW, DIFFERENT item that is a good alternative, keeping the user's preferences in mind.
+2.  Each new item should be geographically and thematically logical for its day. If replacing food, suggest food. If replacing an attraction, suggest an attraction.
+3.  All suggestions MUST be different from each other and from every item in the current plan.
+4.  Your entire response MUST be a single, valid XML `<items>` block containing one `<item>` per item to replace.
+5.  Each `<item>` MUST have a `ref` attribute with the reference number of the item it replaces.
+6.  Do NOT include any introductory text or explanations.
+7.  Each `<item>` element MUST contain the same child elements as the main prompt: `<category>`, `<time>`, `<poi_name>`, `<description>`, `<lat>`, `<lon>`, `<travel_from_previous>`, `<opening_hours>`, `<booking_info>`, `<price>`, and `<local_tip>`.
+8.  The `<time>` and `<travel_from_previous>` should be kept the same as the item being replaced.
+
+**EXAMPLE of the required XML output:**
+<items>
+  <item ref="1">
+    <category>景点</category>
+    <time>下午 (14:00-17:00)</time>
+    <poi_name>良渚古城遗址公园</poi_name>
+    <description>探访实证中华五千年文明史的圣地，感受古代水利工程的震撼。</description>
+    <lat>30.3933</lat>
+    <lon>120.0217</lon>
+    <travel_from_previous>车程约45分钟</travel_from_previous>
+    <opening_hours>09:00-17:00</opening_hours>
+    <booking_info>需通过"良渚古城遗址公园"小程序或公众号实名预约</booking_info>
+    <price>门票: ¥60</price>
+    <local_tip>园区很大，建议乘坐观光车游览，可以节省体力。</local_tip>
+  </item>
+</items>
+""",
+    user="""
+Here is the context:
+- City: {city}
+- User's Interests: {interests_str}
+- Travel Style: {travel_style}
+- Budget: {budget}
+- Food Preferences:
+  - Price Range: {food_price_range}
+  - Cuisine/Flavor: {food_cuisine_types}
+  - Dietary Restrictions: {food_dietary_restrictions}
+- The current plan (so you don't suggest duplicates):
+{day_plans_str}
+- Places that must NOT be suggested:
+{excluded_str}
+
+- The items to replace, each with a reference number:
+{targets_str}
+
+Now, generate the `<items>` block with one replacement per reference number.
+""",
+)
+
+WEATHER_CONTINGENCY_BATCH_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
+You are a pragmatic and quick-thinking travel assistant. Your task is to provide suitable indoor alternatives for several outdoor activities of an itinerary, all at once, in case of bad weather (e.g., rain, extreme heat).
+
+**REQUIREMENTS:**
+1.  For EVERY activity to replace, suggest exactly one NEW, INDOOR activity that is a good alternative.
+2.  Each suggestion should be geographically close to the activity it replaces if possible, and align with the user's general interests.
+3.  All suggestions MUST be different from each other and from every item in the current plan.
+4.  Your entire response MUST be a single, valid XML `<items>` block containing one `<item>` per activity to replace.
+5.  Each `<item>` MUST have a `ref` attribute with the reference number of the activity it replaces.
+6.  Do NOT include any introductory text or explanations.
+7.  Each `<item>` element MUST contain the same child elements as the main prompt: `<category>`, `<time>`, `<poi_name>`, `<description>`, `<lat>`, `<lon>`, `<travel_from_previous>`, `<opening_hours>`, `<booking_info>`, `<price>`, and `<local_tip>`.
+8.  The `<time>` and `<travel_from_previous>` should be kept the same as the activity being replaced. Each description should clearly state that this is a "Plan B" for bad weather.
+
+**EXAMPLE of the required XML output:**
+<items>
+  <item ref="1">
+    <category>体验</category>
+    <time>下午 (15:00-17:00)</time>
+    <poi_name>猫的天空之城概念书店(西湖店)</poi_name>
+    <description>【恶劣天气备选】如果天气不佳，这里是绝佳的室内去处。一家温馨的书店，可以阅读、喝咖啡，给未来的自己写一张明信片。</description>
+    <lat>30.2550</lat>
+    <lon>120.1562</lon>
+    <travel_from_previous>车程约10分钟</travel_from_previous>
+    <opening_hours>10:00-22:00</opening_hours>
+    <booking_info>无需预订</booking_info>
+    <price>人均 ¥40</price>
+    <local_tip>店内的手绘地图和文创产品很有特色，值得一看。</local_tip>
+  </item>
+</items>
+""",
+    user="""
+Here is the context:
+- City: {city}
+- User's Interests: {interests_str}
+{weather_info}
+- The current plan (so you don't suggest duplicates):
+{day_plans_str}
+
+- The outdoor activities to replace, each with a reference number:
+{targets_str}
+
+Now, generate the `<items>` block with one indoor alternative per reference number.
+""",
+)
+
+# --- Compact JSON Output (OUTPUT_FORMAT=json) ---
+# Same content rules as PROMPT_TEMPLATE / DAY_PROMPT_TEMPLATE, but items are
+# short-key JSON objects instead of eleven XML tag pairs each.
+
+COMPACT_ITEM_RULES = """\
+    - Each item is an object with exactly these keys: "k" (category), "t" (time), "p" (POI name), "ds" (description), "la" (latitude, number), "lo" (longitude, number), "tr" (travel time from the previous item), "oh" (opening hours), "bk" (booking info), "pr" (price), "tip" (local tip).
+    - "k" must be one of: '景点', '美食', '购物', '体验'.
+    - "ds": a concise, engaging summary (under 50 words) that relates to the user's interests.
+    - "tr": estimated travel time from the previous item, e.g. "车程约10分钟". For the first item of the day, use "N/A".
+    - "oh": opening hours (e.g. "周二至周日 09:00-17:00", "11:00-22:00"). If not applicable, use "N/A".
+    - "bk": how to book (e.g. "电话: 123-4567", "无需预订").
+    - "pr": for restaurants use "人均 ¥XXX"; for attractions use "门票: ¥XXX".
+    - "tip": a helpful, insider tip.
+    - For lunch and dinner times (e.g. "中午", "晚上"), you MUST add an item with "k":"美食" near the surrounding activities that matches the food preferences.
+"""
+
+COMPACT_ITEM_EXAMPLE = '{"k":"景点","t":"上午 (09:00-12:00)","p":"中国丝绸博物馆","ds":"深入了解丝绸的古老历史与精美工艺，感受江南的独特文化魅力。","la":30.2284,"lo":120.1419,"tr":"N/A","oh":"周二至周日 09:00-17:00","bk":"官方微信公众号预约","pr":"门票: 免费","tip":"博物馆分为多个展厅，建议至少留出2小时参观。"}'
+
+COMPACT_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
+You are a meticulous, creative, and experienced local travel butler. Your main goal is to generate a personalized and practical travel itinerary in a compact JSON format. You must integrate both attractions and dining experiences seamlessly.
+
+**JSON OUTPUT REQUIREMENTS:**
+1.  The entire response MUST be a single minified JSON object. Do NOT include markdown fences, explanations, or any character outside the JSON.
+2.  The object has the keys "c" (city), "td" (total days, number) and "d" (list of days).
+3.  Each day is an object with the keys "n" (day number) and "i" (list of items).
+""" + COMPACT_ITEM_RULES + """4.  The plan must be logical. Arrange activities to minimize travel time. The `travel_style` should influence the number of activities per day.
+5.  If `Must-Visit POIs` are provided, they MUST be included in the itinerary.
+
+**EXAMPLE of the required JSON structure:**
+{"c":"杭州","td":1,"d":[{"n":1,"i":[""" + COMPACT_ITEM_EXAMPLE + """]}]}
+""",
+    user="""
+Generate a travel plan based on the following user request:
+- City: {city}
+- Duration: {days} days
+- Interests: {interests_str}
+- Travel Style: {travel_style}
+- Must-Visit POIs: {must_visit_pois_str}
+- Budget: {budget}
+- Food Preferences:
+  - Price Range: {food_price_range}
+  - Cuisine/Flavor: {food_cuisine_types}
+  - Dietary Restrictions: {food_dietary_restrictions}
+
+Now, generate the JSON for the user's request.
+""",
+)
+
+COMPACT_DAY_PROMPT_TEMPLATE = PromptTemplate(
+    system="""
+You are a meticulous, creative, and experienced local travel butler. You are writing ONE day of a multi-day itinerary in a compact JSON format. Other days are being written separately, so stay within the plan for this day.
+
+**JSON OUTPUT REQUIREMENTS:**
+1.  The entire response MUST be a single minified JSON object for the requested day. Do NOT include markdown fences, explanations, or any character outside the JSON.
+2.  The object has the keys "n" (day number) and "i" (list of items).
+""" + COMPACT_ITEM_RULES + """3.  Arrange activities to minimize travel time. The `travel_style` should influence the number of activities.
+
+**EXAMPLE of the required JSON structure:**
+{"n":1,"i":[""" + COMPACT_ITEM_EXAMPLE + """]}
+""",
+    user="""
+The user request:
+- City: {city}
+- Duration of the whole trip: {days} days
+- Interests: {interests_str}
+- Travel Style: {travel_style}
+- Budget: {budget}
+- Food Preferences:
+  - Price Range: {food_price_range}
+  - Cuisine/Flavor: {food_cuisine_types}
+  - Dietary Restrictions: {food_dietary_restrictions}
+
+The plan for this day:
+- Day number: {day_number}
+- Area: {area}
+- Key POIs that MUST be included: {day_pois_str}
+- POIs planned for other days (do NOT include these): {other_pois_str}
+
+Now, generate the JSON for day {day_number}.
+""",
+)
@@ -0,0 +1,149 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+from .schemas import ItineraryResponse, ItineraryItem, DayPlan
+from .travel import haversine_km_batch, has_coordinates, compute_day_travel, _with_travel_texts
+from .metrics import ROUTE_DISTANCE_SAVED_KM
+from .config import ROUTE_MEAL_CATEGORIES, TRAVEL_DETOUR_FACTOR
+
+# --- Local Route Optimization ---
+# Reorders the activities of each day to shorten the route, without an LLM call.
+# The time slots of a day stay where they are: meal items (and items without
+# coordinates) are anchored to their slot, and the other activities are
+# permuted over the remaining slots, each taking over the `time` of the slot it
+# moves into. An activity may only move into a slot that lies within its
+# parsed opening hours. Items without coordinates add no distance: the route is
+# measured between the located activities on either side of them.
+
+_TIME_RANGE = re.compile(r"(\d{1,2})[:：](\d{2})\s*[-–—~至到]\s*(?:次日)?(\d{1,2})[:：](\d{2})")
+_ALWAYS_OPEN = ("全天", "24小时", "24 小时", "不限")
+
+# Cost added per activity placed outside its opening hours; large enough that no
+# distance saving outweighs it.
+_WINDOW_PENALTY_KM = 1000.0
+
+Window = Tuple[int, int]  # Minutes after midnight; the end may pass 24:00.
+
+def parse_time_ranges(text: str) -> List[Window]:
+    """All "HH:MM-HH:MM" ranges in a time or opening-hours text, in minutes after midnight."""
+    windows = []
+    for h1, m1, h2, m2 in _TIME_RANGE.findall(text or ""):
+        start, end = int(h1) * 60 + int(m1), int(h2) * 60 + int(m2)
+        if end <= start:
+            end += 24 * 60  # Closes after midnight, e.g. 18:00-02:00.
+        windows.append((start, end))
+    return windows
+
+def opening_windows(item: ItineraryItem) -> Optional[List[Window]]:
+    """Opening hours of an item as windows, or None when it is always open or they cannot be parsed."""
+    if any(marker in item.opening_hours for marker in _ALWAYS_OPEN):
+        return None
+    return parse_time_ranges(item.opening_hours) or None
+
+def fits_slot(item: ItineraryItem, slot_time: str) -> bool:
+    """Whether the slot described by `slot_time` lies within the item's opening hours."""
+    windows = opening_windows(item)
+    slot = parse_time_ranges(slot_time)
+    if windows is None or not slot:
+        return True
+    start, end = slot[0]
+    return any(open_at <= start and end <= close_at for open_at, close_at in windows)
+
+def _is_anchored(item: ItineraryItem) -> bool:
+    return item.category in ROUTE_MEAL_CATEGORIES or not has_coordinates(item)
+
+class _DayRoute:
+    """Distance and window-violation cost of orderings of one day's activities."""
+
+    def __init__(self, activities: Sequence[ItineraryItem]):
+        self.activities = list(activities)
+        self.slots = [a.time for a in self.activities]
+        n = len(self.activities)
+        lats, lons = [a.lat for a in self.activities], [a.lon for a in self.activities]
+        flat = haversine_km_batch(
+            [lats[i] for i in range(n) for _ in range(n)], [lons[i] for i in range(n) for _ in range(n)],
+            lats * n, lons * n,
+        )
+        self.distance = [flat[i * n:(i + 1) * n] for i in range(n)]
+        self.located = [has_coordinates(a) for a in self.activities]
+        self.fits = [[fits_slot(item, slot) for slot in self.slots] for item in self.activities]
+
+    def path_km(self, order: Sequence[int]) -> float:
+        located = [item for item in order if self.located[item]]
+        return sum(self.distance[a][b] for a, b in zip(located, located[1:]))
+
+    def cost(self, order: Sequence[int]) -> float:
+        violations = sum(not self.fits[item][slot] for slot, item in enumerate(order))
+        return self.path_km(order) + violations * _WINDOW_PENALTY_KM
+
+def _nearest_neighbour(route: _DayRoute, free_slots: List[int]) -> List[int]:
+    """Fills the free slots in time order, each with the nearest unplaced activity that fits it."""
+    order = list(range(len(route.activities)))
+    remaining = set(free_slots)
+    for slot in free_slots:
+        # The closest earlier activity with coordinates; earlier slots are already final.
+        previous = next((order[s] for s in range(slot - 1, -1, -1) if route.located[order[s]]), None)
+        def rank(item: int) -> Tuple[bool, float]:
+            distance = route.distance[previous][item] if previous is not None else 0.0
+            return (not route.fits[item][slot], distance)
+        best = min(sorted(remaining), key=rank)
+        order[slot] = best
+        remaining.remove(best)
+    return order
+
+def _two_opt(route: _DayRoute, order: List[int], free_slots: List[int]) -> List[int]:
+    """Reverses runs of free-slot activities (anchors stay put) while that lowers the cost."""
+    best_cost = route.cost(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(free_slots) - 1):
+            for j in range(i + 1, len(free_slots)):
+                candidate = list(order)
+                segment = free_slots[i:j + 1]
+                for slot, item in zip(segment, reversed([order[s] for s in segment])):
+                    candidate[slot] = item
+                cost = route.cost(candidate)
+                if cost < best_cost - 1e-9:
+                    order, best_cost, improved = candidate, cost, True
+    return order
+
+def optimize_day(day_plan: DayPlan) -> Tuple[DayPlan, float, float]:
+    """
+    Returns the reordered day with its route length (km, straight line) before
+    and after. The day is returned unchanged when no ordering is better.
+    """
+    activities = day_plan.activities
+    free_slots = [i for i, a in enumerate(activities) if not _is_anchored(a)]
+    if len(free_slots) < 2:
+        return day_plan, 0.0, 0.0
+    route = _DayRoute(activities)
+    original = list(range(len(activities)))
+    order = _two_opt(route, _nearest_neighbour(route, free_slots), free_slots)
+    before, after = route.path_km(original), route.path_km(order)
+    if route.cost(order) >= route.cost(original) - 1e-9:
+        return day_plan, before, before
+    reordered = [
+        activities[item] if item == slot else activities[item].model_copy(update={"time": route.slots[slot]})
+        for slot, item in enumerate(order)
+    ]
+    reordered_day = DayPlan(day=day_plan.day, activities=reordered)
+    ROUTE_DISTANCE_SAVED_KM.inc((before - after) * TRAVEL_DETOUR_FACTOR)
+    return _with_travel_texts(reordered_day, compute_day_travel(reordered)), before, after
+
+def optimize_itinerary_routes(
+    plan: ItineraryResponse, days: Optional[Sequence[int]] = None
+) -> Tuple[ItineraryResponse, Dict[int, float]]:
+    """
+    Optimizes the activity order of every day (or only `days`) and returns the
+    new itinerary with the road-adjusted kilometres saved per day.
+    """
+    wanted = set(days) if days is not None else None
+    itinerary, saved = [], {}
+    for day_plan in plan.itinerary:
+        if wanted is not None and day_plan.day not in wanted:
+            itinerary.append(day_plan)
+            continue
+        optimized, before, after = optimize_day(day_plan)
+        itinerary.append(optimized)
+        saved[day_plan.day] = round((before - after) * TRAVEL_DETOUR_FACTOR, 3)
+    return plan.model_copy(update={"itinerary": itinerary}), saved
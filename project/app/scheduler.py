@@ -0,0 +1,289 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import itertools
+import openai
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from .config import (
+    LLM_MAX_CONCURRENCY, LLM_OPERATION_LIMITS, LLM_QUEUE_MAX_DEPTH, LLM_RATE_LIMIT_RPM,
+    LLM_RATE_LIMIT_BURST, LLM_RETRY_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+)
+from .metrics import LLM_QUEUE_WAIT_SECONDS
+from .timing import record_stage
+
+logger = logging.getLogger(__name__)
+
+class SchedulerOverloaded(Exception):
+    """Raised when too many LLM calls are already waiting; endpoints answer 503."""
+
+# --- Operation Policies ---
+
+@dataclass(frozen=True)
+class OperationPolicy:
+    priority: int  # Lower runs first.
+    max_concurrency: int
+
+INTERACTIVE, STANDARD, BULK, BACKGROUND = 0, 1, 2, 3
+
+DEFAULT_POLICIES: Dict[str, OperationPolicy] = {
+    "regenerate": OperationPolicy(INTERACTIVE, 32),
+    "batch_regenerate": OperationPolicy(INTERACTIVE, 16),
+    "weather": OperationPolicy(INTERACTIVE, 32),
+    "recalculate": OperationPolicy(STANDARD, 16),
+    "plan": OperationPolicy(BULK, 16),
+    "plan_skeleton": OperationPolicy(BULK, 16),
+    "plan_day": OperationPolicy(BULK, 32),
+    "prefetch": OperationPolicy(BACKGROUND, 4),
+}
+
+def _load_policies() -> Dict[str, OperationPolicy]:
+    policies = dict(DEFAULT_POLICIES)
+    if LLM_OPERATION_LIMITS:
+        try:
+            for operation, limit in json.loads(LLM_OPERATION_LIMITS).items():
+                priority = policies.get(operation, OperationPolicy(STANDARD, limit)).priority
+                policies[operation] = OperationPolicy(priority, int(limit))
+        except (ValueError, AttributeError, TypeError) as e:
+            logger.error(f"Ignoring invalid LLM_OPERATION_LIMITS: {e}")
+    return policies
+
+# --- Rate Limiting ---
+
+class TokenBucket:
+    """Token bucket limiting the request rate sent to the provider."""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                self.waits += 1
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Takes a token only if one is available now and no caller is already waiting for one."""
+        if self._lock.locked():
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+# --- Retry Policy ---
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in _RETRYABLE_STATUS
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Reads Retry-After (or retry-after-ms) from a provider error response."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# --- Scheduler ---
+
+class LLMScheduler:
+    """
+    Admission control for upstream LLM calls. Calls are tagged with an operation;
+    each operation has a priority and a concurrency limit, and a global limit
+    applies on top. Waiting calls are granted slots in priority order; when the
+    wait queue is full new calls fail fast with SchedulerOverloaded. Admitted
+    calls pass a token bucket and are retried with jittered exponential backoff,
+    honouring Retry-After on 429/5xx responses.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        policies: Dict[str, OperationPolicy],
+        max_queue_depth: int,
+        bucket: Optional[TokenBucket] = None,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.policies = policies
+        self.max_queue_depth = max_queue_depth
+        self.bucket = bucket
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._seq = itertools.count()
+        self._waiters: List[tuple] = []  # (priority, seq, operation, future)
+        self._active = 0
+        self._active_by_op: Dict[str, int] = defaultdict(int)
+        self.shed = 0
+        self.retries = 0
+
+    def _policy(self, operation: str) -> OperationPolicy:
+        return self.policies.get(operation) or OperationPolicy(STANDARD, self.max_concurrency)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _dispatch(self) -> None:
+        for waiter in sorted(self._waiters):
+            if self._active >= self.max_concurrency:
+                break
+            _, _, operation, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+                continue
+            if self._active_by_op[operation] >= self._policy(operation).max_concurrency:
+                continue
+            self._waiters.remove(waiter)
+            self._active += 1
+            self._active_by_op[operation] += 1
+            future.set_result(None)
+
+    async def _acquire(self, operation: str) -> None:
+        if len(self._waiters) >= self.max_queue_depth:
+            self.shed += 1
+            raise SchedulerOverloaded(
+                f"LLM queue is full ({len(self._waiters)} waiting); try again shortly."
+            )
+        future = asyncio.get_running_loop().create_future()
+        waiter = (self._policy(operation).priority, next(self._seq), operation, future)
+        self._waiters.append(waiter)
+        started = time.perf_counter()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(operation)  # Granted just as we were cancelled.
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        waited = time.perf_counter() - started
+        LLM_QUEUE_WAIT_SECONDS.observe(waited, operation=operation)
+        record_stage("queue", waited)
+
+    def _release(self, operation: str) -> None:
+        self._active -= 1
+        self._active_by_op[operation] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, operation: str) -> AsyncIterator[None]:
+        """Holds one admission slot (and a rate-limit token) for the duration of the block."""
+        await self._acquire(operation)
+        try:
+            if self.bucket is not None:
+                await self.bucket.acquire()
+            yield
+        finally:
+            self._release(operation)
+
+    def try_acquire(self, operation: str) -> bool:
+        """
+        Takes a slot and a rate-limit token for an optional call (a hedge) only if
+        both are free right now; never queues, and never goes ahead of waiting
+        calls. A granted slot must be given back with release().
+        """
+        if self._waiters or self._active >= self.max_concurrency:
+            return False
+        if self._active_by_op[operation] >= self._policy(operation).max_concurrency:
+            return False
+        if self.bucket is not None and not self.bucket.try_acquire():
+            return False
+        self._active += 1
+        self._active_by_op[operation] += 1
+        return True
+
+    def release(self, operation: str) -> None:
+        self._release(operation)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return backoff
+
+    async def submit(self, operation: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs `fn` under the operation's admission policy, retrying transient failures."""
+        for attempt in range(1, self.max_attempts + 1):
+            async with self.slot(operation):
+                try:
+                    return await fn()
+                except Exception as e:
+                    if not _is_retryable(e) or attempt == self.max_attempts:
+                        raise
+                    delay = self._retry_delay(e, attempt)
+                    logger.warning(
+                        f"LLM call for '{operation}' failed ({type(e).__name__}); "
+                        f"retrying in {delay:.2f}s (attempt {attempt}/{self.max_attempts})"
+                    )
+            # The slot is released while backing off so other calls can proceed.
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "active_by_operation": {op: n for op, n in self._active_by_op.items() if n},
+            "queue_depth": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue_depth": self.max_queue_depth,
+            "shed": self.shed,
+            "retries": self.retries,
+            "rate_limit_waits": self.bucket.waits if self.bucket is not None else 0,
+        }
+
+
+def _build_scheduler() -> LLMScheduler:
+    bucket = None
+    if LLM_RATE_LIMIT_RPM > 0:
+        burst = LLM_RATE_LIMIT_BURST
+        if burst < 1:
+            # A bucket that holds no token can never grant one.
+            logger.error(f"Ignoring invalid LLM_RATE_LIMIT_BURST={burst}; using 1")
+            burst = 1
+        bucket = TokenBucket(LLM_RATE_LIMIT_RPM / 60.0, burst)
+    return LLMScheduler(
+        LLM_MAX_CONCURRENCY, _load_policies(), LLM_QUEUE_MAX_DEPTH, bucket,
+        LLM_RETRY_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    )
+
+llm_scheduler = _build_scheduler()
@@ -1,7 +1,19 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
+import itertools
 import uuid
 
+# --- Item Ids ---
+# Item ids only need to be unique, not unguessable: a random per-process prefix
+# plus a counter is much cheaper than a uuid4 per item.
+
+_ITEM_ID_PREFIX = uuid.uuid4().hex[:12]
+_item_id_counter = itertools.count(1)
+
+def new_item_id() -> str:
+    """Returns a new unique ItineraryItem id."""
+    return f"{_ITEM_ID_PREFIX}-{next(_item_id_counter):x}"
+
 # --- Nested Models ---
 
 class FoodPreferences(BaseModel):
@@ -10,7 +22,7 @@ class FoodPreferences(BaseModel):
     dietary_restrictions: Optional[str] = ""
 
 class ItineraryItem(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), description="Unique ID for the itinerary item")
+    id: str = Field(default_factory=new_item_id, description="Unique ID for the itinerary item")
     category: str = Field(..., description="类别，例如 '景点', '美食', '购物', '体验'")
     time: str
     poi_name: str
@@ -27,6 +39,12 @@ class DayPlan(BaseModel):
     day: int
     activities: List[ItineraryItem]
 
+class DaySkeleton(BaseModel):
+    """Area and key POIs assigned to one day before the day is written in detail."""
+    day: int
+    area: str = ""
+    pois: List[str] = []
+
 # --- API Request Models ---
 
 class PlanRequest(BaseModel):
@@ -47,19 +65,85 @@ class RegenerateRequest(BaseModel):
     budget: str
     food_preferences: FoodPreferences
 
+class BatchRegenerateRequest(BaseModel):
+    city: str
+    day_plans: List[DayPlan] = Field(..., description="The days that contain the activities to replace")
+    activity_ids: List[str] = Field(..., min_length=1, description="Ids of the activities to replace")
+    interests: List[str]
+    travel_style: str
+    budget: str
+    food_preferences: FoodPreferences
+
 class WeatherContingencyRequest(BaseModel):
     city: str
     interests: List[str]
     activity_to_replace: ItineraryItem
 
+class ItineraryWeatherContingencyRequest(BaseModel):
+    itinerary: "ItineraryResponse"
+    interests: List[str] = []
+    days: Optional[List[int]] = Field(
+        default=None, description="Only replace outdoor activities of these days (e.g. today); all days when omitted"
+    )
+
+class PoiImport(BaseModel):
+    city: str
+    name: str
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    category: str = "景点"
+    opening_hours: str = "N/A"
+    price: str = "N/A"
+    booking_info: str = "N/A"
+
 # --- API Response Models ---
 
 class ItineraryResponse(BaseModel):
     city: str
     total_days: int
     itinerary: List[DayPlan]
+    version_id: Optional[str] = Field(
+        default=None,
+        description="Server-issued id of this itinerary version; send it back with edits so only changed legs are recalculated"
+    )
+
+class BatchRegenerateResponse(BaseModel):
+    replacements: Dict[str, ItineraryItem] = Field(..., description="New activities keyed by the id of the activity they replace")
+
+class WeatherContingencyBatchResponse(BaseModel):
+    weather: Optional[str] = Field(default=None, description="Current weather the alternatives were generated for")
+    alternatives: Dict[str, ItineraryItem] = Field(
+        ..., description="Indoor alternatives keyed by the id of the outdoor activity they replace"
+    )
+
+class PlanJobStatus(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: float = Field(..., description="Unix timestamp of the submission")
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    queue_position: Optional[int] = Field(default=None, description="Jobs ahead of this one while queued (0 = next)")
+    error: Optional[str] = None
+    itinerary: Optional[ItineraryResponse] = Field(default=None, description="The generated itinerary once succeeded")
 
 class SaveResponse(BaseModel):
     success: bool
     message: str
-    itinerary_id: Optional[str] = None
\ No newline at end of file
+    itinerary_id: Optional[str] = None
+
+class SavedItinerarySummary(BaseModel):
+    id: str
+    city: str
+    total_days: int
+    created_at: float = Field(..., description="Unix timestamp of when the itinerary was saved")
+
+class NearbyPoi(BaseModel):
+    name: str
+    category: str
+    lat: float
+    lon: float
+    distance_km: float
+    opening_hours: str
+    price: str
+    booking_info: str
+    source: str = Field(..., description="'llm' for POIs seen in generated itineraries, 'import' for bulk imports")
@@ -1,88 +1,302 @@
-import openai
-import xml.etree.ElementTree as ET
 import asyncio
 from .schemas import (
     ItineraryResponse, DayPlan, ItineraryItem, RegenerateRequest, PlanRequest,
-    FoodPreferences, SaveResponse, WeatherContingencyRequest
+    FoodPreferences, SaveResponse, WeatherContingencyRequest, DaySkeleton, BatchRegenerateRequest, new_item_id,
+    ItineraryWeatherContingencyRequest
+)
+from .prompt_template import (
+    PROMPT_TEMPLATE, REGENERATE_PROMPT_TEMPLATE, RECALCULATE_TRAVEL_PROMPT_TEMPLATE, WEATHER_CONTINGENCY_PROMPT_TEMPLATE,
+    SKELETON_PROMPT_TEMPLATE, DAY_PROMPT_TEMPLATE, BATCH_REGENERATE_PROMPT_TEMPLATE,
+    WEATHER_CONTINGENCY_BATCH_PROMPT_TEMPLATE,
+    COMPACT_PROMPT_TEMPLATE, COMPACT_DAY_PROMPT_TEMPLATE, PromptTemplate
 )
-from .prompt_template import PROMPT_TEMPLATE, REGENERATE_PROMPT_TEMPLATE, RECALCULATE_TRAVEL_PROMPT_TEMPLATE, WEATHER_CONTINGENCY_PROMPT_TEMPLATE
-import os
-import uuid
+import re
+import time
 import xml.etree.ElementTree as ET
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
-import requests
+import hashlib
+import sqlite3
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 import logging
+from .config import (
+    PLAN_GENERATION_MODE, PLAN_PARALLEL_CONCURRENCY, PLAN_DAY_MAX_ATTEMPTS,
+    REGENERATE_BATCH_MAX_ITEMS, REGENERATE_BATCH_CONCURRENCY, LLM_COALESCE_ENABLED, LLM_INTERNAL_STREAMING,
+    LLM_STREAM_USAGE, OUTPUT_FORMAT, LLM_JSON_RESPONSE_FORMAT, PLAN_SALVAGE_ENABLED, WEATHER_CONTINGENCY_MAX_ITEMS
+)
+from .llm_client import llm_endpoints, LLMEndpoint
+from .model_routes import model_router
+from .amap import get_weather_data
+from .travel import merge_travel_times
+from .storage import get_itinerary_store
+from .cache import SingleFlight
+from .scheduler import llm_scheduler, SchedulerOverloaded
+from .timing import stage, record_stage, current_endpoint
+from .metrics import record_llm_call, record_llm_error, PLAN_SALVAGE_DAYS, LLM_UPSTREAM_CALLS, LLM_HEDGES
+from .outdoor import outdoor_activities
 
 logger = logging.getLogger(__name__)
 
-# --- Environment and API Key Setup ---
-load_dotenv()
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
-MODEL = os.environ.get("MODEL")
-AMAP_API_KEY = os.environ.get("AMAP_API_KEY")
+class TruncatedCompletion(ValueError):
+    """
+    Raised, for callers that salvage partial output, when a streamed completion
+    breaks off after some content arrived; `partial` holds that content and the
+    upstream error is the cause. Unsalvaged, it is an unusable LLM response.
+    """
+
+    def __init__(self, partial: str, message: str = "completion was interrupted"):
+        super().__init__(message)
+        self.partial = partial
 
 # --- Utility Functions ---
 
-def _get_openai_client_sync():
-    """Initializes and returns the synchronous OpenAI client."""
-    return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
-
-async def _get_openai_client_async():
-    """Initializes and returns the asynchronous OpenAI client."""
-    # Assuming the OpenAI library supports an async client or we use httpx for async calls
-    # For now, let's use the sync client in a thread to avoid blocking
-    # This is a common pattern if the SDK doesn't have a native async client or if it's complex to switch
-    # from openai import AsyncOpenAI # This would be ideal if available and configured
-    # return AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
-    #
-    # Using a placeholder for actual async call for now, or run sync in executor
-    # For simplicity in this step, we'll run the sync call in an executor
-    import asyncio
-    return _get_openai_client_sync() # Placeholder, will be used with run_in_executor
-
-
-async def _call_llm_async(prompt: str) -> str:
-    """Calls the LLM asynchronously and returns its content, with error handling."""
+# Concurrent identical LLM calls are coalesced onto one upstream completion.
+# Callers only share the raw text; each one parses it into its own objects
+# (with its own item ids).
+_llm_flight = SingleFlight()
+
+def _llm_request_key(**params) -> str:
+    """Hashes the final rendered messages plus model parameters of a completion."""
+    canonical = json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def llm_coalescing_stats() -> Dict[str, int]:
+    """Upstream calls made vs. calls served by joining an identical in-flight call."""
+    return _llm_flight.stats()
+
+async def _complete_on(
+    upstream: LLMEndpoint, params: dict, operation: str, route: str,
+    first_token: Optional[asyncio.Event] = None, salvage: bool = False,
+) -> str:
+    """
+    Runs one completion on one endpoint and records its latency, time-to-first-token
+    and token usage. With LLM_INTERNAL_STREAMING the completion is streamed and
+    joined here, which is what makes time-to-first-token measurable (and lets a
+    hedge fire before the answer is complete). `first_token` is set as soon as
+    content starts arriving. A model set by the route replaces the endpoint's.
+    With `salvage`, an interrupted stream raises TruncatedCompletion with what
+    arrived; otherwise the upstream error propagates (and the scheduler retries it).
+    """
+    endpoint, model = current_endpoint(), params.get("model") or upstream.model
+    params = {**params, "model": model}
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    upstream.inflight += 1
     try:
-        # Ideal: client = await _get_openai_client_async()
-        # response = await client.chat.completions.create(...)
-        # For now, running the synchronous call in an executor
-        client = _get_openai_client_sync() # This is sync
-        
-        # Wrap the synchronous SDK call in asyncio.to_thread (Python 3.9+)
-        # or loop.run_in_executor for broader compatibility.
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None, # Uses the default thread pool executor
-            lambda: client.chat.completions.create(
-                model=MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.8,
+        client = upstream.get_client()
+        with stage("llm"):
+            if not LLM_INTERNAL_STREAMING:
+                response = await client.chat.completions.create(**params)
+                first_token_at = time.perf_counter()
+                if first_token is not None:
+                    first_token.set()
+                llm_endpoints.observe_ttft(upstream, route, first_token_at - started)
+                record_llm_call(
+                    endpoint, operation, model, time.perf_counter() - started, usage=response.usage, route=route
+                )
+                LLM_UPSTREAM_CALLS.inc(upstream=upstream.name, outcome="ok")
+                if response.choices[0].finish_reason == "length":
+                    logger.warning(f"Completion for '{operation}' stopped at the max_tokens limit")
+                return response.choices[0].message.content
+            stream = await client.chat.completions.create(
+                **params, stream=True, stream_options={"include_usage": True}
             )
+            usage = None
+            async with stream:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    if chunk.choices[0].delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            llm_endpoints.observe_ttft(upstream, route, first_token_at - started)
+                            if first_token is not None:
+                                first_token.set()
+                        parts.append(chunk.choices[0].delta.content)
+                    if chunk.choices[0].finish_reason == "length":
+                        logger.warning(f"Completion for '{operation}' stopped at the max_tokens limit")
+        record_llm_call(
+            endpoint, operation, model, time.perf_counter() - started,
+            first_token_at - started if first_token_at is not None else None, usage, route,
         )
-        return response.choices[0].message.content
+        LLM_UPSTREAM_CALLS.inc(upstream=upstream.name, outcome="ok")
+        return "".join(parts)
+    except asyncio.CancelledError:
+        # The losing side of a hedge (or an abandoned call).
+        LLM_UPSTREAM_CALLS.inc(upstream=upstream.name, outcome="cancelled")
+        if first_token_at is None:
+            upstream.observe_stall(time.perf_counter() - started)
+        raise
     except Exception as e:
-        print(f"Error communicating with OpenAI API: {e}")
+        record_llm_error(endpoint, operation, model, route)
+        LLM_UPSTREAM_CALLS.inc(upstream=upstream.name, outcome="error")
+        upstream.observe_failure()
+        logger.error(f"Error communicating with OpenAI API ({upstream.name}): {e}")
+        if parts and salvage:
+            # Hand what did arrive to callers that can salvage it (see plan_itinerary).
+            raise TruncatedCompletion("".join(parts), f"completion was interrupted: {e}") from e
         raise
+    finally:
+        upstream.inflight -= 1
 
-# This synchronous version might still be needed if called from non-async code,
-# but FastAPI endpoints should use the async version.
-def _call_llm_sync(prompt: str) -> str:
-    """Synchronous LLM call (original _call_llm renamed)."""
+def _is_well_formed(content: str, json_mode: bool) -> bool:
+    """Whether a completion parses as the XML (or, in JSON mode, the JSON object) its caller expects."""
+    try:
+        if json_mode:
+            json.loads(_clean_json_string(content))
+        else:
+            ET.fromstring(_clean_xml_string(content))
+    except (ValueError, ET.ParseError):
+        return False
+    return True
+
+async def _first_well_formed(tasks: List[asyncio.Task], json_mode: bool) -> str:
+    """
+    Returns the first completion of the primary task or its hedge that is well
+    formed. If neither is, returns whichever content did arrive (so the caller's
+    parser reports it), or re-raises a failure, preferring a salvageable one.
+    """
+    pending, fallback, errors = set(tasks), None, []
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                errors.append(task.exception())
+                continue
+            content = task.result()
+            if _is_well_formed(content, json_mode):
+                LLM_HEDGES.inc(outcome="hedge_won" if task is tasks[-1] else "primary_won")
+                return content
+            fallback = content if fallback is None else fallback
+    LLM_HEDGES.inc(outcome="failed")
+    if fallback is not None:
+        return fallback
+    raise next((e for e in errors if isinstance(e, TruncatedCompletion)), errors[0])
+
+async def _complete_llm(
+    params: dict, operation: str, route: str, json_mode: bool = False, salvage: bool = False
+) -> str:
+    """
+    Runs one completion on the best available endpoint. With several healthy
+    endpoints, a completion that has not produced a first token within the
+    route's hedge delay is started again on another endpoint; the first
+    well-formed answer is kept and the other call is cancelled. The hedge takes
+    its own scheduler slot and rate-limit token, and is skipped when none is free.
+    """
+    primary = llm_endpoints.choose()
+    if not llm_endpoints.can_hedge():
+        return await _complete_on(primary, params, operation, route, salvage=salvage)
+    first_token = asyncio.Event()
+    tasks = [asyncio.create_task(_complete_on(primary, params, operation, route, first_token, salvage))]
+    token_wait = asyncio.create_task(first_token.wait())
     try:
-        client = _get_openai_client_sync()
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.8, 
+        await asyncio.wait(
+            {tasks[0], token_wait}, timeout=llm_endpoints.hedge_delay(route),
+            return_when=asyncio.FIRST_COMPLETED,
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error communicating with OpenAI API: {e}")
-        raise
+        secondary = None if first_token.is_set() or tasks[0].done() else llm_endpoints.choose(exclude=[primary])
+        if secondary is None:
+            return await tasks[0]
+        # The hedge is admitted like any other call, but only if that needs no waiting.
+        if not llm_scheduler.try_acquire(operation):
+            LLM_HEDGES.inc(outcome="skipped")
+            return await tasks[0]
+        logger.info(f"No first token from '{primary.name}' for '{operation}' yet; hedging on '{secondary.name}'")
+        LLM_HEDGES.inc(outcome="fired")
+        hedge = asyncio.create_task(_complete_on(secondary, params, operation, route, salvage=salvage))
+        hedge.add_done_callback(lambda _: llm_scheduler.release(operation))
+        tasks.append(hedge)
+        return await _first_well_formed(tasks, json_mode)
+    finally:
+        token_wait.cancel()
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def _call_llm_async(
+    messages: List[Dict[str, str]], operation: str, json_mode: bool = False, days: Optional[int] = None,
+    salvage: bool = False,
+) -> str:
+    """
+    Calls the LLM through the shared async client and returns its content. The
+    call is admitted by the LLM scheduler under the given operation's priority
+    and concurrency limit, and sent with the model settings of its route (see
+    app/model_routes.py); `days` selects plan-size overrides. `json_mode` asks
+    the provider for a JSON object. `salvage` turns an interrupted stream into
+    TruncatedCompletion instead of a retried upstream error.
+    """
+    route = model_router.route(operation, days)
+    params = dict(messages=messages, **route.params())
+    if json_mode and LLM_JSON_RESPONSE_FORMAT:
+        params["response_format"] = {"type": "json_object"}
+    scheduled = lambda: llm_scheduler.submit(
+        operation, lambda: _complete_llm(params, operation, route.name, json_mode, salvage)
+    )
+    if not LLM_COALESCE_ENABLED:
+        return await scheduled()
+    return await _llm_flight.do(_llm_request_key(**params), scheduled)
+
+async def _stream_llm_async(
+    messages: List[Dict[str, str]], operation: str, days: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Streams the LLM completion from the best available endpoint, yielding content
+    deltas as they arrive. Streams are not hedged: their content already reaches
+    the client.
+    """
+    route = model_router.route(operation, days)
+    async with llm_scheduler.slot(operation):
+        endpoint, upstream = current_endpoint(), llm_endpoints.choose()
+        model = route.model or upstream.model
+        started = time.perf_counter()
+        # Time this generator spent suspended at `yield`, i.e. waiting for the
+        # client to take a delta; it is not upstream time.
+        consumer_seconds = 0.0
+        upstream.inflight += 1
+        try:
+            client = upstream.get_client()
+            extra = {"stream_options": {"include_usage": True}} if LLM_STREAM_USAGE else {}
+            stream = await client.chat.completions.create(
+                **{**route.params(), "model": model},
+                messages=messages,
+                stream=True,
+                **extra,
+            )
+            first_token_at, usage = None, None
+            # Closes the upstream response (and frees its pooled connection) when
+            # the client disconnects and this generator is closed mid-stream.
+            async with stream:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            llm_endpoints.observe_ttft(upstream, route.name, first_token_at - started)
+                        yielded_at = time.perf_counter()
+                        yield chunk.choices[0].delta.content
+                        consumer_seconds += time.perf_counter() - yielded_at
+            record_llm_call(
+                endpoint, operation, model, time.perf_counter() - started - consumer_seconds,
+                first_token_at - started if first_token_at is not None else None, usage, route.name,
+            )
+            LLM_UPSTREAM_CALLS.inc(upstream=upstream.name, outcome="ok")
+        except Exception as e:
+            record_llm_error(endpoint, operation, model, route.name)
+            LLM_UPSTREAM_CALLS.inc(upstream=upstream.name, outcome="error")
+            upstream.observe_failure()
+            logger.error(f"Error streaming from OpenAI API ({upstream.name}): {e}")
+            raise
+        finally:
+            record_stage("llm", time.perf_counter() - started - consumer_seconds)
+            upstream.inflight -= 1
+
+def _render_prompt(template: PromptTemplate, **fields) -> List[Dict[str, str]]:
+    """Renders a prompt template into chat messages, timed as the "prompt" stage."""
+    with stage("prompt"):
+        return template.render(**fields)
 
 def _clean_xml_string(xml_string: str) -> str:
     """Cleans the XML string returned by the LLM."""
@@ -93,72 +307,11 @@ def _clean_xml_string(xml_string: str) -> str:
         xml_string = xml_string.split("?>", 1)[-1].strip()
     return xml_string.strip()
 
-async def _get_adcode_from_city(city_name: str) -> str | None:
-    """Gets the adcode for a given city name using AMap Geocoding API."""
-    if not AMAP_API_KEY:
-        logger.warning("AMAP_API_KEY is not set. Cannot get adcode.")
-        return None
-
-    geocode_url = f"https://restapi.amap.com/v3/geocode/geo?address={city_name}&key={AMAP_API_KEY}"
-    try:
-        response = await asyncio.to_thread(requests.get, geocode_url)
-        response.raise_for_status()
-        data = response.json()
-
-        if data and data["status"] == "1" and data["geocodes"]:
-            # For cities, adcode is usually in the first geocode result
-            return data["geocodes"][0]["adcode"]
-        else:
-            logger.warning(f"Could not get adcode for {city_name}: {data.get('info', 'Unknown error')}")
-            return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching adcode for {city_name}: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"An unexpected error occurred while fetching adcode: {e}")
-        return None
-
-async def get_weather_data(city: str) -> dict:
-    """Fetches current weather data for a given city using AMap Weather API."""
-    if not AMAP_API_KEY:
-        logger.warning("AMAP_API_KEY is not set. Skipping weather data fetching.")
-        return {}
-
-    adcode = await _get_adcode_from_city(city)
-    if not adcode:
-        return {}
-
-    weather_url = f"https://restapi.amap.com/v3/weather/weatherInfo?city={adcode}&key={AMAP_API_KEY}&extensions=base"
-    try:
-        response = await asyncio.to_thread(requests.get, weather_url)
-        response.raise_for_status()
-        data = response.json()
-
-        if data and data["status"] == "1" and data["lives"]:
-            live_weather = data["lives"][0]
-            return {
-                "description": live_weather["weather"],
-                "temp": float(live_weather["temperature"]),
-                "feels_like": float(live_weather["temperature"]), # AMap base weather doesn't have feels_like, use temp
-                "humidity": float(live_weather["humidity"]),
-                "wind_speed": live_weather["windpower"], # AMap returns windpower as string like "≤3"
-                "city_name": live_weather["city"]
-            }
-        else:
-            logger.warning(f"Could not get weather data for {city} (adcode: {adcode}): {data.get('info', 'Unknown error')}")
-            return {}
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching weather data for {city}: {e}")
-        return {}
-    except Exception as e:
-        logger.error(f"An unexpected error occurred while fetching weather data: {e}")
-        return {}
-
 # --- Core Service Functions ---
 
-async def generate_plan_from_llm(request: PlanRequest) -> str:
-    """Generates a travel plan by formatting a prompt and calling the LLM."""
-    prompt = PROMPT_TEMPLATE.format(
+def _plan_prompt_fields(request: PlanRequest) -> dict:
+    """Returns the template fields shared by the plan, skeleton and day prompts."""
+    return dict(
         city=request.city,
         days=request.days,
         interests_str=", ".join(request.interests),
@@ -169,14 +322,172 @@ async def generate_plan_from_llm(request: PlanRequest) -> str:
         food_cuisine_types=", ".join(request.food_preferences.cuisine_types),
         food_dietary_restrictions=request.food_preferences.dietary_restrictions or "无"
     )
-    return await _call_llm_async(prompt)
+
+def _build_plan_prompt(request: PlanRequest, output_format: str = "xml") -> List[Dict[str, str]]:
+    """Renders the full itinerary prompt for a plan request in the given output format."""
+    template = COMPACT_PROMPT_TEMPLATE if output_format == "json" else PROMPT_TEMPLATE
+    return _render_prompt(template, **_plan_prompt_fields(request))
+
+async def generate_plan_from_llm(request: PlanRequest) -> str:
+    """Generates a travel plan in the configured OUTPUT_FORMAT by calling the LLM."""
+    json_mode = OUTPUT_FORMAT == "json"
+    return await _call_llm_async(
+        _build_plan_prompt(request, OUTPUT_FORMAT), "plan", json_mode=json_mode, days=request.days,
+        salvage=PLAN_SALVAGE_ENABLED,
+    )
+
+async def stream_plan_from_llm(request: PlanRequest) -> AsyncIterator[str]:
+    """Generates a travel plan and yields the raw completion text as it streams in."""
+    # Always XML: the streaming endpoint parses <day> elements as they complete.
+    async for chunk in _stream_llm_async(_build_plan_prompt(request, "xml"), "plan", days=request.days):
+        yield chunk
+
+# --- Parallel Plan Generation (skeleton + per-day fan-out) ---
+
+async def generate_plan_skeleton(request: PlanRequest) -> List[DaySkeleton]:
+    """Asks the LLM for a short skeleton assigning an area and key POIs to each day."""
+    messages = _render_prompt(SKELETON_PROMPT_TEMPLATE, **_plan_prompt_fields(request))
+    response = await _call_llm_async(messages, "plan_skeleton", days=request.days)
+    skeleton = {d.day: d for d in parse_skeleton_xml(response)}
+    # Trust our own day numbering: drop extra days and leave missing ones open.
+    return [skeleton.get(n, DaySkeleton(day=n)) for n in range(1, request.days + 1)]
+
+async def generate_day_from_llm(request: PlanRequest, day: DaySkeleton, skeleton: List[DaySkeleton]) -> DayPlan:
+    """Generates the detailed plan for a single day of the skeleton."""
+    other_pois = [poi for other in skeleton if other.day != day.day for poi in other.pois]
+    json_mode = OUTPUT_FORMAT == "json"
+    messages = _render_prompt(
+        COMPACT_DAY_PROMPT_TEMPLATE if json_mode else DAY_PROMPT_TEMPLATE,
+        **_plan_prompt_fields(request),
+        day_number=day.day,
+        area=day.area or "自行选择",
+        day_pois_str=", ".join(day.pois) if day.pois else "无",
+        other_pois_str=", ".join(other_pois) if other_pois else "无",
+    )
+    response = await _call_llm_async(messages, "plan_day", json_mode=json_mode, days=request.days)
+    day_plan = parse_compact_day_json(response) if json_mode else parse_day_xml(response)
+    return day_plan.model_copy(update={"day": day.day})
+
+async def _generate_day_with_retries(
+    request: PlanRequest, day: DaySkeleton, skeleton: List[DaySkeleton], semaphore: asyncio.Semaphore
+) -> DayPlan:
+    last_error = None
+    for attempt in range(1, PLAN_DAY_MAX_ATTEMPTS + 1):
+        async with semaphore:
+            try:
+                return await generate_day_from_llm(request, day, skeleton)
+            except SchedulerOverloaded:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Generating day {day.day} failed (attempt {attempt}/{PLAN_DAY_MAX_ATTEMPTS}): {e}")
+    raise ValueError(f"Failed to generate day {day.day} after {PLAN_DAY_MAX_ATTEMPTS} attempts: {last_error}")
+
+async def iter_plan_days_parallel(request: PlanRequest) -> AsyncIterator[DayPlan]:
+    """
+    Generates the skeleton, then all days concurrently (at most
+    PLAN_PARALLEL_CONCURRENCY at a time), yielding each DayPlan as it completes.
+    Each day is retried on its own; if one still fails, the rest are cancelled.
+    """
+    skeleton = await generate_plan_skeleton(request)
+    semaphore = asyncio.Semaphore(PLAN_PARALLEL_CONCURRENCY)
+    tasks = [
+        asyncio.ensure_future(_generate_day_with_retries(request, day, skeleton, semaphore))
+        for day in skeleton
+    ]
+    try:
+        for next_day in asyncio.as_completed(tasks):
+            yield await next_day
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def generate_plan_parallel(request: PlanRequest) -> ItineraryResponse:
+    """Generates a full itinerary with the skeleton + per-day fan-out strategy."""
+    days = [day_plan async for day_plan in iter_plan_days_parallel(request)]
+    days.sort(key=lambda day_plan: day_plan.day)
+    return ItineraryResponse(city=request.city, total_days=request.days, itinerary=days)
+
+async def resume_plan(request: PlanRequest, days: List[DayPlan]) -> ItineraryResponse:
+    """
+    Completes a plan from the days that were salvaged from a truncated response:
+    only the missing days are generated (concurrently, with the per-day prompt),
+    with the POIs of the salvaged days passed as context so they are not repeated.
+    """
+    kept = {d.day: d for d in days if 1 <= d.day <= request.days}
+    skeleton = [
+        DaySkeleton(day=n, pois=[a.poi_name for a in kept[n].activities]) if n in kept else DaySkeleton(day=n)
+        for n in range(1, request.days + 1)
+    ]
+    missing = [day for day in skeleton if day.day not in kept]
+    PLAN_SALVAGE_DAYS.inc(len(kept), kind="salvaged")
+    PLAN_SALVAGE_DAYS.inc(len(missing), kind="resumed")
+    logger.info(f"Salvaged days {sorted(kept)}; generating only the missing days {[d.day for d in missing]}")
+    semaphore = asyncio.Semaphore(PLAN_PARALLEL_CONCURRENCY)
+    tasks = [
+        asyncio.ensure_future(_generate_day_with_retries(request, day, skeleton, semaphore))
+        for day in missing
+    ]
+    try:
+        for day_plan in await asyncio.gather(*tasks):
+            kept[day_plan.day] = day_plan
+    finally:
+        for task in tasks:
+            task.cancel()
+    return ItineraryResponse(
+        city=request.city, total_days=request.days, itinerary=[kept[n] for n in sorted(kept)]
+    )
+
+async def _salvage_plan(request: PlanRequest, llm_response: str, error: Exception) -> ItineraryResponse:
+    """Recovers from an unparsable or interrupted plan completion, or re-raises `error`."""
+    if not PLAN_SALVAGE_ENABLED:
+        raise error
+    salvage = salvage_compact_days if OUTPUT_FORMAT == "json" else salvage_xml_days
+    days = salvage(llm_response)
+    if not days:
+        raise error
+    logger.warning(f"Plan completion was incomplete ({str(error)[:200]}); salvaging {len(days)} complete day(s)")
+    return await resume_plan(request, days)
+
+async def plan_itinerary(request: PlanRequest, mode: Optional[str] = None) -> ItineraryResponse:
+    """
+    Generates and parses an itinerary using the given (or configured) generation
+    mode. In single mode a truncated or interrupted completion keeps its complete
+    days and only the missing ones are generated (see resume_plan).
+    """
+    mode = mode or PLAN_GENERATION_MODE
+    if mode == "parallel":
+        logger.info(f"Generating {request.days}-day plan in parallel (concurrency {PLAN_PARALLEL_CONCURRENCY})...")
+        return await generate_plan_parallel(request)
+
+    logger.info("Generating itinerary plan from LLM...")
+    try:
+        llm_response = await generate_plan_from_llm(request)
+    except TruncatedCompletion as e:
+        return await _salvage_plan(request, e.partial, e)
+    logger.info(f"Received LLM {OUTPUT_FORMAT.upper()} response snippet: {llm_response[:150]}...")
+
+    try:
+        if OUTPUT_FORMAT == "json":
+            logger.info("Parsing compact JSON...")
+            plan = parse_compact_json(llm_response)
+        else:
+            logger.info("Parsing XML to JSON...")
+            plan = parse_xml_to_json(llm_response)
+    except ValueError as e:
+        return await _salvage_plan(request, llm_response, e)
+    if PLAN_SALVAGE_ENABLED and {d.day for d in plan.itinerary} < set(range(1, request.days + 1)):
+        logger.warning(f"Plan completion has {len(plan.itinerary)} of {request.days} days; generating the rest")
+        return await resume_plan(request, plan.itinerary)
+    return plan
 
 async def regenerate_activity_from_llm(request: RegenerateRequest) -> str:
     """Generates a new activity suggestion by calling the LLM."""
     day_plan_str = "\n".join([f"- {act.poi_name} ({act.time}, {act.category})" for act in request.day_plan.activities])
     activity_to_replace_str = f"- {request.activity_to_replace.poi_name} ({request.activity_to_replace.time}, {request.activity_to_replace.category})"
 
-    prompt = REGENERATE_PROMPT_TEMPLATE.format(
+    messages = _render_prompt(
+        REGENERATE_PROMPT_TEMPLATE,
         city=request.city,
         interests_str=", ".join(request.interests),
         travel_style=request.travel_style,
@@ -187,24 +498,219 @@ async def regenerate_activity_from_llm(request: RegenerateRequest) -> str:
         day_plan_str=day_plan_str,
         activity_to_replace_str=activity_to_replace_str
     )
-    return await _call_llm_async(prompt)
+    return await _call_llm_async(messages, "regenerate")
+
+# --- Batch Activity Regeneration ---
+
+def _normalize_poi_name(name: str) -> str:
+    return "".join(name.split()).lower()
+
+def _format_day_plans(day_plans: List[DayPlan]) -> str:
+    return "\n".join(
+        f"Day {day_plan.day}:\n" + "\n".join(f"- {act.poi_name} ({act.time}, {act.category})" for act in day_plan.activities)
+        for day_plan in day_plans
+    )
+
+def _resolve_regenerate_targets(request: BatchRegenerateRequest) -> List[Tuple[DayPlan, ItineraryItem]]:
+    """Maps the requested activity ids to (day, activity) pairs, keeping request order."""
+    by_id = {act.id: (day_plan, act) for day_plan in request.day_plans for act in day_plan.activities}
+    activity_ids = list(dict.fromkeys(request.activity_ids))
+    missing = [activity_id for activity_id in activity_ids if activity_id not in by_id]
+    if missing:
+        raise LookupError(f"Activities not found in day_plans: {', '.join(missing)}")
+    return [by_id[activity_id] for activity_id in activity_ids]
+
+async def _regenerate_batch_chunk(
+    request: BatchRegenerateRequest, targets: List[Tuple[DayPlan, ItineraryItem]], excluded_names: List[str],
+    operation: str = "batch_regenerate",
+) -> Dict[str, ItineraryItem]:
+    targets_str = "\n".join(
+        f"[{ref}] Day {day_plan.day} - {act.poi_name} ({act.time}, {act.category})"
+        for ref, (day_plan, act) in enumerate(targets, start=1)
+    )
+    messages = _render_prompt(
+        BATCH_REGENERATE_PROMPT_TEMPLATE,
+        city=request.city,
+        interests_str=", ".join(request.interests),
+        travel_style=request.travel_style,
+        budget=request.budget,
+        food_price_range=request.food_preferences.price_range,
+        food_cuisine_types=", ".join(request.food_preferences.cuisine_types),
+        food_dietary_restrictions=request.food_preferences.dietary_restrictions or "无",
+        day_plans_str=_format_day_plans(request.day_plans),
+        excluded_str="\n".join(f"- {name}" for name in excluded_names) if excluded_names else "无",
+        targets_str=targets_str,
+    )
+    items = parse_batch_items_xml(await _call_llm_async(messages, operation))
+    replacements = {}
+    for ref, (_, act) in enumerate(targets, start=1):
+        item = items.get(str(ref))
+        if item is not None:
+            replacements[act.id] = item.model_copy(
+                update={"time": act.time, "travel_from_previous": act.travel_from_previous}
+            )
+    return replacements
+
+def _conflicting_targets(
+    request: BatchRegenerateRequest, targets: List[Tuple[DayPlan, ItineraryItem]], replacements: Dict[str, ItineraryItem]
+) -> List[str]:
+    """Returns ids whose replacement is missing or duplicates another item of the plan."""
+    target_ids = {act.id for _, act in targets}
+    seen = {
+        _normalize_poi_name(act.poi_name)
+        for day_plan in request.day_plans for act in day_plan.activities if act.id not in target_ids
+    }
+    conflicts = []
+    for _, act in targets:
+        item = replacements.get(act.id)
+        name = _normalize_poi_name(item.poi_name) if item is not None else None
+        if name is None or name in seen:
+            conflicts.append(act.id)
+        else:
+            seen.add(name)
+    return conflicts
+
+async def regenerate_activities_batch_from_llm(request: BatchRegenerateRequest) -> Dict[str, ItineraryItem]:
+    """
+    Generates replacements for several activities, keyed by the replaced id.
+    Up to REGENERATE_BATCH_MAX_ITEMS targets share one prompt; larger batches are
+    split into chunks run concurrently. Since concurrent chunks cannot see each
+    other's picks, duplicate or missing replacements get one more targeted pass.
+    """
+    targets = _resolve_regenerate_targets(request)
+    semaphore = asyncio.Semaphore(REGENERATE_BATCH_CONCURRENCY)
+
+    async def run_chunks(chunk_targets, excluded_names):
+        async def run(chunk):
+            async with semaphore:
+                return await _regenerate_batch_chunk(request, chunk, excluded_names)
+        chunks = [
+            chunk_targets[i:i + REGENERATE_BATCH_MAX_ITEMS]
+            for i in range(0, len(chunk_targets), REGENERATE_BATCH_MAX_ITEMS)
+        ]
+        merged = {}
+        for result in await asyncio.gather(*(run(chunk) for chunk in chunks)):
+            merged.update(result)
+        return merged
+
+    replacements = await run_chunks(targets, [])
+    conflicts = _conflicting_targets(request, targets, replacements)
+    if conflicts:
+        logger.info(f"Retrying {len(conflicts)} missing or duplicate replacement(s)...")
+        kept = [item.poi_name for activity_id, item in replacements.items() if activity_id not in conflicts]
+        retry_targets = [(day_plan, act) for day_plan, act in targets if act.id in conflicts]
+        replacements.update(await run_chunks(retry_targets, kept))
+        remaining = _conflicting_targets(request, targets, replacements)
+        missing = [activity_id for activity_id in remaining if activity_id not in replacements]
+        if missing:
+            raise ValueError(f"LLM returned no replacement for activities: {', '.join(missing)}")
+        if remaining:
+            logger.warning(f"Replacements still duplicate other items after retry: {remaining}")
+
+    return {act.id: replacements[act.id] for _, act in targets}
+
+async def prefetch_replacements_from_llm(request: BatchRegenerateRequest) -> Dict[str, ItineraryItem]:
+    """
+    Speculative replacements for the requested activities, generated under the
+    background "prefetch" operation. Chunks run one after another so later ones
+    can exclude earlier picks; there is no retry pass, and missing or duplicate
+    replacements are simply left out.
+    """
+    targets = _resolve_regenerate_targets(request)
+    replacements: Dict[str, ItineraryItem] = {}
+    for i in range(0, len(targets), REGENERATE_BATCH_MAX_ITEMS):
+        excluded = [item.poi_name for item in replacements.values()]
+        replacements.update(await _regenerate_batch_chunk(
+            request, targets[i:i + REGENERATE_BATCH_MAX_ITEMS], excluded, operation="prefetch"
+        ))
+    conflicts = set(_conflicting_targets(request, targets, replacements))
+    return {activity_id: item for activity_id, item in replacements.items() if activity_id not in conflicts}
+
+def _weather_info(weather_data: Optional[dict], city: str) -> str:
+    if not weather_data:
+        return ""
+    return (
+        f"\n- Current Weather in {weather_data.get('city_name', city)}: {weather_data.get('description')}, "
+        f"Temperature: {weather_data.get('temp')}°C, Feels like: {weather_data.get('feels_like')}°C."
+    )
 
 async def generate_weather_contingency_plan(request: WeatherContingencyRequest, weather_data: dict = None) -> str:
     """Generates a weather contingency plan for a single activity."""
     activity = request.activity_to_replace
-    weather_info = "" 
-    if weather_data:
-        weather_info = f"\n- Current Weather in {weather_data.get('city_name', request.city)}: {weather_data.get('description')}, Temperature: {weather_data.get('temp')}°C, Feels like: {weather_data.get('feels_like')}°C."
-
-    prompt = WEATHER_CONTINGENCY_PROMPT_TEMPLATE.format(
+    messages = _render_prompt(
+        WEATHER_CONTINGENCY_PROMPT_TEMPLATE,
         city=request.city,
         interests_str=", ".join(request.interests),
         poi_name=activity.poi_name,
         time=activity.time,
         description=activity.description,
-        weather_info=weather_info
+        weather_info=_weather_info(weather_data, request.city)
     )
-    return await _call_llm_async(prompt)
+    return await _call_llm_async(messages, "weather")
+
+async def _weather_contingency_chunk(
+    request: ItineraryWeatherContingencyRequest, targets: List[Tuple[DayPlan, ItineraryItem]], weather_info: str
+) -> Dict[str, ItineraryItem]:
+    targets_str = "\n".join(
+        f"[{ref}] Day {day_plan.day} - {act.poi_name} ({act.time}, {act.category})"
+        for ref, (day_plan, act) in enumerate(targets, start=1)
+    )
+    messages = _render_prompt(
+        WEATHER_CONTINGENCY_BATCH_PROMPT_TEMPLATE,
+        city=request.itinerary.city,
+        interests_str=", ".join(request.interests) if request.interests else "无",
+        weather_info=weather_info,
+        day_plans_str=_format_day_plans(request.itinerary.itinerary),
+        targets_str=targets_str,
+    )
+    items = parse_batch_items_xml(await _call_llm_async(messages, "weather"))
+    alternatives = {}
+    for ref, (_, act) in enumerate(targets, start=1):
+        item = items.get(str(ref))
+        if item is not None:
+            alternatives[act.id] = item.model_copy(
+                update={"time": act.time, "travel_from_previous": act.travel_from_previous}
+            )
+    return alternatives
+
+async def generate_itinerary_weather_contingency(
+    request: ItineraryWeatherContingencyRequest, weather_data: dict = None
+) -> Dict[str, ItineraryItem]:
+    """
+    Generates indoor alternatives for every outdoor activity of an itinerary,
+    keyed by the replaced id. Outdoor activities are picked locally (see
+    app/outdoor.py) and answered by one prompt per WEATHER_CONTINGENCY_MAX_ITEMS
+    activities; activities the LLM skipped get one more targeted pass.
+    """
+    targets = outdoor_activities(request.itinerary, request.days)
+    if not targets:
+        return {}
+    weather_info = _weather_info(weather_data, request.itinerary.city)
+    semaphore = asyncio.Semaphore(REGENERATE_BATCH_CONCURRENCY)
+
+    async def run_chunks(chunk_targets):
+        async def run(chunk):
+            async with semaphore:
+                return await _weather_contingency_chunk(request, chunk, weather_info)
+        chunks = [
+            chunk_targets[i:i + WEATHER_CONTINGENCY_MAX_ITEMS]
+            for i in range(0, len(chunk_targets), WEATHER_CONTINGENCY_MAX_ITEMS)
+        ]
+        merged = {}
+        for result in await asyncio.gather(*(run(chunk) for chunk in chunks)):
+            merged.update(result)
+        return merged
+
+    logger.info(f"Generating indoor alternatives for {len(targets)} outdoor activities...")
+    alternatives = await run_chunks(targets)
+    missing = [(day_plan, act) for day_plan, act in targets if act.id not in alternatives]
+    if missing:
+        logger.info(f"Retrying {len(missing)} activities without an alternative...")
+        alternatives.update(await run_chunks(missing))
+    skipped = [act.id for _, act in targets if act.id not in alternatives]
+    if skipped:
+        logger.warning(f"LLM returned no indoor alternative for activities: {skipped}")
+    return {act.id: alternatives[act.id] for _, act in targets if act.id in alternatives}
 
 # --- Itinerary to XML Conversion for Recalculation ---
 def _itinerary_response_to_xml_string(plan: ItineraryResponse) -> str:
@@ -244,7 +750,8 @@ async def recalculate_itinerary_travel_times(plan: ItineraryResponse) -> str:
     """
     itinerary_xml_str = _itinerary_response_to_xml_string(plan)
     
-    prompt = RECALCULATE_TRAVEL_PROMPT_TEMPLATE.format(
+    messages = _render_prompt(
+        RECALCULATE_TRAVEL_PROMPT_TEMPLATE,
         city=plan.city,
         total_days=plan.total_days,
         itinerary_xml_string=itinerary_xml_str
@@ -252,85 +759,256 @@ async def recalculate_itinerary_travel_times(plan: ItineraryResponse) -> str:
     
     # The LLM is expected to return a full XML itinerary string with updated travel times.
     # This string will then be parsed by parse_xml_to_json by the caller in main.py
-    return await _call_llm_async(prompt)
+    # Sized by the days actually sent, which may be a subset of the plan.
+    return await _call_llm_async(messages, "recalculate", days=len(plan.itinerary))
+
+async def recalculate_travel_times_with_llm(
+    plan: ItineraryResponse, changed: Optional[Dict[int, Set[int]]] = None
+) -> ItineraryResponse:
+    """
+    Recalculates travel times with the LLM, sending only the days listed in
+    `changed` (all days when None) and merging the changed legs back into `plan`.
+    """
+    days = plan.itinerary if changed is None else [d for d in plan.itinerary if d.day in changed]
+    if not days:
+        return plan
+    subset = plan.model_copy(update={"itinerary": days})
+    xml_response = await recalculate_itinerary_travel_times(subset)
+    return merge_travel_times(plan, parse_xml_to_json(xml_response), changed)
 
 # --- XML Parsing Functions ---
 
-def _parse_itinerary_item_node(item_node: ET.Element) -> ItineraryItem:
-    """Parses a single <item> XML node into an ItineraryItem object."""
-    def get_text(element_name: str, default="N/A"): # Helper to avoid repetition
-        element = item_node.find(element_name)
-        return element.text.strip() if element is not None and element.text else default
-
-    return ItineraryItem(
-        id=str(uuid.uuid4()), # Generate a unique ID for each item
-        category=get_text("category", "景点"),
-        time=get_text("time"),
-        poi_name=get_text("poi_name"),
-        description=get_text("description"),
-        lat=float(get_text("lat", "0.0")),
-        lon=float(get_text("lon", "0.0")),
-        travel_from_previous=get_text("travel_from_previous"),
-        opening_hours=get_text("opening_hours"),
-        booking_info=get_text("booking_info"),
-        price=get_text("price"),
-        local_tip=get_text("local_tip"),
-    )
+# Default text of every <item> child element; missing or empty elements take it.
+_ITEM_FIELD_DEFAULTS = {
+    "category": "景点", "time": "N/A", "poi_name": "N/A", "description": "N/A", "lat": "0.0", "lon": "0.0",
+    "travel_from_previous": "N/A", "opening_hours": "N/A", "booking_info": "N/A", "price": "N/A", "local_tip": "N/A",
+}
+
+def _item_fields(item_node: ET.Element) -> dict:
+    """
+    Extracts the fields of a single <item> XML node, ready for ItineraryItem
+    validation, in one pass over its children. Children are visited last to
+    first so that, as with find(), the first occurrence of a tag wins.
+    """
+    fields = dict(_ITEM_FIELD_DEFAULTS)
+    for child in reversed(item_node):
+        default = _ITEM_FIELD_DEFAULTS.get(child.tag)
+        if default is not None:
+            fields[child.tag] = child.text.strip() if child.text else default
+    fields["lat"] = float(fields["lat"])
+    fields["lon"] = float(fields["lon"])
+    fields["id"] = new_item_id()
+    return fields
+
+# Each parser below is timed as three stages: "clean" (stripping markdown and
+# prologues), "parse" (XML parsing and field extraction) and "validate"
+# (building the pydantic models). Field extraction produces plain dicts so that
+# each document is validated by a single pydantic call; the endpoints then
+# serialize the models directly instead of validating them again.
 
 def parse_xml_to_json(xml_string: str) -> ItineraryResponse:
     """Parses the full itinerary XML string into an ItineraryResponse object."""
     try:
-        cleaned_xml = _clean_xml_string(xml_string)
-        root = ET.fromstring(cleaned_xml)
-
-        itinerary_data = {
-            "city": root.attrib.get("city"),
-            "total_days": int(root.attrib.get("total_days")),
-            "itinerary": []
-        }
-
-        for day_node in root.findall("day"):
-            day_plan_data = {
-                "day": int(day_node.attrib.get("number")),
-                "activities": []
+        with stage("clean"):
+            cleaned_xml = _clean_xml_string(xml_string)
+        with stage("parse"):
+            root = ET.fromstring(cleaned_xml)
+            itinerary_data = {
+                "city": root.attrib.get("city"),
+                "total_days": int(root.attrib.get("total_days")),
+                "itinerary": [
+                    {
+                        "day": int(day_node.attrib.get("number")),
+                        "activities": [_item_fields(item_node) for item_node in day_node.findall("item")],
+                    }
+                    for day_node in root.findall("day")
+                ],
             }
-            for item_node in day_node.findall("item"):
-                day_plan_data["activities"].append(_parse_itinerary_item_node(item_node))
-            itinerary_data["itinerary"].append(DayPlan(**day_plan_data))
-
-        return ItineraryResponse(**itinerary_data)
+        with stage("validate"):
+            return ItineraryResponse(**itinerary_data)
     except (ET.ParseError, ValueError, TypeError, KeyError) as e:
         raise ValueError(f"Failed to parse LLM XML output: {e}. Received XML (first 500 chars): {xml_string[:500]}...")
 
+def parse_day_xml(xml_string: str) -> DayPlan:
+    """Parses a single <day> XML string produced by the per-day prompt."""
+    try:
+        with stage("clean"):
+            cleaned_xml = _clean_xml_string(xml_string)
+        with stage("parse"):
+            day_node = ET.fromstring(cleaned_xml)
+            if day_node.tag != "day":
+                raise ValueError(f"expected <day> root element, got <{day_node.tag}>")
+            day = int(day_node.attrib.get("number"))
+            activities = [_item_fields(item_node) for item_node in day_node.findall("item")]
+        with stage("validate"):
+            return DayPlan(day=day, activities=activities)
+    except (ET.ParseError, ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Failed to parse day XML from LLM: {e}. Received XML (first 500 chars): {xml_string[:500]}...")
+
+# --- Compact JSON Parsing Functions (OUTPUT_FORMAT=json) ---
+
+# Short key used by the compact prompts -> ItineraryItem field.
+_COMPACT_ITEM_KEYS = {
+    "k": "category", "t": "time", "p": "poi_name", "ds": "description", "la": "lat", "lo": "lon",
+    "tr": "travel_from_previous", "oh": "opening_hours", "bk": "booking_info", "pr": "price", "tip": "local_tip",
+}
+
+def _clean_json_string(json_string: str) -> str:
+    """Strips markdown fences and any text around the outermost JSON object."""
+    start, end = json_string.find("{"), json_string.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object found")
+    return json_string[start:end + 1]
+
+def _compact_item_fields(item: dict) -> dict:
+    """Maps a short-key item to ItineraryItem fields, with the same defaults as the XML parser."""
+    fields = {"id": new_item_id()}
+    for short, name in _COMPACT_ITEM_KEYS.items():
+        value = item.get(short, item.get(name))
+        if name in ("lat", "lon"):
+            fields[name] = float(value) if value not in (None, "") else 0.0
+        elif name == "category":
+            fields[name] = str(value).strip() if value else "景点"
+        else:
+            fields[name] = str(value).strip() if value not in (None, "") else "N/A"
+    return fields
+
+def _compact_day_fields(day: dict) -> dict:
+    return {"day": int(day["n"]), "activities": [_compact_item_fields(item) for item in day.get("i", [])]}
+
+def parse_compact_json(json_string: str) -> ItineraryResponse:
+    """Parses the compact short-key JSON itinerary into an ItineraryResponse object."""
+    try:
+        with stage("clean"):
+            cleaned_json = _clean_json_string(json_string)
+        with stage("parse"):
+            root = json.loads(cleaned_json)
+            itinerary_data = {
+                "city": root["c"],
+                "total_days": int(root["td"]),
+                "itinerary": [_compact_day_fields(day) for day in root.get("d", [])],
+            }
+        with stage("validate"):
+            return ItineraryResponse(**itinerary_data)
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"Failed to parse LLM JSON output: {e}. Received JSON (first 500 chars): {json_string[:500]}...")
+
+def parse_compact_day_json(json_string: str) -> DayPlan:
+    """Parses a single compact JSON day produced by the per-day prompt."""
+    try:
+        with stage("clean"):
+            cleaned_json = _clean_json_string(json_string)
+        with stage("parse"):
+            day_data = _compact_day_fields(json.loads(cleaned_json))
+        with stage("validate"):
+            return DayPlan(**day_data)
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"Failed to parse day JSON from LLM: {e}. Received JSON (first 500 chars): {json_string[:500]}...")
+
+# --- Truncated Output Salvage ---
+# A completion cut off by max_tokens or a dropped connection still contains
+# every day it finished; these return those complete days and ignore the rest.
+
+def salvage_xml_days(xml_string: str) -> List[DayPlan]:
+    """Returns the complete <day> elements of a possibly truncated itinerary XML string."""
+    parser = ET.XMLPullParser(events=("end",))
+    days = []
+    try:
+        parser.feed(_clean_xml_string(xml_string))
+        for _, elem in parser.read_events():
+            if elem.tag != "day":
+                continue
+            try:
+                days.append(DayPlan(
+                    day=int(elem.attrib.get("number")),
+                    activities=[_item_fields(item_node) for item_node in elem.findall("item")],
+                ))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Dropping unparsable day from truncated XML: {e}")
+    except ET.ParseError:
+        pass  # Malformed from here on; keep the days read so far.
+    return days
+
+_COMPACT_DAYS_START = re.compile(r'"d"\s*:\s*\[')
+
+def salvage_compact_days(json_string: str) -> List[DayPlan]:
+    """Returns the complete day objects of a possibly truncated compact JSON itinerary."""
+    match = _COMPACT_DAYS_START.search(json_string)
+    if match is None:
+        return []
+    decoder, pos, days = json.JSONDecoder(), match.end(), []
+    while True:
+        while pos < len(json_string) and json_string[pos] in " \t\r\n,":
+            pos += 1
+        try:
+            day, pos = decoder.raw_decode(json_string, pos)
+        except ValueError:
+            break  # End of the array or the truncation point.
+        try:
+            days.append(DayPlan(**_compact_day_fields(day)))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning(f"Dropping unparsable day from truncated JSON: {e}")
+    return days
+
+def parse_skeleton_xml(xml_string: str) -> List[DaySkeleton]:
+    """Parses the <skeleton> XML string into per-day areas and POIs."""
+    try:
+        with stage("clean"):
+            cleaned_xml = _clean_xml_string(xml_string)
+        with stage("parse"):
+            root = ET.fromstring(cleaned_xml)
+            skeleton = []
+            for day_node in root.findall("day"):
+                area = day_node.find("area")
+                skeleton.append(DaySkeleton(
+                    day=int(day_node.attrib.get("number")),
+                    area=area.text.strip() if area is not None and area.text else "",
+                    pois=[poi.text.strip() for poi in day_node.findall("poi") if poi.text and poi.text.strip()],
+                ))
+            return skeleton
+    except (ET.ParseError, ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Failed to parse skeleton XML from LLM: {e}. Received XML (first 500 chars): {xml_string[:500]}...")
+
+def parse_batch_items_xml(xml_string: str) -> Dict[str, ItineraryItem]:
+    """Parses an <items> XML string into ItineraryItems keyed by their `ref` attribute."""
+    try:
+        with stage("clean"):
+            cleaned_xml = _clean_xml_string(xml_string)
+        with stage("parse"):
+            root = ET.fromstring(cleaned_xml)
+            item_nodes = [root] if root.tag == "item" else root.findall("item")
+            fields = {
+                item_node.attrib["ref"].strip(): _item_fields(item_node)
+                for item_node in item_nodes if item_node.attrib.get("ref")
+            }
+        with stage("validate"):
+            return {ref: ItineraryItem(**item) for ref, item in fields.items()}
+    except (ET.ParseError, ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Failed to parse batch items XML from LLM: {e}. Received XML (first 500 chars): {xml_string[:500]}...")
+
 def parse_single_activity_xml(xml_string: str) -> ItineraryItem:
     """Parses a single <item> XML string for regeneration purposes."""
     try:
-        cleaned_xml = _clean_xml_string(xml_string)
-        item_node = ET.fromstring(cleaned_xml)
-        return _parse_itinerary_item_node(item_node)
+        with stage("clean"):
+            cleaned_xml = _clean_xml_string(xml_string)
+        with stage("parse"):
+            fields = _item_fields(ET.fromstring(cleaned_xml))
+        with stage("validate"):
+            return ItineraryItem(**fields)
     except (ET.ParseError, ValueError, TypeError, KeyError) as e:
         raise ValueError(f"Failed to parse single item XML from LLM: {e}. Received XML: {xml_string}")
 
 # --- Itinerary Persistence ---
 
-ITINERARY_STORAGE_PATH = "./saved_itineraries"
-
-def save_itinerary_to_file(itinerary: ItineraryResponse) -> SaveResponse:
-    """Saves a full itinerary to a JSON file."""
+async def save_itinerary_to_store(itinerary: ItineraryResponse) -> SaveResponse:
+    """Saves a full itinerary to the configured itinerary store."""
     try:
-        if not os.path.exists(ITINERARY_STORAGE_PATH):
-            os.makedirs(ITINERARY_STORAGE_PATH)
-        
-        itinerary_id = str(uuid.uuid4())
-        file_path = os.path.join(ITINERARY_STORAGE_PATH, f"{itinerary_id}.json")
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(itinerary.model_dump(), f, ensure_ascii=False, indent=4)
-            
+        with stage("persist"):
+            itinerary_id = await get_itinerary_store().save(itinerary)
         return SaveResponse(success=True, message="行程保存成功！", itinerary_id=itinerary_id)
-    except IOError as e:
-        print(f"Error saving itinerary to file: {e}")
-        return SaveResponse(success=False, message=f"文件写入失败: {e}")
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Error saving itinerary to store: {e}")
+        return SaveResponse(success=False, message=f"存储写入失败: {e}")
     except Exception as e:
-        print(f"An unexpected error occurred during save: {e}")
+        logger.error(f"An unexpected error occurred during save: {e}")
         return SaveResponse(success=False, message=f"发生未知错误: {e}")
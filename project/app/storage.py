@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional
+from .schemas import ItineraryResponse, SavedItinerarySummary
+from .config import ITINERARY_STORE_BACKEND, ITINERARY_DB_PATH, ITINERARY_STORAGE_PATH
+
+logger = logging.getLogger(__name__)
+
+# --- Storage Backend Interface ---
+
+class ItineraryStore(ABC):
+    """
+    Persistence backend for saved itineraries. The public methods are async and
+    keep blocking I/O off the event loop; implementations provide the blocking
+    `_save`, `_load` and `_list` methods, which run in a worker thread.
+    """
+
+    async def save(self, itinerary: ItineraryResponse) -> str:
+        itinerary_id = str(uuid.uuid4())
+        await asyncio.to_thread(self._save, itinerary_id, itinerary, time.time())
+        return itinerary_id
+
+    async def load(self, itinerary_id: str) -> Optional[ItineraryResponse]:
+        return await asyncio.to_thread(self._load, itinerary_id)
+
+    async def list(
+        self, city: Optional[str] = None, limit: int = 20, before: Optional[float] = None
+    ) -> List[SavedItinerarySummary]:
+        return await asyncio.to_thread(self._list, city, limit, before)
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def _save(self, itinerary_id: str, itinerary: ItineraryResponse, created_at: float) -> None: ...
+
+    @abstractmethod
+    def _load(self, itinerary_id: str) -> Optional[ItineraryResponse]: ...
+
+    @abstractmethod
+    def _list(self, city: Optional[str], limit: int, before: Optional[float]) -> List[SavedItinerarySummary]: ...
+
+
+def _serialize(itinerary: ItineraryResponse) -> bytes:
+    # version_id only makes sense for the session that issued it.
+    return zlib.compress(itinerary.model_dump_json(exclude={"version_id"}).encode("utf-8"))
+
+def _deserialize(payload: bytes) -> ItineraryResponse:
+    return ItineraryResponse.model_validate_json(zlib.decompress(payload))
+
+
+# --- SQLite Backend (default) ---
+
+class SQLiteItineraryStore(ItineraryStore):
+    """
+    Stores compressed itineraries in one SQLite database in WAL mode, indexed by
+    id, city and creation time, so lookups and listings stay flat as it grows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS itineraries ("
+            " id TEXT PRIMARY KEY, city TEXT NOT NULL, total_days INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, payload BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_itineraries_created ON itineraries(created_at)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_itineraries_city_created ON itineraries(city, created_at)"
+        )
+        self._conn.commit()
+
+    def _save(self, itinerary_id: str, itinerary: ItineraryResponse, created_at: float) -> None:
+        payload = _serialize(itinerary)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO itineraries (id, city, total_days, created_at, payload) VALUES (?, ?, ?, ?, ?)",
+                (itinerary_id, itinerary.city, itinerary.total_days, created_at, payload),
+            )
+            self._conn.commit()
+
+    def _load(self, itinerary_id: str) -> Optional[ItineraryResponse]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM itineraries WHERE id = ?", (itinerary_id,)
+            ).fetchone()
+        return _deserialize(row[0]) if row is not None else None
+
+    def _list(self, city: Optional[str], limit: int, before: Optional[float]) -> List[SavedItinerarySummary]:
+        query = "SELECT id, city, total_days, created_at FROM itineraries"
+        conditions, params = [], []
+        if city:
+            conditions.append("city = ?")
+            params.append(city)
+        if before is not None:
+            conditions.append("created_at < ?")
+            params.append(before)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            SavedItinerarySummary(id=row[0], city=row[1], total_days=row[2], created_at=row[3])
+            for row in rows
+        ]
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- File Backend ---
+
+class FileItineraryStore(ItineraryStore):
+    """
+    One compact JSON file per itinerary, sharded into subdirectories by id prefix
+    so no single directory grows unbounded. Listing has no index and scans every
+    file; prefer the SQLite backend when listings matter.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, itinerary_id: str) -> str:
+        return os.path.join(self.root, itinerary_id[:2], f"{itinerary_id}.json")
+
+    def _save(self, itinerary_id: str, itinerary: ItineraryResponse, created_at: float) -> None:
+        path = self._path(itinerary_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = {"created_at": created_at, "itinerary": itinerary.model_dump(exclude={"version_id"})}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, separators=(",", ":"))
+
+    def _read(self, path: str) -> dict:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load(self, itinerary_id: str) -> Optional[ItineraryResponse]:
+        if os.path.basename(itinerary_id) != itinerary_id:
+            return None
+        try:
+            return ItineraryResponse(**self._read(self._path(itinerary_id))["itinerary"])
+        except FileNotFoundError:
+            return None
+
+    def _list(self, city: Optional[str], limit: int, before: Optional[float]) -> List[SavedItinerarySummary]:
+        summaries = []
+        if not os.path.isdir(self.root):
+            return summaries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".json"):
+                    continue
+                record = self._read(entry.path)
+                itinerary = record["itinerary"]
+                if city and itinerary["city"] != city:
+                    continue
+                if before is not None and record["created_at"] >= before:
+                    continue
+                summaries.append(SavedItinerarySummary(
+                    id=entry.name[:-len(".json")], city=itinerary["city"],
+                    total_days=itinerary["total_days"], created_at=record["created_at"],
+                ))
+        summaries.sort(key=lambda summary: summary.created_at, reverse=True)
+        return summaries[:limit]
+
+
+# --- Store Lifecycle ---
+
+_store: ItineraryStore | None = None
+
+def _build_store() -> ItineraryStore:
+    if ITINERARY_STORE_BACKEND == "file":
+        return FileItineraryStore(ITINERARY_STORAGE_PATH)
+    if ITINERARY_STORE_BACKEND != "sqlite":
+        logger.warning(f"Unknown ITINERARY_STORE_BACKEND '{ITINERARY_STORE_BACKEND}', using sqlite.")
+    return SQLiteItineraryStore(ITINERARY_DB_PATH)
+
+def get_itinerary_store() -> ItineraryStore:
+    """Returns the configured store, opening it on first use."""
+    global _store
+    if _store is None:
+        _store = _build_store()
+    return _store
+
+async def close_itinerary_store() -> None:
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
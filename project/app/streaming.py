@@ -0,0 +1,184 @@
+import json
+import time
+import logging
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, List, Optional
+from .schemas import DayPlan, PlanRequest, ItineraryResponse
+from .services import stream_plan_from_llm, iter_plan_days_parallel, _item_fields
+from .config import PLAN_GENERATION_MODE, ROUTE_OPTIMIZE_AFTER_PLAN
+from .plan_cache import plan_cache
+from .versions import remember_version
+from .gazetteer import poi_gazetteer
+from .route_optimizer import optimize_day
+from .prefetch import replacement_prefetcher
+
+logger = logging.getLogger(__name__)
+
+_ROOT_OPEN = "<itinerary"
+_ROOT_CLOSE = "</itinerary>"
+
+# --- Incremental XML Parsing ---
+
+class IncrementalItineraryParser:
+    """
+    Pull parser for streamed itinerary XML.
+
+    Chunks of LLM output are fed in as they arrive; each <day> is turned into a
+    DayPlan as soon as its closing tag has been seen. Anything before <itinerary>
+    (markdown fences, XML declarations) and after </itinerary> is ignored.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._pending = ""
+        self._started = False
+        self._root: Optional[ET.Element] = None
+        self.finished = False
+        self.city: Optional[str] = None
+        self.total_days: Optional[int] = None
+        self.days: List[DayPlan] = []
+
+    def feed(self, chunk: str) -> List[DayPlan]:
+        """Feeds a chunk of text and returns the days completed by it."""
+        if self.finished or not chunk:
+            return []
+        self._pending += chunk
+
+        if not self._started:
+            start = self._pending.find(_ROOT_OPEN)
+            if start == -1:
+                # Keep just enough text to detect a root tag split across chunks.
+                self._pending = self._pending[-(len(_ROOT_OPEN) - 1):]
+                return []
+            self._pending = self._pending[start:]
+            self._started = True
+
+        # Never feed the last few characters unless they complete the closing tag,
+        # so that trailing text after </itinerary> never reaches the XML parser.
+        end = self._pending.find(_ROOT_CLOSE)
+        if end != -1:
+            data, self._pending = self._pending[:end + len(_ROOT_CLOSE)], ""
+        else:
+            cut = len(self._pending) - (len(_ROOT_CLOSE) - 1)
+            if cut <= 0:
+                return []
+            data, self._pending = self._pending[:cut], self._pending[cut:]
+
+        try:
+            self._parser.feed(data)
+            return self._read_events()
+        except (ET.ParseError, ValueError, TypeError) as e:
+            raise ValueError(f"Failed to parse streamed LLM XML output: {e}")
+
+    def _read_events(self) -> List[DayPlan]:
+        completed = []
+        for event, elem in self._parser.read_events():
+            if event == "start" and elem.tag == "itinerary":
+                self._root = elem
+                self.city = elem.attrib.get("city")
+                self.total_days = int(elem.attrib.get("total_days"))
+            elif event == "end" and elem.tag == "day":
+                day_plan = DayPlan(
+                    day=int(elem.attrib.get("number")),
+                    activities=[_item_fields(item) for item in elem.findall("item")],
+                )
+                completed.append(day_plan)
+                # Drop the finished subtree so memory stays flat for long trips.
+                if self._root is not None:
+                    self._root.remove(elem)
+            elif event == "end" and elem.tag == "itinerary":
+                self.finished = True
+        self.days.extend(completed)
+        return completed
+
+    def close(self) -> None:
+        """Checks that a complete <itinerary> document was received."""
+        if not self.finished:
+            raise ValueError(
+                f"LLM XML output ended before </itinerary> (received {len(self.days)} complete day(s))."
+            )
+
+
+# --- NDJSON Event Stream ---
+
+def _event(event: str, data: dict) -> str:
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+async def _iter_streamed_days(request: PlanRequest, parser: IncrementalItineraryParser) -> AsyncIterator[DayPlan]:
+    async for chunk in stream_plan_from_llm(request):
+        for day_plan in parser.feed(chunk):
+            yield day_plan
+    parser.close()
+
+async def stream_plan_events(request: PlanRequest, mode: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streams a plan as NDJSON lines: one "day" event per completed day, then a
+    "summary" event. In single mode days come from the incremental parser over
+    the streamed completion; in parallel mode they come from the per-day fan-out.
+    Failures after the response has started are reported as an "error" event,
+    since the HTTP status can no longer change.
+    """
+    started = time.perf_counter()
+    cached = await plan_cache.get(request)
+    if cached is not None:
+        logger.info(f"Streaming itinerary for {request.city} from plan cache.")
+        cached = remember_version(cached)
+        replacement_prefetcher.schedule(request, cached)
+        for day_plan in cached.itinerary:
+            yield _event("day", day_plan.model_dump())
+        yield _event("summary", {
+            "version_id": cached.version_id,
+            "city": cached.city,
+            "total_days": cached.total_days,
+            "days_generated": len(cached.itinerary),
+            "cached": True,
+            "elapsed_seconds": time.perf_counter() - started,
+        })
+        return
+
+    if (mode or PLAN_GENERATION_MODE) == "parallel":
+        parser = None
+        days_source = iter_plan_days_parallel(request)
+    else:
+        parser = IncrementalItineraryParser()
+        days_source = _iter_streamed_days(request, parser)
+
+    days: List[DayPlan] = []
+    first_day_at = None
+    try:
+        async for day_plan in days_source:
+            if first_day_at is None:
+                first_day_at = time.perf_counter() - started
+                logger.info(f"First streamed day ready after {first_day_at:.2f}s")
+            day_plan = poi_gazetteer.check_day(request.city, day_plan)
+            if ROUTE_OPTIMIZE_AFTER_PLAN:
+                day_plan = optimize_day(day_plan)[0]
+            days.append(day_plan)
+            yield _event("day", day_plan.model_dump())
+        if parser is not None:
+            itinerary = ItineraryResponse(city=parser.city, total_days=parser.total_days, itinerary=days)
+        else:
+            days.sort(key=lambda day_plan: day_plan.day)
+            itinerary = ItineraryResponse(city=request.city, total_days=request.days, itinerary=days)
+        await poi_gazetteer.ingest_itinerary(itinerary)
+        await plan_cache.set(request, itinerary)
+        version_id = remember_version(itinerary).version_id
+        replacement_prefetcher.schedule(request, itinerary)
+    except ValueError as e:
+        logger.error(f"ValueError during streamed plan generation: {e}")
+        yield _event("error", {"detail": f"LLM response parsing error: {e}"})
+        return
+    except Exception as e:
+        logger.error(f"Unexpected error during streamed plan generation: {e}", exc_info=True)
+        yield _event("error", {"detail": f"An unexpected error occurred: {e}"})
+        return
+
+    yield _event("summary", {
+        "version_id": version_id,
+        "city": itinerary.city,
+        "total_days": itinerary.total_days,
+        "days_generated": len(days),
+        "cached": False,
+        "first_day_seconds": first_day_at,
+        "elapsed_seconds": time.perf_counter() - started,
+    })
@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from .metrics import STAGE_SECONDS
+
+# --- Per-Request Stage Timing ---
+# The middleware in main.py installs a fresh dict per request; code anywhere in
+# the request's call tree adds to it with `with stage("llm"): ...`. Durations of
+# a stage entered several times (e.g. concurrent per-day LLM calls) are summed in
+# the dict, while every occurrence is observed in the stage histogram.
+
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+_endpoint: ContextVar[str] = ContextVar("endpoint", default="background")
+
+def start_request_timing(endpoint: str = "background") -> Dict[str, float]:
+    """Starts collecting stage timings for the current request and returns the dict."""
+    timings: Dict[str, float] = {}
+    _stage_timings.set(timings)
+    _endpoint.set(endpoint)
+    return timings
+
+def current_endpoint() -> str:
+    """Route path of the request being served, or "background" outside requests."""
+    return _endpoint.get()
+
+def record_stage(name: str, seconds: float) -> None:
+    """Adds a duration to the current request's stage timings and the stage histogram."""
+    STAGE_SECONDS.observe(seconds, endpoint=_endpoint.get(), stage=name)
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the enclosed block as the named stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Formats timings as a Server-Timing header value (durations in ms)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
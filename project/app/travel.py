@@ -0,0 +1,152 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from .schemas import ItineraryResponse, ItineraryItem, DayPlan
+from .config import (
+    TRAVEL_DETOUR_FACTOR, TRAVEL_WALK_MAX_KM, TRAVEL_MOTORIZED_MODE,
+    TRAVEL_WALK_SPEED_KMH, TRAVEL_TRANSIT_SPEED_KMH, TRAVEL_TRANSIT_OVERHEAD_MIN,
+    TRAVEL_TAXI_SPEED_KMH, TRAVEL_TAXI_OVERHEAD_MIN
+)
+
+EARTH_RADIUS_KM = 6371.0088
+
+# --- Speed Profiles ---
+
+@dataclass(frozen=True)
+class SpeedProfile:
+    name: str
+    label: str  # Prefix used in travel_from_previous, e.g. "步行约10分钟"
+    speed_kmh: float
+    overhead_minutes: float = 0.0
+
+    def minutes_for(self, distance_km: float) -> float:
+        return self.overhead_minutes + distance_km / self.speed_kmh * 60.0
+
+SPEED_PROFILES: Dict[str, SpeedProfile] = {
+    "walking": SpeedProfile("walking", "步行", TRAVEL_WALK_SPEED_KMH),
+    "transit": SpeedProfile("transit", "公共交通", TRAVEL_TRANSIT_SPEED_KMH, TRAVEL_TRANSIT_OVERHEAD_MIN),
+    "taxi": SpeedProfile("taxi", "车程", TRAVEL_TAXI_SPEED_KMH, TRAVEL_TAXI_OVERHEAD_MIN),
+}
+
+# --- Distance Computation ---
+
+def haversine_km_batch(
+    lats1: Sequence[float], lons1: Sequence[float], lats2: Sequence[float], lons2: Sequence[float]
+) -> List[float]:
+    """Great-circle distances in km between paired coordinate arrays, computed in one pass."""
+    radians = math.radians
+    sin, cos, asin, sqrt = math.sin, math.cos, math.asin, math.sqrt
+    distances = []
+    for lat1, lon1, lat2, lon2 in zip(lats1, lons1, lats2, lons2):
+        phi1, phi2 = radians(lat1), radians(lat2)
+        a = sin((phi2 - phi1) / 2) ** 2 + cos(phi1) * cos(phi2) * sin(radians(lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a))))
+    return distances
+
+def has_coordinates(item: ItineraryItem) -> bool:
+    """Items parsed without coordinates fall back to (0.0, 0.0)."""
+    return not (item.lat == 0.0 and item.lon == 0.0)
+
+def leg_distances_km(
+    activities: Sequence[ItineraryItem], legs: Optional[Iterable[int]] = None
+) -> Dict[int, Optional[float]]:
+    """
+    Road-adjusted distance of the legs of a day, keyed by leg index (leg i is the
+    leg into activities[i]). Only the requested legs are computed; by default all
+    of them. Legs touching an item without coordinates map to None.
+    """
+    indices = sorted(i for i in (range(1, len(activities)) if legs is None else legs)
+                     if 0 < i < len(activities))
+    if not indices:
+        return {}
+    starts = [activities[i - 1] for i in indices]
+    ends = [activities[i] for i in indices]
+    straight = haversine_km_batch(
+        [a.lat for a in starts], [a.lon for a in starts], [b.lat for b in ends], [b.lon for b in ends]
+    )
+    return {
+        i: distance * TRAVEL_DETOUR_FACTOR if has_coordinates(a) and has_coordinates(b) else None
+        for i, a, b, distance in zip(indices, starts, ends, straight)
+    }
+
+# --- Travel Estimation ---
+
+def estimate_leg(distance_km: float) -> Tuple[SpeedProfile, float]:
+    """Picks a speed profile for a leg and returns it with the estimated minutes."""
+    if distance_km <= TRAVEL_WALK_MAX_KM:
+        profile = SPEED_PROFILES["walking"]
+    else:
+        profile = SPEED_PROFILES.get(TRAVEL_MOTORIZED_MODE, SPEED_PROFILES["taxi"])
+    return profile, profile.minutes_for(distance_km)
+
+def format_travel(profile: SpeedProfile, minutes: float) -> str:
+    """Formats an estimate the way the prompts ask the LLM to, e.g. "车程约15分钟"."""
+    minutes = max(1, int(round(minutes / 5.0) * 5) if minutes >= 10 else int(round(minutes)))
+    if minutes < 60:
+        return f"{profile.label}约{minutes}分钟"
+    hours, rest = divmod(minutes, 60)
+    return f"{profile.label}约{hours}小时{rest}分钟" if rest else f"{profile.label}约{hours}小时"
+
+def compute_day_travel(activities: Sequence[ItineraryItem], legs: Optional[Iterable[int]] = None) -> List[str]:
+    """
+    Returns the travel_from_previous text for every activity of a day. When `legs`
+    is given, only those legs are recomputed and the rest keep their current text.
+    """
+    texts = [a.travel_from_previous for a in activities]
+    if activities and (legs is None or 0 in legs):
+        texts[0] = "N/A"
+    for i, distance in leg_distances_km(activities, legs).items():
+        # Without coordinates we cannot do better than the existing estimate.
+        if distance is not None:
+            texts[i] = format_travel(*estimate_leg(distance))
+    return texts
+
+def _with_travel_texts(day_plan: DayPlan, texts: List[str]) -> DayPlan:
+    return DayPlan(
+        day=day_plan.day,
+        activities=[
+            a if a.travel_from_previous == text else a.model_copy(update={"travel_from_previous": text})
+            for a, text in zip(day_plan.activities, texts)
+        ],
+    )
+
+def recalculate_travel_times_locally(
+    plan: ItineraryResponse, changed: Optional[Dict[int, Set[int]]] = None
+) -> ItineraryResponse:
+    """
+    Recomputes travel_from_previous from item coordinates, without an LLM call.
+    `changed` (from versions.diff_itinerary) limits the work to the listed legs of
+    the listed days; None recomputes everything. Item ids and all other fields are
+    left untouched.
+    """
+    itinerary = []
+    for day_plan in plan.itinerary:
+        if changed is not None and day_plan.day not in changed:
+            itinerary.append(day_plan)
+            continue
+        legs = None if changed is None else changed[day_plan.day]
+        itinerary.append(_with_travel_texts(day_plan, compute_day_travel(day_plan.activities, legs)))
+    return plan.model_copy(update={"itinerary": itinerary})
+
+def merge_travel_times(
+    plan: ItineraryResponse, recalculated: ItineraryResponse, changed: Optional[Dict[int, Set[int]]] = None
+) -> ItineraryResponse:
+    """
+    Copies travel_from_previous from a recalculated itinerary (e.g. parsed from
+    the LLM) onto `plan` by day number and position, only for the changed legs.
+    Everything else in `plan`, including item ids, is kept.
+    """
+    recalculated_days = {day_plan.day: day_plan.activities for day_plan in recalculated.itinerary}
+    itinerary = []
+    for day_plan in plan.itinerary:
+        new_activities = recalculated_days.get(day_plan.day)
+        if new_activities is None or (changed is not None and day_plan.day not in changed):
+            itinerary.append(day_plan)
+            continue
+        legs = range(len(day_plan.activities)) if changed is None else changed[day_plan.day]
+        texts = [a.travel_from_previous for a in day_plan.activities]
+        for i in legs:
+            if i < len(new_activities):
+                texts[i] = "N/A" if i == 0 else new_activities[i].travel_from_previous
+        itinerary.append(_with_travel_texts(day_plan, texts))
+    return plan.model_copy(update={"itinerary": itinerary})
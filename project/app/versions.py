@@ -0,0 +1,58 @@
+import uuid
+from typing import Dict, Optional, Set
+from .schemas import ItineraryResponse, ItineraryItem
+from .cache import TTLCache
+from .config import ITINERARY_VERSION_MAX_ENTRIES, ITINERARY_VERSION_TTL_SECONDS
+
+# --- Version Snapshots ---
+# Every itinerary returned to a client is remembered under a fresh version_id.
+# When the client sends an edited itinerary back, the snapshot it was based on
+# tells us which legs actually changed.
+
+_versions = TTLCache(ITINERARY_VERSION_MAX_ENTRIES, ITINERARY_VERSION_TTL_SECONDS)
+
+def remember_version(plan: ItineraryResponse) -> ItineraryResponse:
+    """Stores a snapshot of the itinerary and returns it tagged with a new version_id."""
+    versioned = plan.model_copy(update={"version_id": str(uuid.uuid4())})
+    _versions.set(versioned.version_id, versioned)
+    return versioned
+
+def get_version(version_id: Optional[str]) -> Optional[ItineraryResponse]:
+    """Returns the snapshot for a version_id, or None if unknown or expired."""
+    if not version_id:
+        return None
+    return _versions.get(version_id)
+
+def version_stats() -> Dict[str, int]:
+    return _versions.stats()
+
+# --- Diffing ---
+
+def _leg_signature(previous: ItineraryItem, current: ItineraryItem) -> tuple:
+    return (previous.id, previous.lat, previous.lon, current.id, current.lat, current.lon)
+
+def diff_itinerary(previous: ItineraryResponse, current: ItineraryResponse) -> Dict[int, Set[int]]:
+    """
+    Compares two versions by ItineraryItem.id and returns, per day number, the
+    indices of legs in `current` whose endpoints changed (index i is the leg into
+    activity i; index 0 means the day's first item changed). Days without changes
+    are omitted.
+    """
+    previous_days = {day_plan.day: day_plan.activities for day_plan in previous.itinerary}
+    changed: Dict[int, Set[int]] = {}
+    for day_plan in current.itinerary:
+        activities = day_plan.activities
+        old = previous_days.get(day_plan.day)
+        if old is None:
+            legs = set(range(len(activities)))
+        else:
+            old_legs = {_leg_signature(a, b) for a, b in zip(old, old[1:])}
+            legs = {
+                i for i in range(1, len(activities))
+                if _leg_signature(activities[i - 1], activities[i]) not in old_legs
+            }
+            if activities and (not old or old[0].id != activities[0].id):
+                legs.add(0)
+        if legs:
+            changed[day_plan.day] = legs
+    return changed
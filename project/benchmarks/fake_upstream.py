@@ -0,0 +1,231 @@
+"""
+Local stand-in for the OpenAI chat-completions API and the AMap geocode/weather
+endpoints, so the service can be load-tested without spending real quota.
+
+    python -m benchmarks.fake_upstream --port 9000 --latency 0.8 --chunk-delay 0.01
+
+Point the service at it with OPENAI_BASE_URL=http://127.0.0.1:9000/v1 and
+AMAP_BASE_URL=http://127.0.0.1:9000 (any non-empty API keys will do).
+"""
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import AsyncIterator, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from . import fixtures
+
+app = FastAPI(title="Fake LLM / AMap upstream")
+
+# Overridden from the command line in main().
+app.state.latency = 0.5         # Seconds before the first token.
+app.state.chunk_chars = 40      # Characters per streamed chunk.
+app.state.chunk_delay = 0.005   # Seconds between streamed chunks.
+app.state.amap_latency = 0.05
+app.state.error_rate = 0.0      # Fraction of completions answered with 429.
+app.state.truncate_rate = 0.0   # Fraction of whole-plan completions cut short (finish_reason "length").
+app.state.stall_rate = 0.0      # Fraction of completions whose first token is delayed by stall_seconds.
+app.state.stall_seconds = 5.0
+app.state.items_per_day = 4
+
+# --- Canned Completions ---
+
+def _int(pattern: str, text: str, default: int) -> int:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+def _city(text: str) -> str:
+    match = re.search(r"City: (\S+)", text)
+    return match.group(1) if match else "杭州"
+
+def completion_for(prompt: str) -> str:
+    """Picks a canned answer of the shape the prompt asks for."""
+    if "JSON OUTPUT REQUIREMENTS" in prompt:
+        if "Now, generate the JSON for day" in prompt:
+            day = _int(r"Now, generate the JSON for day (\d+)", prompt, 1)
+            return fixtures.day_compact_json(day, app.state.items_per_day)
+        return fixtures.itinerary_compact_json(
+            _city(prompt), _int(r"Duration: (\d+) days", prompt, 1), app.state.items_per_day
+        )
+    if "starting with `<skeleton>`" in prompt:
+        return fixtures.skeleton_xml(_city(prompt), _int(r"Duration: (\d+) days", prompt, 1))
+    if "Now, generate the XML for day" in prompt:
+        day = _int(r"Now, generate the XML for day (\d+)", prompt, 1)
+        return fixtures.day_xml(day, app.state.items_per_day)
+    if "`<items>` block" in prompt:
+        refs = re.findall(r"^\[([^\]]+)\] Day \d+ - ", prompt, re.MULTILINE)
+        return fixtures.batch_items_xml(refs)
+    if "Itinerary Details:" in prompt:
+        # Recalculation: echo the itinerary back unchanged.
+        match = re.search(r"Itinerary Details:\s*(<itinerary.*?</itinerary>)", prompt, re.DOTALL)
+        if match:
+            return match.group(1)
+    if "`<item>` block" in prompt:
+        return fixtures.single_item_xml("体验" if "indoor" in prompt else "景点")
+    return fixtures.itinerary_xml(
+        _city(prompt), _int(r"Duration: (\d+) days", prompt, 1), app.state.items_per_day
+    )
+
+# System messages seen before count as served from the prefix cache, in blocks
+# of 128 tokens as OpenAI reports them.
+_seen_prefixes = set()
+
+def _usage(messages: List[dict], prompt: str, content: str) -> dict:
+    # Rough CJK-heavy estimate; only used to make usage numbers non-zero.
+    prompt_tokens, completion_tokens = len(prompt) // 2, len(content) // 2
+    cached_tokens = 0
+    if messages and messages[0].get("role") == "system":
+        system = str(messages[0].get("content", ""))
+        if system in _seen_prefixes:
+            cached_tokens = len(system) // 2 // 128 * 128
+        _seen_prefixes.add(system)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+    }
+    if usage is not None:
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _truncate(content: str) -> str:
+    """Cuts a whole-plan completion about 60% of the way through, as a max_tokens stop would."""
+    return content[:int(len(content) * 0.6)]
+
+async def _stream(
+    usage: dict, content: str, model: str, include_usage: bool, finish_reason: str = "stop"
+) -> AsyncIterator[str]:
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+    size = max(1, app.state.chunk_chars)
+    for start in range(0, len(content), size):
+        if app.state.chunk_delay:
+            await asyncio.sleep(app.state.chunk_delay)
+        yield _chunk(completion_id, model, {"content": content[start:start + size]})
+    yield _chunk(completion_id, model, {}, finish_reason=finish_reason)
+    if include_usage:
+        yield _chunk(completion_id, model, {}, usage=usage)
+    yield "data: [DONE]\n\n"
+
+# --- Chat Completions ---
+
+@app.get("/v1/models")
+async def list_models():
+    # Used by the service's endpoint health checks.
+    return {"object": "list", "data": [{"id": "fake-model", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages: List[dict] = body.get("messages", [])
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    model = body.get("model") or "fake-model"
+
+    await asyncio.sleep(app.state.latency)
+    if app.state.stall_rate and random.random() < app.state.stall_rate:
+        await asyncio.sleep(app.state.stall_seconds)
+    if app.state.error_rate and random.random() < app.state.error_rate:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after-ms": "200"},
+            content={"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_error"}},
+        )
+
+    content = completion_for(prompt)
+    finish_reason = "stop"
+    # Recalculation echoes an <itinerary> too; only plan completions are truncated.
+    is_whole_plan = content.startswith(("<itinerary", '{"c"')) and "Itinerary Details:" not in prompt
+    if is_whole_plan and app.state.truncate_rate and random.random() < app.state.truncate_rate:
+        content, finish_reason = _truncate(content), "length"
+    usage = _usage(messages, prompt, content)
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            _stream(usage, content, model, include_usage, finish_reason), media_type="text/event-stream"
+        )
+    # Non-streamed answers take as long as the stream would have.
+    await asyncio.sleep(app.state.chunk_delay * (len(content) // max(1, app.state.chunk_chars)))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": finish_reason,
+        }],
+        "usage": usage,
+    }
+
+# --- AMap ---
+
+@app.get("/v3/geocode/geo")
+async def amap_geocode(address: str = "", key: str = ""):
+    await asyncio.sleep(app.state.amap_latency)
+    return {"status": "1", "info": "OK", "geocodes": [{"adcode": "330100", "city": address}]}
+
+@app.get("/v3/weather/weatherInfo")
+async def amap_weather(city: str = "", key: str = "", extensions: str = "base"):
+    await asyncio.sleep(app.state.amap_latency)
+    return {
+        "status": "1",
+        "info": "OK",
+        "lives": [{
+            "adcode": city, "city": "杭州市", "weather": "小雨", "temperature": "18",
+            "humidity": "80", "windpower": "≤3",
+        }],
+    }
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=app.state.latency, help="seconds before the first token")
+    parser.add_argument("--chunk-chars", type=int, default=app.state.chunk_chars)
+    parser.add_argument("--chunk-delay", type=float, default=app.state.chunk_delay, help="seconds between stream chunks")
+    parser.add_argument("--amap-latency", type=float, default=app.state.amap_latency)
+    parser.add_argument("--error-rate", type=float, default=app.state.error_rate, help="fraction of 429 responses")
+    parser.add_argument(
+        "--truncate-rate", type=float, default=app.state.truncate_rate,
+        help="fraction of whole-plan completions cut short as if by max_tokens",
+    )
+    parser.add_argument(
+        "--stall-rate", type=float, default=app.state.stall_rate,
+        help="fraction of completions whose first token is delayed by --stall-seconds",
+    )
+    parser.add_argument("--stall-seconds", type=float, default=app.state.stall_seconds)
+    parser.add_argument("--items-per-day", type=int, default=app.state.items_per_day)
+    args = parser.parse_args()
+
+    app.state.latency = args.latency
+    app.state.chunk_chars = args.chunk_chars
+    app.state.chunk_delay = args.chunk_delay
+    app.state.amap_latency = args.amap_latency
+    app.state.error_rate = args.error_rate
+    app.state.truncate_rate = args.truncate_rate
+    app.state.stall_rate = args.stall_rate
+    app.state.stall_seconds = args.stall_seconds
+    app.state.items_per_day = args.items_per_day
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import json
+import itertools
+from typing import Dict, List
+from xml.sax.saxutils import escape
+
+# --- Canned LLM Output ---
+# Deterministic documents in the formats the prompts in app/prompt_template.py
+# ask for. POI names carry a running counter so replacements never collide with
+# the plan they replace (batch regeneration rejects duplicates).
+
+_SLOTS = [
+    ("景点", "上午 (09:00-11:30)"),
+    ("美食", "中午 (12:00-13:30)"),
+    ("景点", "下午 (14:00-17:00)"),
+    ("美食", "晚上 (18:00-19:30)"),
+]
+
+_counter = itertools.count(1)
+
+_XML_FIELDS = [
+    "category", "time", "poi_name", "description", "lat", "lon", "travel_from_previous",
+    "opening_hours", "booking_info", "price", "local_tip",
+]
+# Same order as _XML_FIELDS; the keys of the compact JSON format (OUTPUT_FORMAT=json).
+_COMPACT_KEYS = ["k", "t", "p", "ds", "la", "lo", "tr", "oh", "bk", "pr", "tip"]
+
+def item_values(category: str, time: str, index: int, first: bool = False) -> list:
+    """Field values of one canned item, in _XML_FIELDS order."""
+    n = next(_counter)
+    return [
+        category,
+        time,
+        f"基准测试地点{n}",
+        "用于离线基准测试的示例活动，内容固定、长度与真实输出接近，便于稳定比较解析与渲染开销。",
+        round(30.20 + (index % 10) * 0.01, 4),
+        round(120.10 + (index % 7) * 0.01, 4),
+        "N/A" if first else "车程约15分钟",
+        "09:00-21:00",
+        "无需预订",
+        "人均 ¥80-120" if category == "美食" else "门票: ¥50",
+        "工作日人少，建议错峰前往。",
+    ]
+
+def _day_values(day: int, items_per_day: int) -> list:
+    return [
+        item_values(*_SLOTS[i % len(_SLOTS)], index=day * 10 + i, first=(i == 0))
+        for i in range(items_per_day)
+    ]
+
+# --- XML Format ---
+
+def _item_xml(values: list, ref: str = "") -> str:
+    ref_attr = f' ref="{escape(ref)}"' if ref else ""
+    children = "".join(
+        f"<{name}>{value:.4f}</{name}>" if isinstance(value, float) else f"<{name}>{escape(value)}</{name}>"
+        for name, value in zip(_XML_FIELDS, values)
+    )
+    return f"<item{ref_attr}>{children}</item>"
+
+def item_xml(category: str, time: str, index: int, first: bool = False, ref: str = "") -> str:
+    """One `<item>` block shaped like the example in PROMPT_TEMPLATE."""
+    return _item_xml(item_values(category, time, index, first), ref)
+
+def day_xml(day: int, items_per_day: int = len(_SLOTS)) -> str:
+    items = "".join(_item_xml(values) for values in _day_values(day, items_per_day))
+    return f'<day number="{day}">{items}</day>'
+
+def itinerary_xml(city: str, days: int, items_per_day: int = len(_SLOTS)) -> str:
+    body = "".join(day_xml(day, items_per_day) for day in range(1, days + 1))
+    return f'<itinerary city="{escape(city)}" total_days="{days}">{body}</itinerary>'
+
+def skeleton_xml(city: str, days: int) -> str:
+    body = "".join(
+        f'<day number="{day}"><area>区域{day}</area><poi>骨架景点{day}-1</poi><poi>骨架景点{day}-2</poi></day>'
+        for day in range(1, days + 1)
+    )
+    return f'<skeleton city="{escape(city)}" total_days="{days}">{body}</skeleton>'
+
+def single_item_xml(category: str = "景点") -> str:
+    return item_xml(category, "下午 (14:00-17:00)", index=0)
+
+def batch_items_xml(refs: List[str]) -> str:
+    return "<items>" + "".join(
+        item_xml("景点", "下午 (14:00-17:00)", index=i, ref=ref) for i, ref in enumerate(refs)
+    ) + "</items>"
+
+# --- Compact JSON Format ---
+
+def _compact_day(day: int, items_per_day: int) -> dict:
+    return {"n": day, "i": [dict(zip(_COMPACT_KEYS, values)) for values in _day_values(day, items_per_day)]}
+
+def _dumps(value: dict) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def day_compact_json(day: int, items_per_day: int = len(_SLOTS)) -> str:
+    return _dumps(_compact_day(day, items_per_day))
+
+def itinerary_compact_json(city: str, days: int, items_per_day: int = len(_SLOTS)) -> str:
+    return _dumps({
+        "c": city, "td": days, "d": [_compact_day(day, items_per_day) for day in range(1, days + 1)],
+    })
+
+# --- Request Payloads ---
+
+def plan_request(city: str = "杭州", days: int = 3) -> Dict:
+    return {
+        "city": city,
+        "days": days,
+        "interests": ["历史", "美食"],
+        "travel_style": "普通",
+        "must_visit_pois": [],
+        "budget": "标准",
+        "food_preferences": {"price_range": "中等", "cuisine_types": ["本帮菜"], "dietary_restrictions": ""},
+    }
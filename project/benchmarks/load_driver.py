@@ -0,0 +1,282 @@
+"""
+Load driver for the core endpoints of app/main.py. Reports latency
+percentiles, throughput, the per-stage breakdown the service returns in its
+Server-Timing header, and LLM tokens per request (from /metrics). Run it once
+per OUTPUT_FORMAT to compare tokens per plan.
+
+    python -m benchmarks.load_driver --target http://127.0.0.1:8000 --concurrency 16 --requests 200
+"""
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+import httpx
+from . import fixtures
+
+ENDPOINTS = [
+    "plan", "regenerate-activity", "save-itinerary", "update-itinerary", "weather-contingency",
+    "weather-contingency-itinerary", "optimize-route", "plan-job",
+]
+
+# --- Result Collection ---
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Parses 'llm;dur=812.4, parse;dur=3.1' into {'llm': 812.4, 'parse': 3.1} (ms)."""
+    timings = {}
+    for metric in filter(None, (part.strip() for part in header.split(","))):
+        name, _, params = metric.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    timings[name.strip()] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+def token_totals(metrics_text: str) -> Dict[tuple, float]:
+    """Sums travel_llm_tokens_total from a /metrics scrape by (endpoint, kind)."""
+    totals: Dict[tuple, float] = defaultdict(float)
+    for line in metrics_text.splitlines():
+        if not line.startswith("travel_llm_tokens_total{"):
+            continue
+        labels, _, value = line.rpartition(" ")
+        endpoint = labels.split('endpoint="', 1)[1].split('"', 1)[0]
+        kind = labels.split('kind="', 1)[1].split('"', 1)[0]
+        totals[(endpoint, kind)] += float(value)
+    return totals
+
+class EndpointResult:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.elapsed = 0.0
+        self.tokens: Dict[str, float] = {}  # kind -> tokens used by this run
+
+    def record(self, seconds: float, response: Optional[httpx.Response], error: Optional[str] = None) -> None:
+        if response is not None and response.status_code < 400:
+            self.latencies.append(seconds)
+            for stage, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                self.stages[stage].append(ms)
+        else:
+            self.errors[error or str(response.status_code)] += 1
+
+    def summary(self) -> Dict:
+        latencies = sorted(self.latencies)
+        return {
+            "endpoint": self.name,
+            "ok": len(latencies),
+            "errors": dict(self.errors),
+            "throughput_rps": len(latencies) / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "prompt_tokens_per_request": self.tokens.get("prompt", 0.0) / len(latencies) if latencies else 0.0,
+            "completion_tokens_per_request": (
+                self.tokens.get("completion", 0.0) / len(latencies) if latencies else 0.0
+            ),
+            "cached_prompt_tokens_per_request": (
+                self.tokens.get("cached_prompt", 0.0) / len(latencies) if latencies else 0.0
+            ),
+            "stages_mean_ms": {
+                stage: sum(values) / len(values) for stage, values in sorted(self.stages.items())
+            },
+        }
+
+# --- Request Builders ---
+# Each builder returns (method, path, params, json) for the i-th request. By
+# default requests are made unique so the plan cache and LLM request coalescing
+# do not turn the run into a cache benchmark.
+
+_RUN_ID = uuid.uuid4().hex[:8]
+
+def _interests(i: int, unique: bool, group: str = "") -> List[str]:
+    # `group` keeps endpoints that share a request body (plan, plan-job) from hitting each other's cache.
+    return ["历史", "美食"] + ([f"bench-{_RUN_ID}-{group}{i}"] if unique else [])
+
+def build_requests(plan: Dict, args: argparse.Namespace) -> Dict[str, Callable[[int], tuple]]:
+    unique = not args.allow_cache
+    day_plan = plan["itinerary"][0]
+    activity = day_plan["activities"][-1]
+    food = {"price_range": "中等", "cuisine_types": ["本帮菜"], "dietary_restrictions": ""}
+
+    def plan_request(i: int) -> tuple:
+        body = fixtures.plan_request(args.city, args.days)
+        body["interests"] = _interests(i, unique)
+        return "POST", "/api/plan", {"mode": args.mode} if args.mode else {}, body
+
+    def plan_job_request(i: int) -> tuple:
+        method, _, params, body = plan_request(i)
+        body["interests"] = _interests(i, unique, group="job-")
+        return method, "/api/plan/jobs", params, body
+
+    def regenerate_request(i: int) -> tuple:
+        body = {
+            "city": args.city, "day_plan": day_plan, "activity_to_replace": activity,
+            "interests": _interests(i, unique), "travel_style": "普通", "budget": "标准",
+            "food_preferences": food,
+        }
+        return "POST", "/api/regenerate-activity", {}, body
+
+    def save_request(i: int) -> tuple:
+        return "POST", "/api/save-itinerary", {}, plan
+
+    def update_request(i: int) -> tuple:
+        # Swap the last two activities of day 1 so there is something to recalculate.
+        edited = json.loads(json.dumps(plan))
+        activities = edited["itinerary"][0]["activities"]
+        if len(activities) >= 2:
+            activities[-1], activities[-2] = activities[-2], activities[-1]
+        if unique:
+            activities[0]["description"] += f" #{_RUN_ID}-{i}"
+        return "POST", "/api/update-itinerary", {"use_llm": "true"} if args.use_llm else {}, edited
+
+    def weather_request(i: int) -> tuple:
+        body = {"city": args.city, "interests": _interests(i, unique), "activity_to_replace": activity}
+        return "POST", "/api/weather-contingency", {}, body
+
+    def itinerary_weather_request(i: int) -> tuple:
+        body = {"itinerary": plan, "interests": _interests(i, unique)}
+        return "POST", "/api/weather-contingency/itinerary", {}, body
+
+    def optimize_request(i: int) -> tuple:
+        # Move the first activity of day 1 to the end so there is a detour to remove.
+        edited = json.loads(json.dumps(plan))
+        activities = edited["itinerary"][0]["activities"]
+        activities.append(activities.pop(0))
+        return "POST", "/api/optimize-route", {}, edited
+
+    return {
+        "plan": plan_request,
+        "regenerate-activity": regenerate_request,
+        "save-itinerary": save_request,
+        "update-itinerary": update_request,
+        "weather-contingency": weather_request,
+        "weather-contingency-itinerary": itinerary_weather_request,
+        "optimize-route": optimize_request,
+        "plan-job": plan_job_request,
+    }
+
+# --- Driver ---
+
+async def await_job(client: httpx.AsyncClient, submitted: httpx.Response) -> tuple:
+    """Long-polls a submitted plan job until it finishes; returns (final response, error)."""
+    job_id = submitted.json()["job_id"]
+    while True:
+        response = await client.get(f"/api/plan/jobs/{job_id}", params={"wait": 30})
+        if response.status_code >= 400:
+            return response, None
+        status = response.json()["status"]
+        if status == "succeeded":
+            return response, None
+        if status == "failed":
+            return None, "job_failed"
+
+async def run_endpoint(
+    client: httpx.AsyncClient, name: str, build: Callable[[int], tuple], requests: int, concurrency: int
+) -> EndpointResult:
+    result = EndpointResult(name)
+    indices = iter(range(requests))
+
+    async def worker() -> None:
+        for i in indices:
+            method, path, params, body = build(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body)
+                error = None
+                if path == "/api/plan/jobs" and response.status_code == 202:
+                    # Submit-to-result latency; stages are not reported for background work.
+                    response, error = await await_job(client, response)
+                result.record(time.perf_counter() - started, response, error)
+            except httpx.HTTPError as e:
+                result.record(time.perf_counter() - started, None, type(e).__name__)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+def print_summary(summary: Dict) -> None:
+    errors = ", ".join(f"{k}: {v}" for k, v in summary["errors"].items()) or "-"
+    print(
+        f"{summary['endpoint']:<22} ok={summary['ok']:<5} rps={summary['throughput_rps']:<8.1f}"
+        f" p50={summary['p50_ms']:<8.1f} p95={summary['p95_ms']:<8.1f} p99={summary['p99_ms']:<8.1f}"
+        f" errors={errors}"
+    )
+    if summary["completion_tokens_per_request"]:
+        print(
+            f"{'':<22} tokens/request: prompt={summary['prompt_tokens_per_request']:.0f}"
+            f" completion={summary['completion_tokens_per_request']:.0f}"
+            f" cached_prompt={summary['cached_prompt_tokens_per_request']:.0f}"
+        )
+    stages = "  ".join(f"{stage}={ms:.1f}ms" for stage, ms in summary["stages_mean_ms"].items())
+    if stages:
+        print(f"{'':<22} stages (mean): {stages}")
+
+async def scrape_tokens(client: httpx.AsyncClient) -> Dict[tuple, float]:
+    try:
+        response = await client.get("/metrics")
+        return token_totals(response.text) if response.status_code == 200 else {}
+    except httpx.HTTPError:
+        return {}
+
+async def main_async(args: argparse.Namespace) -> List[Dict]:
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.target, timeout=timeout, limits=limits) as client:
+        # One plan to feed the endpoints that edit an existing itinerary.
+        seed = await client.post("/api/plan", json=fixtures.plan_request(args.city, args.days))
+        seed.raise_for_status()
+        builders = build_requests(seed.json(), args)
+
+        summaries = []
+        for name in args.endpoints:
+            before = await scrape_tokens(client)
+            result = await run_endpoint(client, name, builders[name], args.requests, args.concurrency)
+            after = await scrape_tokens(client)
+            path = builders[name](0)[1]
+            result.tokens = {
+                kind: after.get((path, kind), 0.0) - before.get((path, kind), 0.0)
+                for kind in ("prompt", "completion", "cached_prompt")
+            }
+            summary = result.summary()
+            summaries.append(summary)
+            if not args.json:
+                print_summary(summary)
+        return summaries
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--city", default="杭州")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--mode", choices=["single", "parallel"], help="plan generation mode")
+    parser.add_argument("--use-llm", action="store_true", help="recalculate travel times with the LLM")
+    parser.add_argument("--allow-cache", action="store_true", help="send identical requests (measures cache hits)")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    summaries = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(summaries, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
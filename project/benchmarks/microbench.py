@@ -0,0 +1,101 @@
+"""
+Microbenchmarks for the parsing hot paths on 1/7/30-day documents:
+parse_xml_to_json against the previous find()-per-field parser with uuid4 ids
+(both including serialization of the response), _itinerary_response_to_xml_string,
+and parse_compact_json (OUTPUT_FORMAT=json) with the size of each output format.
+
+    python -m benchmarks.microbench --number 200
+"""
+import uuid
+import argparse
+import timeit
+import xml.etree.ElementTree as ET
+from app.schemas import ItineraryResponse
+from app.services import parse_xml_to_json, parse_compact_json, _itinerary_response_to_xml_string, _clean_xml_string
+from . import fixtures
+
+DAY_COUNTS = [1, 7, 30]
+
+def _token_counter():
+    """Counts tokens with tiktoken when it is installed; otherwise sizes are reported in characters only."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    encoding = tiktoken.get_encoding("o200k_base")
+    return lambda text: len(encoding.encode(text))
+
+def _legacy_item_fields(item_node: ET.Element) -> dict:
+    def get_text(element_name: str, default="N/A"):
+        element = item_node.find(element_name)
+        return element.text.strip() if element is not None and element.text else default
+
+    return dict(
+        id=str(uuid.uuid4()),
+        category=get_text("category", "景点"),
+        time=get_text("time"),
+        poi_name=get_text("poi_name"),
+        description=get_text("description"),
+        lat=float(get_text("lat", "0.0")),
+        lon=float(get_text("lon", "0.0")),
+        travel_from_previous=get_text("travel_from_previous"),
+        opening_hours=get_text("opening_hours"),
+        booking_info=get_text("booking_info"),
+        price=get_text("price"),
+        local_tip=get_text("local_tip"),
+    )
+
+def legacy_parse_xml_to_json(xml_string: str) -> dict:
+    """The previous parser, plus the response_model round trip FastAPI did before serializing."""
+    root = ET.fromstring(_clean_xml_string(xml_string))
+    plan = ItineraryResponse(
+        city=root.attrib.get("city"),
+        total_days=int(root.attrib.get("total_days")),
+        itinerary=[
+            {
+                "day": int(day_node.attrib.get("number")),
+                "activities": [_legacy_item_fields(item_node) for item_node in day_node.findall("item")],
+            }
+            for day_node in root.findall("day")
+        ],
+    )
+    return ItineraryResponse.model_validate(plan.model_dump()).model_dump_json()
+
+def bench(label: str, fn, number: int, repeat: int) -> None:
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    print(f"{label:<45} {best * 1e6:>10.1f} µs/op")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=100, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs (best is reported)")
+    parser.add_argument("--items-per-day", type=int, default=4)
+    args = parser.parse_args()
+
+    count_tokens = _token_counter()
+    for days in DAY_COUNTS:
+        xml_string = fixtures.itinerary_xml("杭州", days, args.items_per_day)
+        json_string = fixtures.itinerary_compact_json("杭州", days, args.items_per_day)
+        plan = parse_xml_to_json(xml_string)
+        print(f"# {days} day(s)")
+        for label, text in (("xml", xml_string), ("json", json_string)):
+            tokens = f", {count_tokens(text)} tokens" if count_tokens else ""
+            print(f"  {label} output: {len(text)} chars{tokens}")
+        bench(
+            f"previous parser + response_model[{days}d]",
+            lambda: legacy_parse_xml_to_json(xml_string), args.number, args.repeat,
+        )
+        bench(
+            f"parse_xml_to_json + model_dump_json[{days}d]",
+            lambda: parse_xml_to_json(xml_string).model_dump_json(), args.number, args.repeat,
+        )
+        bench(f"parse_xml_to_json[{days}d]", lambda: parse_xml_to_json(xml_string), args.number, args.repeat)
+        bench(
+            f"_itinerary_response_to_xml_string[{days}d]",
+            lambda: _itinerary_response_to_xml_string(plan), args.number, args.repeat,
+        )
+        bench(f"parse_compact_json[{days}d]", lambda: parse_compact_json(json_string), args.number, args.repeat)
+
+
+if __name__ == "__main__":
+    main()